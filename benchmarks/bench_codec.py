@@ -0,0 +1,100 @@
+"""
+比较生成的编解码函数与逐字段反射的 data2obj/obj2data。
+
+    python benchmarks/bench_codec.py [--number N]
+"""
+import argparse
+import os
+import sys
+import timeit
+from dataclasses import fields, make_dataclass, field as dataclass_field
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conf_root import ConfRoot, is_config_class  # noqa: E402
+from conf_root.utils import data2obj, obj2data, validate  # noqa: E402
+
+
+def reflective_data2obj(instance, data, custom=False):
+    # 生成编解码函数之前的实现，作为对照。
+    for field in fields(instance):
+        if (value := data.get(field.name, None)) is not None:
+            if (custom and 'deserialize' in field.metadata and
+                    (deserialize_func := field.metadata['deserialize']) is not None):
+                value = deserialize_func(value)
+            else:
+                cls = field.type
+                if is_config_class(cls) and isinstance(value, dict):
+                    sub_data = {field.name: value.get(field.name, None) for field in fields(cls)}
+                    sub_instance = cls(**sub_data)
+                    reflective_data2obj(instance=sub_instance, data=sub_data, custom=custom)
+                    value = sub_instance
+            validate(field, value)
+            setattr(instance, field.name, value)
+
+
+def reflective_obj2data(obj):
+    if is_config_class(obj):
+        res = {}
+        for field in fields(obj):
+            value = getattr(obj, field.name)
+            if 'serialize' in field.metadata and (serialize_func := field.metadata['serialize']) is not None:
+                res[field.name] = serialize_func(value)
+                continue
+            res[field.name] = reflective_obj2data(value)
+        return res
+    return obj
+
+
+def make_wide(width):
+    conf_root = ConfRoot(agent_class=None)
+    specs = []
+    for i in range(width):
+        if i % 4 == 0:
+            metadata = {'validators': [lambda x: x >= 0]}
+        elif i % 4 == 1:
+            metadata = {'serialize': str, 'deserialize': int}
+        else:
+            metadata = {}
+        specs.append((f'field_{i}', int, dataclass_field(default=i, metadata=metadata)))
+    return conf_root.config(make_dataclass(f'Wide{width}', specs))
+
+
+def make_deep(depth):
+    conf_root = ConfRoot(agent_class=None)
+    cls = conf_root.config(make_dataclass('Deep0', [('value', int, 0)]))
+    for level in range(1, depth):
+        child = cls
+        cls = conf_root.config(make_dataclass(f'Deep{level}', [
+            ('value', int, level),
+            ('name', str, f'level{level}'),
+            ('child', child, dataclass_field(default_factory=child)),
+        ]))
+    return cls
+
+
+def bench(name, cls, number):
+    instance = cls()
+    data = obj2data(instance)
+    assert data == reflective_obj2data(instance)
+    cases = [
+        ('obj2data', lambda: reflective_obj2data(instance), lambda: obj2data(instance)),
+        ('data2obj', lambda: reflective_data2obj(cls(), data, custom=True), lambda: data2obj(cls(), data, custom=True)),
+    ]
+    for op, reflective, generated in cases:
+        t_reflective = min(timeit.repeat(reflective, number=number, repeat=5)) / number
+        t_generated = min(timeit.repeat(generated, number=number, repeat=5)) / number
+        print(f'{name:<12} {op:<10} reflective {t_reflective * 1e6:10.1f} us   '
+              f'generated {t_generated * 1e6:10.1f} us   speedup {t_reflective / t_generated:5.2f}x')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='codec benchmark')
+    parser.add_argument('--number', type=int, default=200)
+    args = parser.parse_args()
+    bench('wide-200', make_wide(200), args.number)
+    bench('deep-50', make_deep(50), args.number)
+
+
+if __name__ == '__main__':
+    main()
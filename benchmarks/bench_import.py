@@ -0,0 +1,77 @@
+"""
+用 python -X importtime 测量 `import conf_root` 的耗时，并检查重量级依赖没有被提前导入。
+
+    python benchmarks/bench_import.py [--number N] [--top N] [--max-ms MS] [--json PATH]
+
+每次测量都在新的解释器中进行。指定 --max-ms 时，中位数超过该值则以非零状态退出，可用于发现回退。
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 只在使用相应功能时才应导入的模块
+HEAVY_MODULES = ['ruamel.yaml', 'wtforms', 'jinja2', 'http.server', 'asyncio', 'sqlite3',
+                 'multiprocessing.shared_memory', 'ctypes', 'argparse']
+
+
+def measure(statement='import conf_root'):
+    """
+    返回 {模块名: (自身耗时us, 累计耗时us)}。
+    """
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement], env=env, cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        timings[name.strip()] = (int(self_us), int(cumulative_us))
+    return timings
+
+
+def loaded_heavy_modules():
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    code = f'import sys, conf_root; print(",".join(m for m in {HEAVY_MODULES!r} if m in sys.modules))'
+    output = subprocess.run([sys.executable, '-c', code], env=env, cwd=ROOT, capture_output=True, text=True,
+                            check=True)
+    return [m for m in output.stdout.strip().split(',') if m]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='import time benchmark')
+    parser.add_argument('--number', type=int, default=10)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--max-ms', type=float, default=None)
+    parser.add_argument('--json', default=None, help='将结果写入JSON文件')
+    args = parser.parse_args()
+
+    runs = [measure() for _ in range(args.number)]
+    totals = [run['conf_root'][1] / 1000 for run in runs]
+    median = statistics.median(totals)
+    print(f'import conf_root: median {median:.1f} ms, min {min(totals):.1f} ms, max {max(totals):.1f} ms')
+
+    # 按自身耗时的中位数排序
+    names = set.intersection(*(set(run) for run in runs))
+    self_ms = {name: statistics.median(run[name][0] for run in runs) / 1000 for name in names}
+    print(f'top {args.top} modules by self time:')
+    for name, ms in sorted(self_ms.items(), key=lambda item: -item[1])[:args.top]:
+        print(f'  {ms:8.2f} ms  {name}')
+
+    heavy = loaded_heavy_modules()
+    print('heavy modules imported:', ', '.join(heavy) if heavy else 'none')
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'median_ms': median, 'runs_ms': totals, 'heavy_modules': heavy,
+                       'self_ms': self_ms}, f, indent=2)
+    if heavy or (args.max_ms is not None and median > args.max_ms):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
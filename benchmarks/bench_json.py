@@ -0,0 +1,70 @@
+"""
+通过 JsonAgent.load 比较各JSON后端的解析，配置中包含数MB的查找表。
+写入总是使用标准库，与后端无关，保存的耗时只测量一次。
+
+    python benchmarks/bench_json.py [--rows N] [--number N]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import timeit
+from dataclasses import field
+from typing import Dict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conf_root import ConfRoot, JsonAgent  # noqa: E402
+from conf_root.agents.JsonAgent import JSON_BACKENDS, get_json_backend  # noqa: E402
+
+
+def make_table(rows):
+    return {f'key-{i}': {'id': i, 'weight': i / 7, 'name': f'name-{i}', 'tags': ['a', 'b', str(i)]}
+            for i in range(rows)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='JSON backend benchmark')
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--number', type=int, default=5)
+    args = parser.parse_args()
+
+    table = make_table(args.rows)
+    with tempfile.TemporaryDirectory() as directory:
+        conf_root = ConfRoot(directory, agent_class=JsonAgent)
+        # 只测量解析与序列化，不使用解析缓存
+        conf_root.agent.cache = None
+        # 测量写入，内容未变时也要写文件
+        conf_root.agent.skip_unchanged = False
+
+        @conf_root.config('lookup')
+        class LookupConfig:
+            table: Dict = field(default_factory=dict)
+
+        configuration = LookupConfig.__CONF_ROOT__
+        agent = conf_root.agent
+        instance = LookupConfig()
+        instance.table = table
+        agent.save(configuration, instance)
+        size = os.path.getsize(agent.get_configuration_location(configuration))
+        print(f'file size: {size / 1e6:.1f} MB')
+
+        def save():
+            # 每次保存前修改一项，保证确实写入了文件
+            table['key-0']['id'] += 1
+            agent.save(configuration, instance)
+
+        t_save = min(timeit.repeat(save, number=args.number, repeat=3))
+        print(f'{"json":<10} save {t_save / args.number * 1e3:8.1f} ms   (used by every backend)')
+
+        for name in JSON_BACKENDS:
+            try:
+                agent.backend = get_json_backend(name)
+            except ImportError:
+                print(f'{name:<10} not installed')
+                continue
+            t_load = min(timeit.repeat(lambda: agent.load(configuration, instance), number=args.number, repeat=3))
+            print(f'{name:<10} load {t_load / args.number * 1e3:8.1f} ms')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,367 @@
+"""
+基准测试套件：测量配置类的装饰、实例化、各 agent 的读写、编解码与 from_argparse，
+按字段数、嵌套深度、单文件中的配置数参数化。结果保存为JSON，可在不同提交之间比较。
+
+    python benchmarks/run.py [--quick] [--filter REGEX] [--output FILE]
+    python benchmarks/run.py --compare OLD.json [NEW.json] [--threshold 1.1]
+
+只给出一个结果文件时，先在当前代码上运行，再与之比较。有变慢的测试时以状态码1退出。
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from dataclasses import field as dataclass_field
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from conf_root import ConfRoot, YamlAgent, SingleFileYamlAgent  # noqa: E402
+from conf_root.agents.JsonAgent import JsonAgent  # noqa: E402
+from conf_root.utils import data2obj, obj2data  # noqa: E402
+
+FIELDS = (10, 100)
+DEPTHS = (1, 4)
+CONFIGS = (1, 16, 128)
+AGENTS = {'yaml': YamlAgent, 'json': JsonAgent, 'single': SingleFileYamlAgent}
+# 字段类型与默认值依次循环
+SCALARS = ((int, 1), (str, 'value'), (float, 0.5), (bool, True))
+# 记录在结果中的依赖版本
+PACKAGES = ('ruamel.yaml', 'orjson', 'ujson', 'wtforms')
+
+BENCHMARKS = []
+
+
+def benchmark(name, **params):
+    """
+    注册基准测试。被装饰的函数接收临时目录与一组参数，完成准备工作后返回被计时的无参函数。
+    """
+
+    def decorator(func):
+        BENCHMARKS.append((name, params, func))
+        return func
+
+    return decorator
+
+
+def make_config(conf_root, name, fields, depth):
+    """
+    定义并装饰一个配置类：每层 fields 个标量字段，除最内层外还有一个名为 child 的子配置。
+    """
+    child = None
+    for level in reversed(range(depth)):
+        annotations = {}
+        namespace = {'__annotations__': annotations}
+        for i in range(fields):
+            field_type, default = SCALARS[i % len(SCALARS)]
+            annotations[f'field_{i}'] = field_type
+            namespace[f'field_{i}'] = default
+        if child is not None:
+            annotations['child'] = child
+            namespace['child'] = dataclass_field(default_factory=child)
+        cls_name = name if level == 0 else f'{name}_{level}'
+        namespace['__qualname__'] = cls_name
+        child = conf_root.config(type(cls_name, (), namespace))
+    return child
+
+
+def make_conf_root(directory, agent):
+    if agent == 'none':
+        return ConfRoot(agent_class=None)
+    if agent == 'single':
+        return ConfRoot(os.path.join(directory, 'configs.yml'), agent_class=SingleFileYamlAgent)
+    return ConfRoot(directory, agent_class=AGENTS[agent])
+
+
+def settle(directory):
+    # 刚写入的文件处于 racy 窗口内，缓存不会信任它；将 mtime 调早以测量稳定状态。
+    past = time.time() - 60
+    for name in os.listdir(directory):
+        os.utime(os.path.join(directory, name), (past, past))
+
+
+@benchmark('decorate', fields=FIELDS, depth=DEPTHS)
+def bench_decorate(directory, fields, depth):
+    conf_root = ConfRoot(agent_class=None)
+    return lambda: make_config(conf_root, 'Decorated', fields, depth)
+
+
+@benchmark('instantiate', agent=('none', 'yaml', 'json', 'single'), fields=FIELDS, depth=DEPTHS)
+def bench_instantiate(directory, agent, fields, depth):
+    conf_root = make_conf_root(directory, agent)
+    cls = make_config(conf_root, 'Instantiated', fields, depth)
+    cls()
+    settle(directory)
+    cls()
+    return cls
+
+
+@benchmark('load', agent=tuple(AGENTS), fields=FIELDS, depth=DEPTHS)
+def bench_load(directory, agent, fields, depth):
+    conf_root = make_conf_root(directory, agent)
+    cls = make_config(conf_root, 'Loaded', fields, depth)
+    return cold_load(conf_root, cls)
+
+
+@benchmark('save', agent=tuple(AGENTS), fields=FIELDS, depth=DEPTHS)
+def bench_save(directory, agent, fields, depth):
+    conf_root = make_conf_root(directory, agent)
+    cls = make_config(conf_root, 'Saved', fields, depth)
+    return changing_save(conf_root, cls)
+
+
+@benchmark('single_file.load', configs=CONFIGS, fields=FIELDS)
+def bench_single_file_load(directory, configs, fields):
+    conf_root = make_conf_root(directory, 'single')
+    classes = make_sections(conf_root, configs, fields)
+    return cold_load(conf_root, classes[configs // 2])
+
+
+@benchmark('single_file.save', configs=CONFIGS, fields=FIELDS)
+def bench_single_file_save(directory, configs, fields):
+    conf_root = make_conf_root(directory, 'single')
+    classes = make_sections(conf_root, configs, fields)
+    return changing_save(conf_root, classes[configs // 2])
+
+
+def make_sections(conf_root, configs, fields):
+    # 在同一个文件中写入 configs 个section
+    classes = [make_config(conf_root, f'Section{i}', fields, 1) for i in range(configs)]
+    with conf_root.agent.batch():
+        for cls in classes:
+            cls()
+    return classes
+
+
+def cold_load(conf_root, cls):
+    # 每次都读取并解析文件，不使用任何缓存
+    instance = cls()
+    agent = conf_root.agent
+    agent.cache = None
+    configuration = cls.__CONF_ROOT__
+    if isinstance(agent, SingleFileYamlAgent):
+        document = agent.document
+
+        def run():
+            document.data = None
+            agent.load(configuration, instance)
+
+        return run
+    return lambda: agent.load(configuration, instance)
+
+
+def changing_save(conf_root, cls):
+    # 每次保存前修改一个字段，保证确实写入了文件；
+    # 同时显式关闭 skip_unchanged，测量的始终是写入而不是内容比较，不受该默认值的影响
+    instance = cls()
+    agent = conf_root.agent
+    agent.skip_unchanged = False
+    configuration = cls.__CONF_ROOT__
+
+    def run():
+        instance.field_0 += 1
+        agent.save(configuration, instance)
+
+    return run
+
+
+@benchmark('obj2data', fields=FIELDS, depth=DEPTHS)
+def bench_obj2data(directory, fields, depth):
+    instance = make_config(ConfRoot(agent_class=None), 'Encoded', fields, depth)()
+    return lambda: obj2data(instance)
+
+
+@benchmark('data2obj', fields=FIELDS, depth=DEPTHS)
+def bench_data2obj(directory, fields, depth):
+    cls = make_config(ConfRoot(agent_class=None), 'Decoded', fields, depth)
+    data = obj2data(cls())
+    return lambda: data2obj(cls(), data, custom=True)
+
+
+@benchmark('from_argparse', arguments=FIELDS)
+def bench_from_argparse(directory, arguments):
+    parser = argparse.ArgumentParser()
+    for i in range(arguments):
+        kind = i % 4
+        if kind == 0:
+            parser.add_argument(f'--int-{i}', type=int, default=i, help=f'argument {i}')
+        elif kind == 1:
+            parser.add_argument(f'--choice-{i}', default='a', choices=['a', 'b', 'c'])
+        elif kind == 2:
+            parser.add_argument(f'--flag-{i}', action='store_true')
+        else:
+            parser.add_argument(f'--list-{i}', nargs='+')
+    conf_root = ConfRoot(directory, agent_class=JsonAgent)
+    return lambda: conf_root.from_argparse(parser)
+
+
+def case_name(name, params):
+    if not params:
+        return name
+    return name + '[' + ','.join(f'{key}={value}' for key, value in params.items()) + ']'
+
+
+def iter_cases(pattern=None):
+    for name, grid, func in BENCHMARKS:
+        keys = list(grid)
+        for values in itertools.product(*(grid[key] for key in keys)):
+            params = dict(zip(keys, values))
+            full_name = case_name(name, params)
+            if pattern is None or re.search(pattern, full_name):
+                yield full_name, params, func
+
+
+def measure(func, min_time, repeat):
+    """
+    调整每轮的调用次数使一轮至少耗时 min_time 秒，共测量 repeat 轮，返回单次调用的耗时统计（秒）。
+    """
+    timer = timeit.Timer(func)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time:
+            break
+        number = max(number * 2, int(number * min_time / max(elapsed, 1e-9)) + 1)
+    samples = [timer.timeit(number) / number for _ in range(repeat)]
+    return {
+        'min': min(samples),
+        'median': statistics.median(samples),
+        'mean': statistics.mean(samples),
+        'stdev': statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        'number': number,
+        'repeat': repeat,
+    }
+
+
+def git(*args):
+    try:
+        return subprocess.run(['git', *args], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    from importlib import metadata
+    packages = {}
+    for package in PACKAGES:
+        try:
+            packages[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            packages[package] = None
+    return {
+        'commit': git('rev-parse', 'HEAD'),
+        'dirty': bool(git('status', '--porcelain', '--untracked-files=no')),
+        'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'packages': packages,
+    }
+
+
+def format_time(seconds):
+    if seconds >= 1:
+        return f'{seconds:.3f} s'
+    if seconds >= 1e-3:
+        return f'{seconds * 1e3:.3f} ms'
+    return f'{seconds * 1e6:.2f} us'
+
+
+def run_suite(pattern, min_time, repeat):
+    results = {}
+    for full_name, params, func in iter_cases(pattern):
+        with tempfile.TemporaryDirectory() as directory:
+            target = func(directory, **params)
+            result = measure(target, min_time, repeat)
+        result['params'] = params
+        results[full_name] = result
+        print(f'{full_name:<55} {format_time(result["median"]):>12}   (min {format_time(result["min"])})',
+              flush=True)
+    return {'environment': environment(), 'results': results}
+
+
+def default_output(report):
+    commit = report['environment']['commit']
+    name = (commit[:10] if commit else 'unknown') + ('-dirty' if report['environment']['dirty'] else '')
+    return os.path.join(ROOT, 'benchmarks', 'results', f'{name}.json')
+
+
+def compare(old, new, threshold, stat):
+    """
+    打印两次结果中共有测试的耗时之比，返回变慢超过 threshold 倍的测试数。
+    """
+    old_results, new_results = old['results'], new['results']
+    rows = []
+    for name in old_results:
+        if name in new_results:
+            before, after = old_results[name][stat], new_results[name][stat]
+            rows.append((after / before if before else float('inf'), name, before, after))
+    print(f'{old["environment"].get("commit") or "?"} -> {new["environment"].get("commit") or "?"} ({stat})')
+    regressions = 0
+    for ratio, name, before, after in sorted(rows, reverse=True):
+        if ratio > threshold:
+            mark = 'slower'
+            regressions += 1
+        elif ratio < 1 / threshold:
+            mark = 'faster'
+        else:
+            mark = ''
+        print(f'{name:<55} {format_time(before):>12} {format_time(after):>12} {ratio:7.2f}x  {mark}')
+    only_old, only_new = len(set(old_results) - set(new_results)), len(set(new_results) - set(old_results))
+    if only_old or only_new:
+        print(f'{only_old} benchmarks only in old results, {only_new} only in new results')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='conf_root benchmark suite')
+    parser.add_argument('--filter', help='只运行名称匹配该正则表达式的测试')
+    parser.add_argument('--quick', action='store_true', help='减少测量时间，结果仅供粗略参考')
+    parser.add_argument('--min-time', type=float, default=0.2, help='每轮的最短耗时（秒）')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='结果文件，默认为 benchmarks/results/<commit>.json')
+    parser.add_argument('--list', action='store_true', help='列出全部测试')
+    parser.add_argument('--compare', nargs='+', metavar='RESULT', help='OLD.json [NEW.json]')
+    parser.add_argument('--threshold', type=float, default=1.1, help='超过该倍数视为变慢')
+    parser.add_argument('--stat', choices=('min', 'median', 'mean'), default='median')
+    args = parser.parse_args()
+
+    if args.list:
+        for full_name, _, _ in iter_cases(args.filter):
+            print(full_name)
+        return
+    if args.compare and len(args.compare) > 2:
+        parser.error('--compare accepts at most two result files')
+
+    if args.compare and len(args.compare) == 2:
+        with open(args.compare[1], encoding='utf-8') as f:
+            new = json.load(f)
+    else:
+        min_time, repeat = (0.02, 3) if args.quick else (args.min_time, args.repeat)
+        new = run_suite(args.filter, min_time, repeat)
+        output = args.output or default_output(new)
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(new, f, indent=2)
+        print(f'results written to {output}')
+
+    if args.compare:
+        with open(args.compare[0], encoding='utf-8') as f:
+            old = json.load(f)
+        if compare(old, new, args.threshold, args.stat):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
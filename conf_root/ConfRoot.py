@@ -1,13 +1,22 @@
-import argparse
+import time
+from contextlib import nullcontext
 from dataclasses import make_dataclass, is_dataclass, MISSING, dataclass, field as dataclass_field
 from pathlib import Path
-from typing import Optional, Type, List
+from typing import Optional, Type, List, Dict, Any, NamedTuple, Union, Iterable, TYPE_CHECKING
 import logging
 
+from conf_root import lazy as lazy_loading, aio, instrument
 from conf_root.Configuration import Configuration, ConfigurationPreprocessField
 from conf_root.agents.BasicAgent import BasicAgent
+from conf_root.utils import build_codec, obj2data, ValidateException
 from conf_root.agents.YamlAgent import YamlAgent
-from conf_root.run_http import run_http, extract_classes_from_file, dataclass_to_wtform
+from conf_root.writer import WriteBehindWriter
+
+# 网页服务、共享内存、文件监视等较重的依赖在使用时才导入
+if TYPE_CHECKING:
+    import argparse
+    from conf_root.agents.SharedMemoryAgent import SharedConfig
+    from conf_root.watcher import ChangeCallback
 
 logger = logging.getLogger(__name__)
 
@@ -19,13 +28,36 @@ def preprocess(cls):
                 setattr(cls, name, default.field())
 
 
+class ConfigResult(NamedTuple):
+    """
+    load_all/save_all 中单个配置的结果。
+    """
+    name: str
+    instance: Any
+    # 耗时（秒）
+    seconds: float
+    error: Optional[BaseException]
+
+
 class ConfRoot:
-    def __init__(self, path: str = None, agent_class: Optional[Type[BasicAgent]] = YamlAgent):
+    def __init__(self, path: str = None, agent_class: Optional[Type[BasicAgent]] = YamlAgent, lazy: bool = False,
+                 write_behind: bool = False, fsync: str = 'none'):
         self.path = Path(path) if path is not None else Path()
         self.agent_class = agent_class
+        self.lazy = lazy
         self.persist = (agent_class is not None)
+        # publish 创建的共享内存
+        self.shared: Optional['SharedConfig'] = None
+        # 由 config 注册的配置，按注册顺序排列
+        self.configurations: Dict[str, Configuration] = {}
+        self._class_configurations: Dict[type, Configuration] = {}
+        # load_all 得到的实例，供 save_all 使用
+        self.instances: Dict[str, Any] = {}
         if self.persist:
             self.agent = self.agent_class(self.path)
+            self.agent.fsync = fsync
+            if write_behind:
+                self.agent.writer = WriteBehindWriter(self.agent)
 
     def config(self, *args, **kwargs):
         def decorator(cls, name: Optional[str] = None, dynamic=False):
@@ -39,12 +71,27 @@ class ConfRoot:
 
             configuration = Configuration(name, cls, self)
             setattr(cls, '__CONF_ROOT__', configuration)
+            self.register(configuration)
+            # 预先生成编解码函数，解析配置文件位置
+            build_codec(cls)
+            if self.persist:
+                self.agent.get_configuration_location(configuration)
 
             # 覆盖其 __init__ 函数
             origin_init = cls.__init__
+            lazy = self.lazy
+            if lazy:
+                # 字段在首次读取时才触发加载
+                lazy_loading.install(cls)
 
             def decorated_init(_self, *args, **kwargs):
                 origin_init(_self, *args, **kwargs)
+                if lazy:
+                    lazy_loading.defer(_self)
+                    return
+                if aio.defer(_self):
+                    # 由 acreate 在事件循环之外完成加载
+                    return
                 _configuration = getattr(cls, '__CONF_ROOT__')
                 cr_stuff = _configuration.conf_root
                 cr_stuff.post_init(_self, _configuration)
@@ -58,12 +105,22 @@ class ConfRoot:
                     return cr_stuff.agent.save(_configuration, _self)
 
                 def load(_self):
+                    # 显式加载会覆盖全部字段，无需再进行待定的加载。
+                    lazy_loading.resolve(_self, persist=False)
                     _configuration = getattr(cls, '__CONF_ROOT__')
                     cr_stuff = _configuration.conf_root
                     return cr_stuff.agent.load(_configuration, _self)
 
+                async def asave(_self):
+                    return await aio.run(save, _self)
+
+                async def aload(_self):
+                    return await aio.run(load, _self)
+
                 cls.save = save
                 cls.load = load
+                cls.asave = asave
+                cls.aload = aload
             return cls
 
         if len(args) == 1 and isinstance(args[0], type):
@@ -78,8 +135,79 @@ class ConfRoot:
         # @wrap() or @wrap(name='config')
         return lambda cls: decorator(cls, **kwargs)
 
+    def register(self, configuration: Configuration) -> None:
+        previous = self.configurations.pop(configuration.name, None)
+        if previous is not None:
+            self._class_configurations.pop(previous.cls, None)
+        self.configurations[configuration.name] = configuration
+        self._class_configurations[configuration.cls] = configuration
+
+    def get_configuration(self, key: Union[str, type]) -> Configuration:
+        """
+        按名称或配置类获取已注册的配置。
+        """
+        if isinstance(key, str):
+            return self.configurations[key]
+        return self._class_configurations[key]
+
+    @property
+    def classes(self) -> List[type]:
+        return [configuration.cls for configuration in self.configurations.values()]
+
+    def _run_all(self, func, items, max_workers) -> List[ConfigResult]:
+        def run(item):
+            name = item[0]
+            start = time.perf_counter()
+            try:
+                instance = func(*item[1:])
+                error = None
+            except (Exception, ValidateException) as e:
+                instance, error = None, e
+                logger.warning(f'{name}: {e!r}')
+            return ConfigResult(name, instance, time.perf_counter() - start, error)
+
+        # 复用长期存在的线程池，避免每次调用都创建线程（以及 SqliteAgent 中各线程的连接）
+        return list(aio.get_executor(max_workers).map(run, items))
+
+    def load_all(self, max_workers: Optional[int] = None) -> List[ConfigResult]:
+        """
+        在线程池中并发地实例化（即加载或创建）全部已注册的配置类，返回每个配置的实例、耗时与异常。
+        lazy 模式下同样在此时完成加载。
+        """
+
+        def load(cls):
+            instance = cls()
+            lazy_loading.resolve(instance)
+            return instance
+
+        results = self._run_all(load, [(c.name, c.cls) for c in self.configurations.values()], max_workers)
+        for result in results:
+            if result.error is None:
+                self.instances[result.name] = result.instance
+        return results
+
+    def save_all(self, instances: Optional[Iterable] = None, max_workers: Optional[int] = None) -> List[ConfigResult]:
+        """
+        在线程池中并发地保存配置实例，默认为 load_all 得到的实例。
+        """
+        if instances is None:
+            instances = self.instances.values()
+
+        def save(configuration, instance):
+            self.agent.save(configuration, instance)
+            return instance
+
+        items = []
+        for instance in instances:
+            configuration = getattr(type(instance), '__CONF_ROOT__')
+            items.append((configuration.name, configuration, instance))
+        return self._run_all(save, items, max_workers)
+
     def post_init(self, instance, configuration):
         if self.persist:
+            if self.agent.load_cached(configuration, instance):
+                # 文件未变化时直接使用缓存的解析结果
+                return
             if self.agent.exist(configuration):
                 # 如果已存在，读取和实例化
                 self.agent.load(configuration, instance)
@@ -87,7 +215,100 @@ class ConfRoot:
                 # 若文件不存在，根据默认值创建
                 self.agent.save(configuration, instance)
 
-    def from_argparse(self, parser: argparse.ArgumentParser, cls_name: str = 'ArgparseConfig'):
+    @staticmethod
+    async def acreate(cls, *args, **kwargs):
+        """
+        实例化配置类，读写与解析在线程池中进行，不阻塞事件循环。
+        """
+        with aio.defer_io() as deferred:
+            instance = cls(*args, **kwargs)
+
+        def load():
+            # default_factory 创建的嵌套配置先于外层完成初始化，按此顺序加载，与同步实例化一致
+            for item in deferred:
+                configuration = getattr(type(item), '__CONF_ROOT__')
+                configuration.conf_root.post_init(item, configuration)
+            lazy_loading.resolve(instance)
+
+        if deferred or lazy_loading.is_pending(instance):
+            await aio.run(load)
+        return instance
+
+    async def aload_all(self, classes: Optional[Iterable[type]] = None) -> list:
+        """
+        并发地实例化并加载 classes 中的配置类（默认为全部已注册的配置类），返回实例列表。
+        """
+        if classes is None:
+            classes = self.classes
+        import asyncio
+        return list(await asyncio.gather(*(ConfRoot.acreate(cls) for cls in classes)))
+
+    def batch(self):
+        """
+        批量保存：在上下文中的保存会在退出时合并写入，每个文件只写一次；上下文中发生异常时不写入任何内容。
+        """
+        if not self.persist:
+            return nullcontext()
+        return self.agent.batch()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        立即写入写入线程中尚未完成的保存并等待完成；超时返回 False。
+        """
+        if self.persist and self.agent.writer is not None:
+            return self.agent.writer.flush(timeout)
+        return True
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待写入线程完成已提交的保存；超时返回 False。
+        """
+        if self.persist and self.agent.writer is not None:
+            return self.agent.writer.wait(timeout)
+        return True
+
+    @staticmethod
+    def watch(instance, callback: Optional['ChangeCallback'] = None) -> None:
+        """
+        监视 instance 的配置文件，文件变化时原地更新 instance，并以 callback(instance, {字段名: (旧值, 新值)}) 通知。
+        """
+        from conf_root.watcher import get_watcher
+        get_watcher().watch(instance, callback)
+
+    @staticmethod
+    def unwatch(instance) -> None:
+        from conf_root.watcher import get_watcher
+        get_watcher().unwatch(instance)
+
+    def publish(self, classes: Optional[Iterable[type]] = None, name: Optional[str] = None,
+                size: Optional[int] = None) -> 'SharedConfig':
+        """
+        加载 classes（默认为全部已注册的配置类）中的配置并写入共享内存，返回 SharedConfig；其他进程用 attach(shared.name) 读取。
+        再次调用时写入同一块共享内存，generation 随之增加，已 attach 的进程在下次实例化时读到新数据。
+        """
+        from conf_root.agents.SharedMemoryAgent import SharedConfig
+        if classes is None:
+            classes = self.classes
+        data = {getattr(cls, '__CONF_ROOT__').name: obj2data(cls()) for cls in classes}
+        if self.shared is None:
+            self.shared = SharedConfig.create(data, name=name, size=size)
+        else:
+            self.shared.publish(data)
+        return self.shared
+
+    def attach(self, name: str) -> 'SharedConfig':
+        """
+        从 publish 创建的共享内存中读取配置，不再访问配置文件；共享内存中没有的配置仍由原agent处理。
+        """
+        from conf_root.agents.SharedMemoryAgent import SharedConfig, SharedMemoryAgent
+        shared = SharedConfig(name)
+        self.agent = SharedMemoryAgent(shared, self.agent if self.persist else None)
+        self.persist = True
+        return shared
+
+    def from_argparse(self, parser: 'argparse.ArgumentParser', cls_name: str = 'ArgparseConfig'):
+        import argparse
+
         def get_default(action):
             if action.default and action.default != argparse.SUPPRESS:
                 return action.default
@@ -149,17 +370,38 @@ class ConfRoot:
         return self.config(cls)
 
     @staticmethod
-    def serve(classes, host='127.0.0.1', port=8080):
+    def serve(classes, host='127.0.0.1', port=8080, max_workers: int = 32, mode: str = 'threaded',
+              metrics: bool = False):
+        from conf_root.run_http import run_http, dataclass_to_wtform
+        if mode not in ('threaded', 'asyncio'):
+            raise ValueError(f"mode should be 'threaded' or 'asyncio', got {mode!r}")
         forms = {cls: dataclass_to_wtform(cls) for cls in classes}
-        run_http(forms, host=host, port=port)
+        enabled = instrument.enabled
+        if metrics:
+            # 供 /metrics 使用，服务结束后恢复原来的状态
+            instrument.enable()
+        try:
+            if mode == 'asyncio':
+                # 提供 /events 变更推送
+                from conf_root.async_http import run_async_http
+                run_async_http(forms, host=host, port=port, max_workers=max_workers)
+            else:
+                run_http(forms, host=host, port=port, max_workers=max_workers)
+        finally:
+            if metrics and not enabled:
+                instrument.disable()
 
 
 def main():
+    import argparse
+    from conf_root.run_http import extract_classes_from_file
+
     parser = argparse.ArgumentParser(prog='conf-root-web',
                                      description="这个脚本允许您在一个网页中可视化地修改您的配置文件。")
     parser.add_argument('filename', help="提取配置类的Python文件名")
     parser.add_argument('--host', '-H', default='127.0.0.1', help='服务器的host')
     parser.add_argument('--port', '-P', default=8080, help='服务器的port')
+    parser.add_argument('--metrics', action='store_true', help='开启读写统计，在 /metrics 输出')
     args = parser.parse_args()
 
     classes = extract_classes_from_file(args.filename)
@@ -167,7 +409,7 @@ def main():
         print(f"No classes found in {args.filename}.")
         return
     print(f"Configuration classes defined in {args.filename}: {classes}")
-    ConfRoot.serve(classes, args.host, args.port)
+    ConfRoot.serve(classes, args.host, args.port, metrics=args.metrics)
 
 
 if __name__ == "__main__":
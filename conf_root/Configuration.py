@@ -1,33 +1,198 @@
+import hashlib
 import re
 from abc import abstractmethod
-from dataclasses import fields as dataclasses_fields, dataclass, is_dataclass, field as dataclass_field, Field
-from typing import Any, List
+from types import CodeType
+from dataclasses import fields as dataclasses_fields, dataclass, is_dataclass, field as dataclass_field, Field, MISSING
+from typing import Any, List, NamedTuple, Tuple, Optional, Callable, Sequence
 
 
 def is_config_class(cls_or_instance):
     return getattr(cls_or_instance, '__CONF_ROOT__', None) is not None
 
 
-@dataclass
+class FieldSchema(NamedTuple):
+    """
+    预先解析的字段信息。metadata 中未给出的项为 None（validators 为空元组）。
+    """
+    name: str
+    type: Any
+    default: Any
+    default_factory: Any
+    serialize: Optional[Callable]
+    deserialize: Optional[Callable]
+    validators: Tuple[Callable, ...]
+    comment: Optional[str]
+    choices: Optional[Sequence]
+    # 字段类型是否为配置类 / dataclass
+    is_config: bool
+    is_dataclass: bool
+    field: Field
+
+
+class ClassSchema(NamedTuple):
+    """
+    dataclass 的不可变结构描述，在装饰时计算一次。
+    """
+    cls: Any
+    fields: Tuple[FieldSchema, ...]
+    names: Tuple[str, ...]
+    # 自身及递归嵌套的全部dataclass，按出现顺序去重
+    all_dataclass: Tuple[Any, ...]
+    # 结构的摘要，字段、类型或自定义函数变化时改变
+    digest: str
+
+
+_SCHEMA_ATTR = '__conf_root_schema__'
+
+
+def build_schema(cls) -> ClassSchema:
+    field_schemas = []
+    all_dataclass = [cls]
+    for field in dataclasses_fields(cls):
+        metadata = field.metadata
+        field_type = field.type
+        field_schemas.append(FieldSchema(
+            name=field.name,
+            type=field_type,
+            default=field.default,
+            default_factory=field.default_factory,
+            serialize=metadata.get('serialize', None),
+            deserialize=metadata.get('deserialize', None),
+            validators=tuple(metadata.get('validators', None) or ()),
+            comment=metadata.get('comment', None),
+            choices=metadata.get('choices', None),
+            is_config=is_config_class(field_type),
+            is_dataclass=is_dataclass(field_type) and isinstance(field_type, type),
+            field=field,
+        ))
+        if field_schemas[-1].is_dataclass:
+            for sub_cls in schema_of(field_type).all_dataclass:
+                if sub_cls not in all_dataclass:
+                    all_dataclass.append(sub_cls)
+    field_schemas = tuple(field_schemas)
+    digest = _digest(cls, field_schemas, all_dataclass)
+    schema = ClassSchema(cls, field_schemas, tuple(f.name for f in field_schemas), tuple(all_dataclass), digest)
+    setattr(cls, _SCHEMA_ATTR, schema)
+    return schema
+
+
+def _describe_code(code: CodeType):
+    return code.co_code.hex(), tuple(_describe_const(c) for c in code.co_consts), code.co_names
+
+
+def _describe_const(value):
+    # 常量中的嵌套函数（lambda、推导式等）同样递归描述
+    if isinstance(value, CodeType):
+        return _describe_code(value)
+    if isinstance(value, tuple):
+        return tuple(_describe_const(v) for v in value)
+    if isinstance(value, (set, frozenset)):
+        # 集合的 repr 顺序取决于 PYTHONHASHSEED，排序后才能在不同进程中得到相同的摘要
+        return type(value).__name__, tuple(sorted((_describe_const(v) for v in value), key=repr))
+    return repr(value)
+
+
+def _describe_value(value, seen):
+    if callable(value) and hasattr(value, '__code__'):
+        return _describe_function(value, seen)
+    if isinstance(value, (tuple, set, frozenset)):
+        return _describe_const(value)
+    if type(value).__repr__ is object.__repr__:
+        # 默认的 repr 含有内存地址，每次运行都不同
+        return type(value).__qualname__
+    return repr(value)
+
+
+def _describe_function(func, seen=None):
+    """
+    描述函数的代码、常量、引用的名称以及闭包与默认参数的值，任一变化都会改变schema的摘要。
+    """
+    if func is None:
+        return None
+    code = getattr(func, '__code__', None)
+    if code is None:
+        return getattr(func, '__qualname__', repr(func)), None
+    seen = seen if seen is not None else set()
+    if id(func) in seen:
+        # 闭包中引用自身的递归函数
+        return func.__qualname__
+    seen.add(id(func))
+    cells = []
+    for cell in getattr(func, '__closure__', None) or ():
+        try:
+            cells.append(_describe_value(cell.cell_contents, seen))
+        except ValueError:  # 尚未赋值的 cell
+            cells.append(None)
+    defaults = tuple(_describe_value(v, seen) for v in getattr(func, '__defaults__', None) or ())
+    return func.__qualname__, _describe_code(code), tuple(cells), defaults
+
+
+def _digest(cls, field_schemas, all_dataclass) -> str:
+    description = [cls.__module__, cls.__qualname__]
+    for field in field_schemas:
+        description.append((field.name, repr(field.type), _describe_function(field.serialize),
+                            _describe_function(field.deserialize)))
+    for sub_cls in all_dataclass[1:]:
+        description.append(schema_of(sub_cls).digest)
+    return hashlib.sha1(repr(description).encode('utf-8')).hexdigest()
+
+
+def schema_of(cls) -> ClassSchema:
+    # 只使用类自身的schema，子类需要单独计算。
+    schema = cls.__dict__.get(_SCHEMA_ATTR)
+    if schema is None:
+        schema = build_schema(cls)
+    return schema
+
+
+def field_default(field_schema: FieldSchema) -> Any:
+    """
+    字段的默认值；没有默认值时返回 MISSING。
+    """
+    if field_schema.default is not MISSING:
+        return field_schema.default
+    if field_schema.default_factory is not MISSING:
+        return field_schema.default_factory()
+    return MISSING
+
+
+# eq=False: 以对象身份比较与哈希，便于作为缓存的键。
+@dataclass(eq=False)
 class Configuration:
     name: str
     cls: Any
     conf_root: Any
+    # 以下在创建时计算
+    filename: str = dataclass_field(init=False)
+    schema: ClassSchema = dataclass_field(init=False, repr=False)
+    # 最近一次解析出的 (agent, agent.path, location)
+    resolved_location: Optional[Tuple] = dataclass_field(init=False, default=None, repr=False)
 
-    @property
-    def filename(self):
+    def __post_init__(self):
         invalid_chars_pattern = r'[\\/:*?"<>|]'
-        filename = re.sub(invalid_chars_pattern, '_', self.name)
-        return filename
+        self.filename = re.sub(invalid_chars_pattern, '_', self.name)
+        self.schema = build_schema(self.cls)
+
+    def refresh_schema(self) -> ClassSchema:
+        """
+        重新计算schema。装饰之后修改了类的字段定义时需要调用。
+        依赖字段定义的编解码函数、YAML引擎与延迟加载的字段随之重新生成。
+        """
+        from conf_root import lazy
+        from conf_root.agents.YamlAgent import discard_engine
+        from conf_root.utils import build_codec
+
+        self.schema = build_schema(self.cls)
+        self.resolved_location = None
+        build_codec(self.cls)
+        discard_engine(self)
+        if getattr(self.conf_root, 'lazy', False):
+            lazy.install(self.cls)
+        return self.schema
 
     @property
     def all_dataclass(self):
-        def _recursive_dataclass(cls):
-            if is_dataclass(cls):
-                return sum([_recursive_dataclass(field.type) for field in dataclasses_fields(cls)], [cls])
-            return []
-
-        return _recursive_dataclass(self.cls)
+        return self.schema.all_dataclass
 
 
 class ConfigurationPreprocessField:
@@ -13,6 +13,26 @@ logger.addHandler(console_handler)
 from .ConfRoot import ConfRoot
 from .Configuration import is_config_class, ChoiceField
 from .utils import ValidateException
+from .instrument import stats
 from .agents.BasicAgent import BasicAgent
-from .agents.JsonAgent import JsonAgent
 from .agents.YamlAgent import YamlAgent, SingleFileYamlAgent
+
+# 其余agent在首次访问时才导入，见 __getattr__
+_LAZY_ATTRIBUTES = {
+    'JsonAgent': '.agents.JsonAgent',
+    'SqliteAgent': '.agents.SqliteAgent',
+}
+
+
+def __getattr__(name):
+    module_name = _LAZY_ATTRIBUTES.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
@@ -1,12 +1,57 @@
+import copy
+import hashlib
 import os
+import pickle
+import threading
+import time
 from abc import abstractmethod
+from contextlib import contextmanager
 from pathlib import Path
 import logging
+from typing import Optional, Any, List, Tuple, Dict, NamedTuple
 
+from conf_root import lazy, events, instrument
 from conf_root.Configuration import Configuration
+from conf_root.cache import DataCache, data_cache, FileStamp, RACY_WINDOW
+from conf_root.writer import atomic_write, WriteBehindWriter
+from conf_root.utils import data2obj, obj2data
 
 logger = logging.getLogger(__name__)
 
+# 由 conf_root.instrument 记录的 agent 方法
+_INSTRUMENTED = ('load', 'load_cached', 'save', 'exist')
+# 实例上次保存时的状态，保存在实例的 __dict__ 中
+SAVED_KEY = '__conf_root_saved__'
+
+
+class SavedState(NamedTuple):
+    location: Any
+    # 字段定义变化（refresh_schema）后输出可能不同
+    schema: Any
+    stamp: FileStamp
+    # 记录时的 time.time_ns()
+    marked_at: int
+    # 记录时文件内容的 sha1
+    content: bytes
+    # pickle 后的 obj2data(instance)
+    digest: bytes
+
+    def __deepcopy__(self, memo):
+        # 不可变，复制实例时共享即可
+        return self
+
+    @property
+    def trusted(self) -> bool:
+        # 文件的 mtime 早于记录时刻一个 racy 窗口以上时，之后的修改必然改变指纹，仅凭指纹相同即可认定文件未被修改
+        return self.stamp.mtime_ns < self.marked_at - RACY_WINDOW * 1e9
+
+
+def _digest(instance) -> Optional[bytes]:
+    try:
+        return pickle.dumps(obj2data(instance), protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        return None
+
 
 class MultiFileAgent:
     default_extension: str = '.undefined'
@@ -16,8 +61,13 @@ class MultiFileAgent:
         self.path.mkdir(parents=True, exist_ok=True)
 
     def get_configuration_location(self, configuration: Configuration) -> Path:
+        resolved = configuration.resolved_location
+        if resolved is not None and resolved[0] is self and resolved[1] is self.path:
+            return resolved[2]
         filename = self.path.joinpath(configuration.filename)
-        return self.ensure_suffix(filename)
+        location = self.ensure_suffix(filename)
+        configuration.resolved_location = (self, self.path, location)
+        return location
 
     def ensure_suffix(self, path):
         # 检查文件路径是否已经有后缀名
@@ -57,12 +107,213 @@ class OneFileAgent(MultiFileAgent):
 class BasicAgent(MultiFileAgent):
     """
     此抽象类为所有Agent类定义接口。
+
+    子类实现 read/write 完成具体格式的读写，load/save 负责日志与缓存等公共流程。
+    load/load_cached/save/exist 由 conf_root.instrument 记录耗时，子类覆盖的版本也会被自动包装。
     """
+    # 进程级的解析数据缓存。设置为 None 可关闭缓存。
+    cache: Optional[DataCache] = data_cache
+    # 写入文件时的fsync策略，见 conf_root.writer.FSYNC_POLICIES
+    fsync: str = 'none'
+    # 设置后保存操作交由写入线程异步完成
+    writer: Optional[WriteBehindWriter] = None
+    # 跳过不会改变文件内容的保存，见 is_clean
+    skip_unchanged: bool = True
+
+    def __init__(self, location):
+        super().__init__(location)
+        # 每个线程各自的批量保存状态
+        self._batch_state = threading.local()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for name in _INSTRUMENTED:
+            method = getattr(cls, name, None)
+            if method is None:
+                continue
+            wrapped = instrument.instrumented(name)(method)
+            if wrapped is not method:
+                setattr(cls, name, wrapped)
 
     @abstractmethod
-    def load(self, configuration: Configuration, instance):
-        logger.debug(f'load {instance.__class__.__qualname__} from: {self.get_configuration_location(configuration)}')
+    def read(self, configuration: Configuration) -> Optional[Any]:
+        """
+        读取并解析配置，返回交给 apply 的数据；配置不存在时返回 None。
+        """
+        pass
 
     @abstractmethod
+    def write(self, configuration: Configuration, instance) -> None:
+        pass
+
+    def write_text(self, location, content) -> None:
+        if self.skip_unchanged:
+            data = content.encode('utf-8') if isinstance(content, str) else content
+            if self._read_bytes(location) == data:
+                logger.debug(f'skip writing unchanged {location}')
+                return
+        atomic_write(location, content, fsync=self.fsync)
+        instrument.count_bytes('written', content)
+
+    def mark_saved(self, instance, location) -> None:
+        """
+        记录 instance 刚被写入 location（或与其内容相同而跳过了写入）。
+        """
+        stamp = FileStamp.of(location)
+        digest = _digest(instance) if stamp is not None else None
+        content = self._read_bytes(location) if digest is not None else None
+        if content is None:
+            instance.__dict__.pop(SAVED_KEY, None)
+            return
+        schema = getattr(type(instance), '__CONF_ROOT__').schema
+        instance.__dict__[SAVED_KEY] = SavedState(location, schema, stamp, time.time_ns(),
+                                                  hashlib.sha1(content).digest(), digest)
+
+    def is_clean(self, configuration: Configuration, instance) -> bool:
+        """
+        instance 自上次保存后未被修改，且文件也未被修改时返回 True，此时保存不会改变文件。
+        无法确定时返回 False，由 write_text 比较序列化的结果与文件内容。
+        加载后不做记录：文件可能缺少字段或格式不同，与保存时的输出不一定相同。
+        """
+        saved = instance.__dict__.get(SAVED_KEY)
+        if saved is None or saved.schema is not configuration.schema:
+            return False
+        if saved.location != self.get_configuration_location(configuration):
+            return False
+        if FileStamp.of(saved.location) != saved.stamp or _digest(instance) != saved.digest:
+            return False
+        if saved.trusted:
+            return True
+        # 刚写入的文件的指纹不可信，比较文件内容的摘要；确认未变化后重新记录，之后仅比较指纹
+        content = self._read_bytes(saved.location)
+        if content is None or hashlib.sha1(content).digest() != saved.content:
+            return False
+        instance.__dict__[SAVED_KEY] = saved._replace(marked_at=time.time_ns())
+        return True
+
+    def apply(self, configuration: Configuration, instance, data) -> None:
+        # 覆盖原instance中的变量
+        data2obj(instance, data)
+
+    @instrument.instrumented('load')
+    def load(self, configuration: Configuration, instance):
+        location = self.get_configuration_location(configuration)
+        logger.debug(f'load {instance.__class__.__qualname__} from: {location}')
+        data = self.read(configuration)
+        if data is None:
+            return
+        if self.cache is not None:
+            self.cache.put(configuration, location, data)
+        self.apply(configuration, instance, data)
+        return instance
+
+    @instrument.instrumented('load_cached')
+    def load_cached(self, configuration: Configuration, instance) -> bool:
+        """
+        若缓存中有仍然有效的数据，则直接用其填充 instance 并返回 True。
+        """
+        if self.cache is None:
+            return False
+        data = self.cache.get(configuration, self.get_configuration_location(configuration))
+        instrument.record_cache(configuration, data is not None)
+        if data is None:
+            return False
+        self.apply(configuration, instance, data)
+        return True
+
+    @instrument.instrumented('save')
     def save(self, configuration: Configuration, instance):
-        logger.debug(f'save {instance.__class__.__qualname__} to: {self.get_configuration_location(configuration)}')
+        location = self.get_configuration_location(configuration)
+        logger.debug(f'save {instance.__class__.__qualname__} to: {location}')
+        # 延迟加载的实例先完成加载，避免在序列化过程中触发读取。
+        lazy.resolve(instance)
+        if self.skip_unchanged and self.is_clean(configuration, instance):
+            logger.debug(f'skip saving unchanged {configuration.name}')
+            return
+        pending = getattr(self._batch_state, 'pending', None)
+        if pending is not None:
+            # 批量保存中：记录此刻的快照，退出时再写入。同一配置以最后一次为准。
+            pending[(location, configuration.name)] = (configuration, copy.deepcopy(instance))
+            return
+        if self.writer is not None:
+            self.writer.submit({(location, configuration.name): (configuration, copy.deepcopy(instance))})
+            return
+        self.commit(location, [(configuration, instance)])
+        if self.skip_unchanged:
+            self.mark_saved(instance, location)
+        events.notify(configuration)
+
+    def commit(self, location, items: List[Tuple[Configuration, Any]]) -> None:
+        """
+        将若干配置写入同一位置。写入单个文件的agent可以覆盖此方法，一次写入全部配置。
+        """
+        try:
+            for configuration, instance in items:
+                self.write(configuration, instance)
+        finally:
+            if self.cache is not None:
+                self.cache.invalidate(location)
+
+    @contextmanager
+    def batch(self):
+        """
+        在上下文中缓存当前线程的保存操作，退出时每个文件只写入一次。
+        发生异常时丢弃缓存的保存；写入过程中失败时恢复已写入的文件。
+        """
+        pending = getattr(self._batch_state, 'pending', None)
+        if pending is not None:
+            # 嵌套的批量保存在最外层统一写入，异常时只回滚本层的保存。
+            savepoint = dict(pending)
+            try:
+                yield
+            except BaseException:
+                pending.clear()
+                pending.update(savepoint)
+                raise
+            return
+
+        pending = self._batch_state.pending = {}
+        try:
+            yield
+        finally:
+            self._batch_state.pending = None
+        if self.writer is not None:
+            self.writer.submit(pending)
+        else:
+            self.flush_batch(pending)
+
+    def flush_batch(self, pending: Dict[Tuple[Any, str], Tuple[Configuration, Any]]) -> None:
+        groups: Dict[Any, List[Tuple[Configuration, Any]]] = {}
+        for (location, _), item in pending.items():
+            groups.setdefault(location, []).append(item)
+        # 备份原文件，任一文件写入失败时全部恢复。
+        originals = {location: self._read_bytes(location) for location in groups}
+        try:
+            for location, items in groups.items():
+                # 写入的字节数计入该文件的第一个配置（每个配置一个文件时即为其本身）
+                with instrument.attributed(items[0][0]):
+                    self.commit(location, items)
+        except BaseException:
+            for location, content in originals.items():
+                self._restore_bytes(location, content)
+            if self.cache is not None:
+                for location in originals:
+                    self.cache.invalidate(location)
+            raise
+        for configuration, _ in pending.values():
+            events.notify(configuration)
+
+    @staticmethod
+    def _read_bytes(location) -> Optional[bytes]:
+        try:
+            with open(location, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _restore_bytes(self, location, content: Optional[bytes]) -> None:
+        if content is None:
+            if os.path.exists(location):
+                os.remove(location)
+            return
+        self.write_text(location, content)
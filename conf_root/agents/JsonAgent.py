@@ -1,24 +1,113 @@
 import json
+import threading
+from typing import Optional, Dict, Type
 
+from conf_root import instrument
 from conf_root.agents.BasicAgent import BasicAgent, MultiFileAgent
 from conf_root.utils import data2obj, obj2data
 
 
+class JsonBackend:
+    """
+    JSON编解码后端，直接读写bytes。默认实现使用标准库json。
+    """
+    name = 'json'
+
+    def loads(self, content: bytes):
+        return json.loads(content)
+
+    def dumps(self, data) -> bytes:
+        return json.dumps(data).encode('utf-8')
+
+
+class _OptionalBackend(JsonBackend):
+    """
+    使用第三方库解析。写入总是使用标准库，使文件内容与可接受的类型不受安装了哪个库的影响：
+    各库的分隔符、非ASCII字符的转义、浮点数格式以及对dataclass、NaN的处理均与标准库不同。
+    """
+    # 第三方库不支持的内容（如超出64位的整数、NaN）交给标准库处理。
+    fallback_errors = (TypeError, ValueError, OverflowError)
+
+    def loads(self, content: bytes):
+        try:
+            return self._loads(content)
+        except self.fallback_errors:
+            return super().loads(content)
+
+
+class OrjsonBackend(_OptionalBackend):
+    name = 'orjson'
+
+    def __init__(self):
+        import orjson
+        self._loads = orjson.loads
+
+
+class SimdjsonBackend(_OptionalBackend):
+    name = 'simdjson'
+
+    def __init__(self):
+        import simdjson
+        self._loads = simdjson.loads
+
+
+class UjsonBackend(_OptionalBackend):
+    name = 'ujson'
+
+    def __init__(self):
+        import ujson
+        self._loads = ujson.loads
+
+
+JSON_BACKENDS: Dict[str, Type[JsonBackend]] = {
+    'orjson': OrjsonBackend,
+    'simdjson': SimdjsonBackend,
+    'ujson': UjsonBackend,
+    'json': JsonBackend,
+}
+
+_default_backend: Optional[JsonBackend] = None
+_default_lock = threading.Lock()
+
+
+def get_json_backend(name: Optional[str] = None) -> JsonBackend:
+    """
+    按名称获取JSON后端；name 为 None 时按 JSON_BACKENDS 的顺序选择第一个已安装的后端。
+    """
+    global _default_backend
+    if name is not None:
+        return JSON_BACKENDS[name]()
+    if _default_backend is None:
+        with _default_lock:
+            for backend_class in JSON_BACKENDS.values():
+                try:
+                    _default_backend = backend_class()
+                    break
+                except ImportError:
+                    continue
+    return _default_backend
+
+
 class JsonAgent(BasicAgent, MultiFileAgent):
     default_extension = '.json'
+    # 为 None 时自动选择已安装的最快后端
+    backend: Optional[JsonBackend] = None
 
-    def load(self, configuration, instance):
-        super().load(configuration, instance)
+    def get_backend(self) -> JsonBackend:
+        return self.backend if self.backend is not None else get_json_backend()
+
+    def read(self, configuration):
         location = self.get_configuration_location(configuration)
-        with open(location, encoding='utf-8') as file:
-            data = json.load(file)
+        with open(location, 'rb') as file:
+            content = file.read()
+        instrument.count_bytes('read', content)
+        return self.get_backend().loads(content)
+
+    def apply(self, configuration, instance, data):
         # 将dict展开为对象。
         data2obj(instance, data, custom=True)
-        return instance
 
-    def save(self, configuration, instance):
-        super().save(configuration, instance)
+    def write(self, configuration, instance):
         data = obj2data(instance)
         location = self.get_configuration_location(configuration)
-        with open(location, "w") as file:
-            json.dump(data, file)
+        self.write_text(location, self.get_backend().dumps(data))
@@ -0,0 +1,186 @@
+import copy
+import logging
+import pickle
+import struct
+import threading
+import time
+from contextlib import nullcontext
+from multiprocessing import shared_memory
+from typing import Optional, Dict, Any, Tuple
+
+from conf_root.Configuration import Configuration
+from conf_root.utils import data2obj
+
+logger = logging.getLogger(__name__)
+
+# 本进程创建的共享内存名称。attach 自己创建的共享内存时不能取消其在 resource_tracker 中的登记。
+_created = set()
+
+
+def _open_shared_memory(name: str) -> shared_memory.SharedMemory:
+    """
+    打开已存在的共享内存，且不让 resource_tracker 在本进程退出时将其删除。
+    """
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        # Python < 3.13 没有 track 参数
+        shm = shared_memory.SharedMemory(name)
+        if name not in _created:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+class SharedConfig:
+    """
+    保存在共享内存中的一组配置数据 {name: data}，由一个进程发布，多个进程只读地获取。
+
+    头部为 (generation, length)。写入期间 generation 为奇数，写入完成后为偶数；
+    读取前后 generation 相同且为偶数时，读到的数据才是完整的（seqlock）。
+    """
+    HEADER = struct.Struct('<QQ')
+    # 读取时等待写入完成的最长秒数
+    read_timeout = 1.0
+
+    def __init__(self, name: Optional[str] = None, create: bool = False, size: int = 0):
+        if create:
+            self.shm = shared_memory.SharedMemory(name, create=True, size=self.HEADER.size + size)
+            _created.add(self.shm.name)
+            self.HEADER.pack_into(self.shm.buf, 0, 0, 0)
+        else:
+            self.shm = _open_shared_memory(name)
+        self.name = self.shm.name
+        self.capacity = self.shm.size - self.HEADER.size
+        self._lock = threading.Lock()
+        self._decoded: Tuple[int, Optional[Dict[str, Any]]] = (-1, None)
+
+    @classmethod
+    def create(cls, data: Dict[str, Any], name: Optional[str] = None, size: Optional[int] = None) -> 'SharedConfig':
+        """
+        创建共享内存并写入 data。默认预留两倍于当前数据的空间，供之后的 publish 使用。
+        """
+        payload = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+        if size is None:
+            size = max(len(payload) * 2, 4096)
+        shared = cls(name, create=True, size=size)
+        shared._write(payload)
+        return shared
+
+    @property
+    def generation(self) -> int:
+        return self.HEADER.unpack_from(self.shm.buf, 0)[0]
+
+    def publish(self, data: Dict[str, Any]) -> int:
+        """
+        写入新的数据并返回新的 generation。
+        """
+        return self._write(pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def _write(self, payload: bytes) -> int:
+        if len(payload) > self.capacity:
+            raise ValueError(f'shared config {self.name} has {self.capacity} bytes, '
+                             f'but {len(payload)} bytes are needed; create it with a larger size.')
+        with self._lock:
+            buf = self.shm.buf
+            generation = self.generation
+            self.HEADER.pack_into(buf, 0, generation + 1, 0)
+            buf[self.HEADER.size:self.HEADER.size + len(payload)] = payload
+            self.HEADER.pack_into(buf, 0, generation + 2, len(payload))
+        return generation + 2
+
+    def read(self) -> Tuple[int, Dict[str, Any]]:
+        """
+        返回 (generation, data)。generation 未变化时不重新反序列化。
+        """
+        deadline = time.monotonic() + self.read_timeout
+        buf = self.shm.buf
+        while True:
+            generation, length = self.HEADER.unpack_from(buf, 0)
+            decoded_generation, data = self._decoded
+            if generation == decoded_generation:
+                return generation, data
+            if generation % 2 == 0:
+                payload = bytes(buf[self.HEADER.size:self.HEADER.size + length])
+                if self.generation == generation:
+                    data = pickle.loads(payload) if length else {}
+                    self._decoded = (generation, data)
+                    return generation, data
+            if time.monotonic() > deadline:
+                raise TimeoutError(f'shared config {self.name} is being written for too long.')
+            time.sleep(0)
+
+    def get(self, name: str) -> Optional[Any]:
+        return self.read()[1].get(name, None)
+
+    def close(self) -> None:
+        self._decoded = (-1, None)
+        self.shm.close()
+
+    def unlink(self) -> None:
+        """
+        删除共享内存，只应由发布者调用。
+        """
+        self.shm.unlink()
+        _created.discard(self.shm.name)
+
+
+class SharedMemoryAgent:
+    """
+    优先从 SharedConfig 中读取配置，不读取文件；共享内存中没有的配置交给 inner 处理。
+    共享内存只读，保存操作交给 inner；inner 为 None 时忽略保存。
+    """
+
+    def __init__(self, shared: SharedConfig, inner=None):
+        self.shared = shared
+        self.inner = inner
+
+    def __getattr__(self, item):
+        if self.inner is None:
+            raise AttributeError(item)
+        return getattr(self.inner, item)
+
+    @property
+    def writer(self):
+        return self.inner.writer if self.inner is not None else None
+
+    def apply(self, configuration: Configuration, instance, data) -> None:
+        # 发布的数据由 obj2data 得到，需要自定义反序列化。
+        # 反序列化结果在进程内共享，复制一份，避免实例之间共享可变的值。
+        data2obj(instance, copy.deepcopy(data), custom=True)
+
+    def exist(self, configuration: Configuration) -> bool:
+        if self.shared.get(configuration.name) is not None:
+            return True
+        return self.inner is not None and self.inner.exist(configuration)
+
+    def load_cached(self, configuration: Configuration, instance) -> bool:
+        data = self.shared.get(configuration.name)
+        if data is not None:
+            self.apply(configuration, instance, data)
+            return True
+        return self.inner is not None and self.inner.load_cached(configuration, instance)
+
+    def load(self, configuration: Configuration, instance):
+        data = self.shared.get(configuration.name)
+        if data is not None:
+            self.apply(configuration, instance, data)
+            return instance
+        if self.inner is not None:
+            return self.inner.load(configuration, instance)
+
+    def save(self, configuration: Configuration, instance):
+        if self.inner is None:
+            logger.debug(f'ignore saving {configuration.name}: shared config is read-only.')
+            return
+        return self.inner.save(configuration, instance)
+
+    def get_configuration_location(self, configuration: Configuration):
+        if self.inner is None:
+            return None
+        return self.inner.get_configuration_location(configuration)
+
+    def batch(self):
+        if self.inner is None:
+            return nullcontext()
+        return self.inner.batch()
@@ -0,0 +1,109 @@
+import hashlib
+import logging
+import os
+import pickle
+import threading
+from pathlib import Path
+from typing import Optional, Type
+
+from conf_root import instrument
+from conf_root.Configuration import Configuration
+from conf_root.agents.BasicAgent import BasicAgent
+from conf_root.cache import FileStamp
+from conf_root.utils import to_plain
+from conf_root.writer import atomic_write
+
+logger = logging.getLogger(__name__)
+
+# 当前线程最近一次读取的 (快照路径, 数据)。快照路径已区分 agent、配置与文件指纹，
+# 按线程保存使并发的加载不会取走或覆盖彼此的数据。
+_recent = threading.local()
+
+
+class SnapshotMixin:
+    """
+    配置文件仍是唯一的数据来源，解析结果另存为二进制快照（类似 .pyc）。
+    快照以源文件路径、mtime、大小与schema摘要为键；快照有效时不再解析源文件。
+
+    与任意实现了 read 的agent组合使用，见 with_snapshot。
+    """
+    # 快照目录，为 None 时使用agent目录下的 __confcache__
+    snapshot_dir: Optional[str] = None
+    snapshot_suffix = '.pickle'
+
+    def get_snapshot_dir(self) -> Path:
+        return Path(self.snapshot_dir) if self.snapshot_dir is not None else self.path / '__confcache__'
+
+    def _snapshot_prefix(self, configuration: Configuration, location) -> str:
+        source = f'{os.path.abspath(location)}\0{configuration.name}\0{type(self).__qualname__}'
+        return hashlib.sha1(source.encode('utf-8')).hexdigest()[:16]
+
+    def get_snapshot_location(self, configuration: Configuration, location, stamp: FileStamp) -> Path:
+        key = f'{stamp.mtime_ns}\0{stamp.size}\0{stamp.inode}\0{configuration.schema.digest}'
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+        name = f'{self._snapshot_prefix(configuration, location)}-{digest}{self.snapshot_suffix}'
+        return self.get_snapshot_dir() / name
+
+    def _load_snapshot(self, configuration: Configuration):
+        location = self.get_configuration_location(configuration)
+        stamp = FileStamp.of(location)
+        if stamp is None:
+            return None, None
+        snapshot = self.get_snapshot_location(configuration, location, stamp)
+        recent = getattr(_recent, 'snapshot', None)
+        if recent is not None and recent[0] == snapshot:
+            return stamp, recent[1]
+        try:
+            with open(snapshot, 'rb') as f:
+                data = pickle.load(f)
+                instrument.count_bytes('read', f.tell())
+        except FileNotFoundError:
+            return stamp, None
+        except Exception as e:
+            logger.warning(f'ignore broken snapshot {snapshot}: {e}')
+            return stamp, None
+        # exist 之后紧接着 read，记住最近一次读取的快照以免重复反序列化。
+        _recent.snapshot = (snapshot, data)
+        return stamp, data
+
+    def _store_snapshot(self, configuration: Configuration, stamp: FileStamp, data) -> None:
+        # 刚修改过的文件的指纹不可信，不为其生成快照。
+        if stamp.is_racy():
+            return
+        location = self.get_configuration_location(configuration)
+        snapshot = self.get_snapshot_location(configuration, location, stamp)
+        try:
+            content = pickle.dumps(to_plain(data), protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            logger.debug(f'skip snapshot of {configuration.name}: {e}')
+            return
+        snapshot.parent.mkdir(parents=True, exist_ok=True)
+        # 删除同一配置的旧快照
+        prefix = self._snapshot_prefix(configuration, location)
+        for old in snapshot.parent.glob(f'{prefix}-*{self.snapshot_suffix}'):
+            if old != snapshot:
+                old.unlink(missing_ok=True)
+        atomic_write(snapshot, content)
+
+    def exist(self, configuration: Configuration) -> bool:
+        _, data = self._load_snapshot(configuration)
+        if data is not None:
+            return True
+        return super().exist(configuration)
+
+    def read(self, configuration: Configuration):
+        stamp, data = self._load_snapshot(configuration)
+        if data is not None:
+            _recent.snapshot = None
+            return data
+        data = super().read(configuration)
+        if data is not None and stamp is not None:
+            self._store_snapshot(configuration, stamp, data)
+        return data
+
+
+def with_snapshot(agent_class: Type[BasicAgent], snapshot_dir: Optional[str] = None) -> Type[BasicAgent]:
+    """
+    为 agent_class 加上二进制快照缓存，例如 ConfRoot(agent_class=with_snapshot(YamlAgent))。
+    """
+    return type(f'Snapshot{agent_class.__name__}', (SnapshotMixin, agent_class), {'snapshot_dir': snapshot_dir})
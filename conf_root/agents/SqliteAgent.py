@@ -0,0 +1,144 @@
+import sqlite3
+import threading
+import weakref
+from typing import Optional, List, Tuple, Any, Dict, Iterable, Set
+
+from conf_root import events, instrument
+from conf_root.Configuration import Configuration
+from conf_root.agents.BasicAgent import BasicAgent, OneFileAgent
+from conf_root.agents.JsonAgent import JsonBackend, get_json_backend
+from conf_root.utils import data2obj, obj2data
+
+# 单条 SQL 中参数个数的上限（SQLITE_MAX_VARIABLE_NUMBER 的保守取值）
+_MAX_VARIABLES = 500
+# fsync 策略对应的 synchronous 设置
+_SYNCHRONOUS = {'none': 'NORMAL', 'file': 'FULL', 'full': 'FULL'}
+
+
+class _ConnectionHolder:
+    # 作为 threading.local 中的值，线程结束时被回收，随之关闭其连接
+    __slots__ = ('connection', '__weakref__')
+
+    def __init__(self, connection: sqlite3.Connection):
+        self.connection = connection
+
+
+def _close_connection(connections: Set[sqlite3.Connection], lock: threading.Lock,
+                      connection: sqlite3.Connection) -> None:
+    with lock:
+        connections.discard(connection)
+    connection.close()
+
+
+class SqliteAgent(BasicAgent, OneFileAgent):
+    """
+    将全部配置保存在一个SQLite数据库中，每个配置一行，以配置名为主键。
+    数据以JSON保存。数据库使用WAL模式，每个线程使用各自的连接，线程结束时关闭。
+    """
+    default_extension: str = '.db'
+    table: str = 'conf_root'
+    # 数据库文件的 mtime 不能反映某个配置是否变化（WAL模式下甚至不会改变），不使用文件缓存。
+    cache = None
+    # 同理无法由文件指纹判断配置是否被修改，每次保存都写入。
+    skip_unchanged = False
+    # 为 None 时自动选择已安装的最快JSON后端
+    backend: Optional[JsonBackend] = None
+
+    def __init__(self, location):
+        super().__init__(location)
+        self._local = threading.local()
+        self._connections: Set[sqlite3.Connection] = set()
+        self._connections_lock = threading.Lock()
+
+    def get_backend(self) -> JsonBackend:
+        return self.backend if self.backend is not None else get_json_backend()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        holder = getattr(self._local, 'holder', None)
+        if holder is not None:
+            return holder.connection
+        connection = sqlite3.connect(self.location, timeout=30, check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute(f'PRAGMA synchronous={_SYNCHRONOUS.get(self.fsync, "NORMAL")}')
+        connection.execute(f'CREATE TABLE IF NOT EXISTS {self.table} (name TEXT PRIMARY KEY, data BLOB NOT NULL)')
+        holder = _ConnectionHolder(connection)
+        with self._connections_lock:
+            self._connections.add(connection)
+        # 不引用 agent 本身，线程结束时关闭连接
+        weakref.finalize(holder, _close_connection, self._connections, self._connections_lock, connection)
+        self._local.holder = holder
+        return connection
+
+    def close(self) -> None:
+        """
+        关闭所有线程的连接。之后的访问会重新建立连接。
+        """
+        with self._connections_lock:
+            connections = list(self._connections)
+            self._connections.clear()
+        for connection in connections:
+            connection.close()
+        self._local = threading.local()
+
+    def exist(self, configuration: Configuration) -> bool:
+        row = self.connection.execute(f'SELECT 1 FROM {self.table} WHERE name = ?', (configuration.name,)).fetchone()
+        return row is not None
+
+    def read(self, configuration: Configuration):
+        row = self.connection.execute(f'SELECT data FROM {self.table} WHERE name = ?',
+                                      (configuration.name,)).fetchone()
+        if row is None:
+            return None
+        instrument.count_bytes('read', row[0])
+        return self.get_backend().loads(row[0])
+
+    def apply(self, configuration: Configuration, instance, data):
+        data2obj(instance, data, custom=True)
+
+    def write(self, configuration: Configuration, instance) -> None:
+        self.commit(self.location, [(configuration, instance)])
+
+    def commit(self, location, items: List[Tuple[Configuration, Any]]) -> None:
+        dumps = self.get_backend().dumps
+        rows = [(configuration.name, dumps(obj2data(instance))) for configuration, instance in items]
+        with self.connection:
+            self.connection.executemany(f'INSERT OR REPLACE INTO {self.table} (name, data) VALUES (?, ?)', rows)
+        instrument.count_bytes('written', sum(len(data) for _, data in rows))
+
+    def flush_batch(self, pending: Dict[Tuple[Any, str], Tuple[Configuration, Any]]) -> None:
+        # 全部配置在同一事务中写入，失败时由数据库回滚，无需备份文件。
+        if pending:
+            self.commit(self.location, list(pending.values()))
+        for configuration, _ in pending.values():
+            events.notify(configuration)
+
+    def save_many(self, items: Iterable[Tuple[Configuration, Any]]) -> None:
+        """
+        在一个事务中保存多个配置。
+        """
+        with self.batch():
+            for configuration, instance in items:
+                self.save(configuration, instance)
+
+    def load_many(self, items: Iterable[Tuple[Configuration, Any]]) -> List[Tuple[Configuration, Any]]:
+        """
+        批量加载多个配置，返回数据库中不存在的 (configuration, instance)。
+        """
+        items = list(items)
+        loads = self.get_backend().loads
+        found = {}
+        for start in range(0, len(items), _MAX_VARIABLES):
+            names = [configuration.name for configuration, _ in items[start:start + _MAX_VARIABLES]]
+            placeholders = ', '.join('?' * len(names))
+            cursor = self.connection.execute(f'SELECT name, data FROM {self.table} WHERE name IN ({placeholders})',
+                                             names)
+            found.update(cursor.fetchall())
+        missing = []
+        for configuration, instance in items:
+            data = found.get(configuration.name)
+            if data is None:
+                missing.append((configuration, instance))
+            else:
+                self.apply(configuration, instance, loads(data))
+        return missing
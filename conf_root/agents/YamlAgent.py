@@ -1,80 +1,471 @@
+import copy
 import dataclasses
 import os.path
-from ruamel.yaml import YAML, CommentedMap
+import re
+import threading
+import weakref
+from io import StringIO
+from typing import Tuple, Dict, Any, Optional, List, TYPE_CHECKING
 
-from conf_root.Configuration import Configuration, is_config_class
+from conf_root import instrument
+from conf_root.Configuration import Configuration, is_config_class, schema_of
 from conf_root.agents.BasicAgent import BasicAgent, OneFileAgent
+from conf_root.cache import FileStamp
 from conf_root.utils import data2obj
+from conf_root.writer import atomic_write
+
+# ruamel.yaml 较重，在首次读写YAML时才在函数中导入
+if TYPE_CHECKING:
+    from ruamel.yaml import YAML, CommentedMap
 
 
 def make_serializer(cls):
     name = cls.__CONF_ROOT__.name
+    schema = schema_of(cls)
+    deserialize_fields = [field for field in schema.fields if field.deserialize is not None]
+
+    from ruamel.yaml import CommentedMap
 
     def config_class_representer(dumper, data):
         data_dict = CommentedMap()
-        for field in dataclasses.fields(data):
+        for field in schema.fields:
             value = getattr(data, field.name)
-            if 'serialize' in field.metadata:
-                serialize_func = field.metadata['serialize']
-                data_dict[field.name] = serialize_func(value)
+            if field.serialize is not None:
+                data_dict[field.name] = field.serialize(value)
             else:
                 data_dict[field.name] = value
-            if 'comment' in field.metadata:
-                data_dict.yaml_add_eol_comment(field.metadata['comment'], key=field.name)
+            if field.comment is not None:
+                data_dict.yaml_add_eol_comment(field.comment, key=field.name)
         return dumper.represent_mapping(f'!{name}', data_dict)
 
     def config_class_constructor(loader, node):
         data_dict = loader.construct_yaml_map(node)
         data_dict = list(data_dict)[0]
         # 遍历dataclass的字段，应用自定义反序列化逻辑
-        for field in dataclasses.fields(cls):
-            if 'deserialize' in field.metadata:
-                deserialize_func = field.metadata['deserialize']
-                data_dict[field.name] = deserialize_func(data_dict[field.name])
+        for field in deserialize_fields:
+            if field.name in data_dict:
+                data_dict[field.name] = field.deserialize(data_dict[field.name])
         # return cls(**data_dict)
         return data_dict
 
     return config_class_representer, config_class_constructor
 
 
+def make_yaml(classes) -> 'YAML':
+    from ruamel.yaml import YAML
+    from ruamel.yaml.constructor import RoundTripConstructor
+    from ruamel.yaml.representer import RoundTripRepresenter
+
+    yaml = YAML()
+    # add_representer/add_constructor 是类方法，使用独立的子类以免注册到全局的表中。
+    yaml.Representer = type('Representer', (RoundTripRepresenter,), {})
+    yaml.Constructor = type('Constructor', (RoundTripConstructor,), {})
+    yaml.preserve_quotes = True
+    yaml.indent(mapping=2, sequence=4, offset=2)
+
+    for cls in classes:
+        if is_config_class(cls):
+            # 'tag:yaml.org,2002:map'
+            name = cls.__CONF_ROOT__.name
+            representer, constructor = make_serializer(cls)
+            yaml.representer.add_representer(cls, representer)
+            yaml.constructor.add_constructor(f'!{name}', constructor)
+        else:  # 就是普通的dataclass
+            yaml.register_class(cls)
+    return yaml
+
+
+class YamlEngine:
+    """
+    为一组dataclass配置好的YAML对象。ruamel的YAML对象不可重入，load/dump时持有锁。
+    """
+
+    def __init__(self, classes: Tuple):
+        self.classes = classes
+        self.yaml = make_yaml(classes)
+        self.lock = threading.Lock()
+
+    def load(self, stream):
+        with self.lock:
+            return self.yaml.load(stream)
+
+    def dump(self, data, stream):
+        with self.lock:
+            self.yaml.dump(data, stream)
+
+
+_engines = weakref.WeakKeyDictionary()
+_engines_lock = threading.Lock()
+
+
+def get_engine(configuration: Configuration) -> YamlEngine:
+    """
+    返回 configuration 对应的 YamlEngine。涉及的dataclass发生变化时重新构建。
+    """
+    classes = configuration.all_dataclass
+    engine = _engines.get(configuration)
+    if engine is None or engine.classes != classes:
+        with _engines_lock:
+            engine = _engines.get(configuration)
+            if engine is None or engine.classes != classes:
+                engine = YamlEngine(classes)
+                _engines[configuration] = engine
+    return engine
+
+
+def discard_engine(configuration: Configuration) -> None:
+    """
+    丢弃 configuration 对应的 YamlEngine，下次使用时按当前的字段定义重新构建。
+    """
+    with _engines_lock:
+        _engines.pop(configuration, None)
+
+
 class YamlAgent(BasicAgent):
     default_extension = '.yml'
 
     @staticmethod
-    def get_yaml(configuration: Configuration):
-        yaml = YAML()
-        yaml.preserve_quotes = True
-        yaml.indent(mapping=2, sequence=4, offset=2)
-
-        for cls in configuration.all_dataclass:
-            if is_config_class(cls):
-                # 'tag:yaml.org,2002:map'
-                name = cls.__CONF_ROOT__.name
-                representer, constructor = make_serializer(cls)
-                yaml.representer.add_representer(cls, representer)
-                yaml.constructor.add_constructor(f'!{name}', constructor)
-            else:  # 就是普通的dataclass
-                yaml.register_class(cls)
-        return yaml
-
-    def load(self, configuration, instance):
-        super().load(configuration, instance)
+    def get_yaml(configuration: Configuration) -> 'YAML':
+        # 构建一个新的YAML对象；agent内部使用 get_engine 获取缓存的版本。
+        return make_yaml(configuration.all_dataclass)
+
+    def read(self, configuration):
         location = self.get_configuration_location(configuration)
         if not os.path.exists(location):
-            return
+            return None
         with open(location, encoding='utf-8') as file:
-            # 将dict展开为对象。
-            data = self.get_yaml(configuration).load(file)
-        # 覆盖原instance中的变量:
-        data2obj(instance, data)
-        return instance
-
-    def save(self, configuration, instance):
-        super().save(configuration, instance)
+            content = file.read()
+        instrument.count_bytes('read', content)
+        # 将dict展开为对象。
+        return get_engine(configuration).load(content)
+
+    def write(self, configuration, instance):
         location = self.get_configuration_location(configuration)
         # 将dict转换为YAML并写入文件
-        with open(location, "w") as file:
-            self.get_yaml(configuration).dump(instance, file)
+        stream = StringIO()
+        get_engine(configuration).dump(instance, stream)
+        self.write_text(location, stream.getvalue())
+
+
+def to_section(value):
+    """
+    将实例转换为带tag与注释的CommentedMap，使其无需注册representer即可写入共享文档。
+    """
+    if is_config_class(value):
+        from ruamel.yaml import CommentedMap
+        from ruamel.yaml.tag import Tag
+
+        data_dict = CommentedMap()
+        for field in schema_of(type(value)).fields:
+            field_value = getattr(value, field.name)
+            if field.serialize is not None:
+                data_dict[field.name] = field.serialize(field_value)
+            else:
+                data_dict[field.name] = to_section(field_value)
+            if field.comment is not None:
+                data_dict.yaml_add_eol_comment(field.comment, key=field.name)
+        data_dict.yaml_set_ctag(Tag(suffix=f'!{value.__CONF_ROOT__.name}'))
+        return data_dict
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        from ruamel.yaml import CommentedMap
+        from ruamel.yaml.tag import Tag
+
+        # 与 YAML.register_class 的表示方式一致
+        data_dict = CommentedMap((k, to_section(v)) for k, v in vars(value).items())
+        data_dict.yaml_set_ctag(Tag(suffix=f'!{value.__class__.__name__}'))
+        return data_dict
+    if isinstance(value, list):
+        return [to_section(v) for v in value]
+    return value
+
+
+def construct_dataclasses(cls, data):
+    """
+    按字段类型将普通dataclass对应的映射还原为实例；配置类交由 data2obj 处理。
+    """
+    for field in schema_of(cls).fields:
+        value = data.get(field.name, None)
+        if isinstance(value, dict) and field.is_dataclass:
+            value = construct_dataclasses(field.type, value)
+            if not field.is_config:
+                # 与 YAML.register_class 的构造方式一致，不调用 __init__
+                obj = field.type.__new__(field.type)
+                obj.__dict__.update(value)
+                value = obj
+            data[field.name] = value
+    return data
+
+
+# 锚点与别名会让多个section相互引用，此时只能整体写回
+_ANCHOR = re.compile(r'(?:^|[\s\[{,])[&*][^\s\[\]{},]')
+
+
+class _Section:
+    """
+    section在文档文本中的位置：start 为键所在行，end 为其内容之后的第一行（不含之后的空行与顶格注释）。
+    解析得到的行号减去 origin 再加上 start，即为在当前文本中的行号。
+    """
+    __slots__ = ('start', 'end', 'origin')
+
+    def __init__(self, start: int, end: int, origin: int):
+        self.start = start
+        self.end = end
+        self.origin = origin
+
+
+def _is_scalar(value) -> bool:
+    return value is None or isinstance(value, (str, int, float))
+
+
+def _same(old, new) -> bool:
+    # 1 == 1.0 == True，但写出的文本不同
+    return (old == new and isinstance(old, bool) == isinstance(new, bool)
+            and isinstance(old, float) == isinstance(new, float)
+            and isinstance(old, str) == isinstance(new, str))
+
+
+def _tag_of(value) -> Optional[str]:
+    tag = getattr(value, 'tag', None)
+    return getattr(tag, 'value', None)
+
+
+def _flow_style(value) -> bool:
+    fa = getattr(value, 'fa', None)
+    return fa is None or bool(fa.flow_style())
+
+
+def _diff_scalars(old, new, changes: List) -> bool:
+    """
+    比较文档中的旧section与新section，将变化的标量叶子以 (父节点, 键, 新值) 追加到 changes。
+    结构（键、顺序、列表长度、tag、标量与容器）不同时返回 False。
+    """
+    if isinstance(new, dict):
+        if (not isinstance(old, dict) or list(old) != list(new)
+                or _tag_of(old) != _tag_of(new) or _flow_style(old)):
+            return False
+        pairs = [(key, old[key], new[key]) for key in new]
+    elif isinstance(new, list):
+        if not isinstance(old, list) or len(old) != len(new) or _flow_style(old):
+            return False
+        pairs = [(i, o, n) for i, (o, n) in enumerate(zip(old, new))]
+    else:
+        return False
+    for key, old_value, new_value in pairs:
+        if _is_scalar(old_value) and _is_scalar(new_value):
+            if not _same(old_value, new_value):
+                changes.append((old, key, new_value))
+        elif _is_scalar(old_value) or _is_scalar(new_value):
+            return False
+        elif not _diff_scalars(old_value, new_value, changes):
+            return False
+    return True
+
+
+def _has_multiline(value) -> bool:
+    if isinstance(value, str):
+        return '\n' in value
+    if isinstance(value, dict):
+        return any(_has_multiline(v) for v in value.values())
+    if isinstance(value, list):
+        return any(_has_multiline(v) for v in value)
+    return False
+
+
+def _content_end(lines: List[str], start: int, end: int) -> int:
+    # section之间的空行与顶格注释通常属于下一个section，替换时保留原样
+    while end > start + 1 and (not lines[end - 1].strip() or lines[end - 1].startswith('#')):
+        end -= 1
+    return end
+
+
+class SharedDocument:
+    """
+    同一位置的单文件YAML在进程内只解析一次，由所有指向它的配置共享，文件的stat变化时重新解析。
+
+    文档不注册任何配置类，各section以带tag的CommentedMap保存，写回时保持原样。
+    写回时只改动发生变化的section：仅标量改变时按位置原地替换，否则只重新生成该section的文本。
+    无法定位section（锚点、非顶格的键等）时整体写回。
+    """
+
+    def __init__(self, location):
+        self.location = location
+        self.engine = YamlEngine(())
+        self.lock = threading.RLock()
+        self.stamp: Optional[FileStamp] = None
+        self.text: Optional[str] = None
+        self.data: Optional['CommentedMap'] = None
+        self.lines: List[str] = []
+        # {section名: _Section}，为 None 时只能整体写回
+        self.sections: Optional[Dict[str, _Section]] = None
+
+    def _read_text(self) -> Optional[str]:
+        try:
+            with open(self.location, 'r', encoding='utf-8') as f:
+                text = f.read()
+        except FileNotFoundError:
+            return None
+        instrument.count_bytes('read', text)
+        return text
+
+    def _index(self, data, text: Optional[str]) -> Optional[Dict[str, _Section]]:
+        """
+        根据解析结果记录各section在文本中的行范围。
+        """
+        if not text:
+            return {}
+        if not hasattr(data, 'lc') or _ANCHOR.search(text):
+            return None
+        starts = []
+        for name in data:
+            line, column = data.lc.key(name)
+            if not isinstance(name, str) or column != 0 or (starts and line <= starts[-1]):
+                return None
+            starts.append(line)
+        sections = {}
+        for i, name in enumerate(data):
+            start = starts[i]
+            end = starts[i + 1] if i + 1 < len(starts) else len(self.lines)
+            if not _has_multiline(data[name]):
+                end = _content_end(self.lines, start, end)
+            sections[name] = _Section(start, end, start)
+        return sections
+
+    def refresh(self) -> 'CommentedMap':
+        """
+        返回最新的文档内容，仅在文件发生变化时重新解析。
+        """
+        with self.lock:
+            stamp = FileStamp.of(self.location)
+            if self.data is not None and stamp == self.stamp:
+                if stamp is None or not stamp.is_racy():
+                    return self.data
+                # 指纹可能来不及反映刚发生的修改，改为比较文件内容。
+                text = self._read_text()
+                if text == self.text:
+                    return self.data
+            else:
+                text = self._read_text() if stamp is not None else None
+            data = self.engine.load(text) if text else None
+            if data is None:
+                from ruamel.yaml import CommentedMap
+                data = CommentedMap()
+            self.data = data
+            self.text = text
+            self.stamp = stamp
+            self.lines = text.splitlines(keepends=True) if text else []
+            self.sections = self._index(data, text)
+            return self.data
+
+    def _format_scalar(self, value) -> Optional[str]:
+        # 借助 dump 得到与整体写回一致的标量文本（引号、浮点格式等）；需要多行时返回 None
+        if value is None or not _is_scalar(value):
+            return None
+        stream = StringIO()
+        self.engine.dump({'x': value}, stream)
+        text = stream.getvalue()
+        if not text.startswith('x: ') or text.count('\n') != 1 or not text.endswith('\n'):
+            return None
+        return text[3:-1]
+
+    def _patch_scalars(self, name: str, section) -> bool:
+        """
+        仅有标量变化时，在原有文本中就地替换这些值，返回是否成功。
+        """
+        old = self.data[name]
+        changes = []
+        if not _diff_scalars(old, section, changes):
+            return False
+        position = self.sections[name]
+        patches = {}
+        for parent, key, value in changes:
+            line, column = parent.lc.value(key) if isinstance(parent, dict) else parent.lc.item(key)
+            line += position.start - position.origin
+            old_text = self._format_scalar(parent[key])
+            new_text = self._format_scalar(value)
+            if old_text is None or new_text is None or line in patches or not position.start < line < position.end:
+                return False
+            text = self.lines[line]
+            rest = text[column + len(old_text):].strip()
+            if text[column:column + len(old_text)] != old_text or (rest and not rest.startswith('#')):
+                return False
+            patches[line] = (column, old_text, new_text)
+        for line, (column, old_text, new_text) in patches.items():
+            text = self.lines[line]
+            self.lines[line] = text[:column] + new_text + text[column + len(old_text):]
+        for parent, key, value in changes:
+            parent[key] = value
+        return True
+
+    def _replace_section(self, name: str, section) -> None:
+        """
+        重新生成一个section的文本并替换原有的行；文档中没有该section时追加到末尾。
+        """
+        from ruamel.yaml import CommentedMap
+
+        stream = StringIO()
+        self.engine.dump(CommentedMap([(name, section)]), stream)
+        chunk = stream.getvalue()
+        # 重新解析这一段，使后续的原地替换能够定位其中的值
+        parsed = self.engine.load(chunk)
+        chunk_lines = chunk.splitlines(keepends=True)
+        position = self.sections.get(name)
+        if position is None:
+            start = end = len(self.lines)
+            if self.lines and not self.lines[-1].endswith('\n'):
+                self.lines[-1] += '\n'
+        else:
+            start, end = position.start, position.end
+        self.lines[start:end] = chunk_lines
+        delta = len(chunk_lines) - (end - start)
+        for other in self.sections.values():
+            if other.start >= end:
+                other.start += delta
+                other.end += delta
+        self.sections[name] = _Section(start, start + len(chunk_lines), parsed.lc.key(name)[0])
+        self.data[name] = parsed[name]
+
+    def update(self, sections: Dict[str, Any], fsync: str = 'none', skip_unchanged: bool = True) -> None:
+        """
+        替换若干section并写回文件。skip_unchanged 为 True 时，内容与文件相同则不写入。
+        """
+        with self.lock:
+            data = self.refresh()
+            try:
+                if self.sections is None:
+                    for name, section in sections.items():
+                        data[name] = section
+                    stream = StringIO()
+                    self.engine.dump(data, stream)
+                    text = stream.getvalue()
+                else:
+                    for name, section in sections.items():
+                        if name not in self.sections or not self._patch_scalars(name, section):
+                            self._replace_section(name, section)
+                    text = ''.join(self.lines)
+                # refresh 保证 self.text 与文件当前的内容一致
+                if skip_unchanged and text == self.text:
+                    return
+                atomic_write(self.location, text, fsync=fsync)
+            except BaseException:
+                # 内存中的文档可能已与文件不一致，下次使用时重新解析
+                self.data = None
+                raise
+            instrument.count_bytes('written', text)
+            self.text = text
+            self.stamp = FileStamp.of(self.location)
+
+
+_documents: Dict[str, SharedDocument] = {}
+_documents_lock = threading.Lock()
+
+
+def get_document(location) -> SharedDocument:
+    key = os.path.abspath(location)
+    document = _documents.get(key)
+    if document is None:
+        with _documents_lock:
+            document = _documents.setdefault(key, SharedDocument(key))
+    return document
 
 
 class SingleFileYamlAgent(YamlAgent, OneFileAgent):
@@ -83,31 +474,33 @@ class SingleFileYamlAgent(YamlAgent, OneFileAgent):
     """
     default_extension: str = '.yml'
 
+    @property
+    def document(self) -> SharedDocument:
+        return get_document(self.location)
+
     def exist(self, configuration: Configuration) -> bool:
-        if not os.path.exists(self.location):
-            return False
-        data = self._load(configuration)
-        return configuration.name in data
+        return configuration.name in self.document.refresh()
 
-    def _load(self, configuration):
-        if not os.path.exists(self.location):
-            return {}
-        with open(self.location, 'r') as f:
-            data = self.get_yaml(configuration).load(f)
-        return data if data is not None else {}
-
-    def load(self, configuration: Configuration, instance):
-        BasicAgent.load(self, configuration, instance)
-        res = self._load(configuration)
-        data = res[configuration.name]
-        # 覆盖原instance中的变量
-        data2obj(instance, data)
-        return instance
-
-    def save(self, configuration: Configuration, instance) -> None:
-        BasicAgent.save(self, configuration, instance)
-        total_data = self._load(configuration)
-        total_data[configuration.name] = instance
-
-        with open(self.location, 'w') as f:
-            self.get_yaml(configuration).dump(total_data, f)
+    def read(self, configuration: Configuration):
+        document = self.document
+        with document.lock:
+            data = document.refresh().get(configuration.name, None)
+            # 复制一份，避免实例与共享文档之间共享可变的值。
+            return copy.deepcopy(data)
+
+    def apply(self, configuration: Configuration, instance, data):
+        # section 未经配置类的构造器处理，由 data2obj 完成自定义反序列化。
+        data2obj(instance, construct_dataclasses(configuration.cls, data), custom=True)
+
+    def write(self, configuration: Configuration, instance) -> None:
+        self.document.update({configuration.name: to_section(instance)}, fsync=self.fsync,
+                             skip_unchanged=self.skip_unchanged)
+
+    def commit(self, location, items) -> None:
+        # 所有section只需一次写入
+        try:
+            sections = {configuration.name: to_section(instance) for configuration, instance in items}
+            self.document.update(sections, fsync=self.fsync, skip_unchanged=self.skip_unchanged)
+        finally:
+            if self.cache is not None:
+                self.cache.invalidate(location)
@@ -0,0 +1,90 @@
+import contextvars
+import functools
+import os
+import threading
+from contextlib import contextmanager
+from typing import Optional, List, Dict, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from concurrent.futures import Executor
+
+# 不为 None 时，配置类的 __init__ 不进行任何读写，只将实例按初始化完成的顺序记录在其中，
+# 由调用者在事件循环之外完成加载。
+_io_deferred: contextvars.ContextVar[Optional[List]] = contextvars.ContextVar('conf_root_io_deferred', default=None)
+
+# 执行文件读写与解析的线程数上限
+max_workers = min(8, (os.cpu_count() or 1) + 4)
+
+_executor: Optional['Executor'] = None
+# 指定了线程数的线程池 {线程数: executor}，创建后一直复用
+_sized_executors: Dict[int, 'Executor'] = {}
+_executor_lock = threading.Lock()
+
+
+def get_executor(workers: Optional[int] = None) -> 'Executor':
+    """
+    返回执行读写的线程池。workers 为 None 时使用默认的线程池，否则返回该线程数的共享线程池。
+    """
+    global _executor
+    from concurrent.futures import ThreadPoolExecutor
+    if workers is not None:
+        executor = _sized_executors.get(workers)
+        if executor is None:
+            with _executor_lock:
+                executor = _sized_executors.get(workers)
+                if executor is None:
+                    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'conf-root-io-{workers}')
+                    _sized_executors[workers] = executor
+        return executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='conf-root-io')
+    return _executor
+
+
+def set_executor(executor: Optional['Executor']) -> None:
+    """
+    指定执行读写的 executor；为 None 时在下次使用时重新创建默认的线程池。
+    """
+    global _executor
+    with _executor_lock:
+        _executor = executor
+
+
+def io_deferred() -> bool:
+    return _io_deferred.get() is not None
+
+
+def defer(instance) -> bool:
+    """
+    读写被推迟时记录 instance 并返回 True。
+    """
+    deferred = _io_deferred.get()
+    if deferred is None:
+        return False
+    deferred.append(instance)
+    return True
+
+
+@contextmanager
+def defer_io():
+    """
+    在其中实例化的配置类（包括 default_factory 创建的嵌套配置）不进行读写，返回记录这些实例的列表。
+    """
+    deferred = []
+    token = _io_deferred.set(deferred)
+    try:
+        yield deferred
+    finally:
+        _io_deferred.reset(token)
+
+
+async def run(func, *args, **kwargs):
+    """
+    在 executor 中执行 func，不阻塞事件循环。
+    """
+    import asyncio
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_executor(), functools.partial(context.run, func, *args, **kwargs))
@@ -0,0 +1,215 @@
+import asyncio
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from typing import Dict, Type, Optional, Set
+
+from conf_root import events
+from conf_root.run_http import EditorApp, Response
+from conf_root.watcher import get_watcher
+
+logger = logging.getLogger(__name__)
+
+
+class Headers(dict):
+    """
+    不区分大小写的请求头，提供与 http.server 中 headers.get 相同的接口。
+    """
+
+    def get(self, key, default=None):
+        return super().get(key.lower(), default)
+
+
+class AsyncEditorServer:
+    """
+    基于 asyncio 的网页编辑服务器，在 EditorApp 之外提供 /events 的 Server-Sent Events。
+
+    - 每个连接只是一个协程，空闲连接几乎不占资源；阻塞的读写交给线程池。
+    - 配置经 agent 保存（包括网页与 API 的修改）或文件在外部被修改时，向所有 /events 的连接推送
+      `event: change` 与 {"name": 类名, "etag": ETag}。ETag 与 /api/<name> 的相同，内容未变化时不推送。
+    """
+    # /events 的心跳间隔（秒），用于发现已断开的连接
+    heartbeat = 15.0
+    # 每个 /events 连接可积压的消息数，超出时断开该连接
+    queue_size = 64
+
+    def __init__(self, app: EditorApp, max_workers: int = 32, watch: bool = True):
+        self.app = app
+        self.watch = watch
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='conf-root-http')
+        self.classes: Dict[object, Type] = {}
+        for cls in app.forms:
+            self.classes[cls.__CONF_ROOT__] = cls
+        self.clients: Set[asyncio.Queue] = set()
+        self.etags: Dict[Type, str] = {}
+        self._locks: Dict[Type, asyncio.Lock] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.server: Optional[asyncio.AbstractServer] = None
+        self._probes = []
+
+    async def start(self, host='127.0.0.1', port=8080):
+        self.loop = asyncio.get_running_loop()
+        events.subscribe(self._on_event)
+        for cls in self.classes.values():
+            self.etags[cls] = await self.run(self.current_etag, cls)
+        if self.watch:
+            await self.run(self._watch_files)
+        self.server = await asyncio.start_server(self.handle_connection, host, port)
+        return self.server
+
+    async def close(self):
+        events.unsubscribe(self._on_event)
+        watcher = get_watcher()
+        for probe in self._probes:
+            watcher.unwatch(probe)
+        self._probes.clear()
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        for queue in list(self.clients):
+            self._disconnect(queue)
+        self.executor.shutdown(wait=False)
+
+    async def run(self, func, *args):
+        return await self.loop.run_in_executor(self.executor, func, *args)
+
+    def current_etag(self, cls) -> str:
+        _, etag = self.app.api_representation(cls)
+        return etag
+
+    def _watch_files(self):
+        # 为每个配置类持有一个实例，由 Watcher 在文件变化时更新并回调。
+        watcher = get_watcher()
+        for configuration, cls in self.classes.items():
+            probe = self.app.load_instance(cls)
+            try:
+                watcher.watch(probe, lambda instance, changes, c=configuration: self._on_event(c, 'change'))
+            except ValueError:
+                continue
+            self._probes.append(probe)
+
+    def _on_event(self, configuration, event):
+        # 可能在任意线程中被调用
+        if configuration not in self.classes or self.loop is None or self.loop.is_closed():
+            return
+        self.loop.call_soon_threadsafe(self._schedule, self.classes[configuration])
+
+    def _schedule(self, cls):
+        task = self.loop.create_task(self._publish(cls))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _publish(self, cls):
+        # 同一配置的通知依次处理，避免较早读到的旧内容覆盖新内容
+        lock = self._locks.setdefault(cls, asyncio.Lock())
+        async with lock:
+            try:
+                etag = await self.run(self.current_etag, cls)
+            except Exception:
+                logger.exception(f'failed to read {cls.__name__}')
+                return
+            if self.etags.get(cls) == etag:
+                return
+            self.etags[cls] = etag
+        message = f'event: change\ndata: {json.dumps({"name": cls.__name__, "etag": etag})}\n\n'.encode('utf-8')
+        for queue in list(self.clients):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # 读取太慢的客户端
+                self._disconnect(queue)
+
+    def _disconnect(self, queue: asyncio.Queue):
+        self.clients.discard(queue)
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(None)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, path, version = lines[0].split(' ', 2)
+                except ValueError:
+                    await self.write_response(writer, Response(400, [], b''), close=True)
+                    break
+                headers = Headers()
+                for line in lines[1:]:
+                    if ':' in line:
+                        key, value = line.split(':', 1)
+                        headers[key.strip().lower()] = value.strip()
+                try:
+                    length = int(headers.get('Content-Length') or 0)
+                    if length < 0:
+                        raise ValueError(length)
+                except ValueError:
+                    # 无法确定请求体的边界，回复后关闭连接
+                    await self.write_response(writer, Response(400, [], b''), close=True)
+                    break
+                body = await reader.readexactly(length) if length else b''
+                close = (version == 'HTTP/1.0' or headers.get('Connection', '').lower() == 'close')
+
+                if method == 'GET' and path.split('?', 1)[0] == '/events':
+                    await self.stream_events(writer)
+                    break
+                try:
+                    response = await self.run(self.app.handle, method, path, headers, body)
+                except Exception:
+                    logger.exception(f'failed to handle {method} {path}')
+                    response = Response(500, [], b'')
+                await self.write_response(writer, response, close)
+                if close:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def write_response(writer: asyncio.StreamWriter, response: Response, close: bool = False):
+        lines = [f'HTTP/1.1 {response.status} {HTTPStatus(response.status).phrase}']
+        lines += [f'{key}: {value}' for key, value in response.headers]
+        lines.append(f'Content-Length: {len(response.body)}')
+        if close:
+            lines.append('Connection: close')
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + response.body)
+        await writer.drain()
+
+    async def stream_events(self, writer: asyncio.StreamWriter):
+        writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n'
+                     b'Connection: keep-alive\r\n\r\n: connected\n\n')
+        await writer.drain()
+        queue = asyncio.Queue(self.queue_size)
+        self.clients.add(queue)
+        try:
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    message = b': ping\n\n'
+                if message is None:
+                    break
+                writer.write(message)
+                await writer.drain()
+        finally:
+            self.clients.discard(queue)
+
+
+def run_async_http(forms, host='127.0.0.1', port=8080, max_workers: int = 32):
+    async def main():
+        server = AsyncEditorServer(EditorApp(forms), max_workers=max_workers)
+        await server.start(host, port)
+        print(f'Starting asyncio server on http://{host}:{port}/ ...')
+        try:
+            await server.server.serve_forever()
+        finally:
+            await server.close()
+
+    asyncio.run(main())
@@ -0,0 +1,106 @@
+import copy
+import os
+import threading
+import time
+import weakref
+from typing import NamedTuple, Optional, Any
+
+# mtime 距今小于该秒数的文件视为 racy，其指纹不可信。
+RACY_WINDOW = 2.0
+
+
+class FileStamp(NamedTuple):
+    """
+    文件的 stat 指纹，用于判断缓存的解析结果是否仍然有效。
+    """
+    mtime_ns: int
+    size: int
+    inode: int
+
+    @classmethod
+    def of(cls, location) -> Optional['FileStamp']:
+        try:
+            st = os.stat(location)
+        except OSError:
+            return None
+        return cls(st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def is_racy(self, window: float = RACY_WINDOW) -> bool:
+        # 文件系统的 mtime 精度有限，刚写入的文件可能在同一时间片内再次被修改而指纹不变。
+        # 与 git 的 racy-clean 处理相同：mtime 离现在太近的指纹不可信。
+        return time.time_ns() - self.mtime_ns < window * 1e9
+
+
+class _Entry:
+    __slots__ = ('location', 'stamp', 'data', 'checked_at')
+
+    def __init__(self, location, stamp, data, checked_at):
+        self.location = location
+        self.stamp = stamp
+        self.data = data
+        self.checked_at = checked_at
+
+
+class DataCache:
+    """
+    进程级的解析数据缓存，以 Configuration 为键，以文件的 (mtime_ns, size, inode) 校验。
+
+    - ttl: 在上次校验后的 ttl 秒内直接命中，不再 stat 文件。默认为0，即每次都 stat。
+    - racy_window: mtime 距今小于该秒数的文件不进入缓存。
+    """
+
+    def __init__(self, ttl: float = 0.0, racy_window: float = RACY_WINDOW):
+        self.ttl = ttl
+        self.racy_window = racy_window
+        self.hits = 0
+        self.misses = 0
+        self._entries = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def get(self, configuration, location) -> Optional[Any]:
+        """
+        返回缓存数据的副本；未命中或已失效时返回 None。
+        """
+        entry = self._entries.get(configuration)
+        if entry is None or entry.location != location:
+            self.misses += 1
+            return None
+        now = time.monotonic()
+        if now - entry.checked_at >= self.ttl:
+            if FileStamp.of(location) != entry.stamp:
+                self.discard(configuration)
+                self.misses += 1
+                return None
+            entry.checked_at = now
+        self.hits += 1
+        # 返回副本，避免实例之间共享可变的字段值。
+        return copy.deepcopy(entry.data)
+
+    def put(self, configuration, location, data) -> None:
+        stamp = FileStamp.of(location)
+        if stamp is None or stamp.is_racy(self.racy_window):
+            self.discard(configuration)
+            return
+        entry = _Entry(location, stamp, copy.deepcopy(data), time.monotonic())
+        with self._lock:
+            self._entries[configuration] = entry
+
+    def discard(self, configuration) -> None:
+        with self._lock:
+            self._entries.pop(configuration, None)
+
+    def invalidate(self, location=None) -> None:
+        """
+        使指定位置（或全部）的缓存失效。
+        """
+        with self._lock:
+            if location is None:
+                self._entries.clear()
+                return
+            for configuration, entry in list(self._entries.items()):
+                if entry.location == location:
+                    del self._entries[configuration]
+
+
+# 进程内共享的缓存。可通过 data_cache.ttl 调整校验间隔。
+data_cache = DataCache()
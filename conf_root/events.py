@@ -0,0 +1,33 @@
+import logging
+import threading
+from typing import Callable, List, Any
+
+logger = logging.getLogger(__name__)
+
+# listener(configuration, event)。event 为 'save'（经 agent 写入）或 'change'（文件在外部被修改）。
+Listener = Callable[[Any, str], None]
+
+_listeners: List[Listener] = []
+_lock = threading.Lock()
+
+
+def subscribe(listener: Listener) -> None:
+    with _lock:
+        _listeners.append(listener)
+
+
+def unsubscribe(listener: Listener) -> None:
+    with _lock:
+        if listener in _listeners:
+            _listeners.remove(listener)
+
+
+def notify(configuration, event: str = 'save') -> None:
+    """
+    通知所有 listener。listener 在调用者的线程中执行，应尽快返回。
+    """
+    for listener in tuple(_listeners):
+        try:
+            listener(configuration, event)
+        except Exception:
+            logger.exception(f'listener {listener!r} failed')
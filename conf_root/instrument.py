@@ -0,0 +1,273 @@
+import functools
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Any, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# 默认关闭；关闭时被包装的方法只多一次函数调用与一次判断
+enabled = False
+# 每个操作保留最近多少次的耗时用于计算分位数
+SAMPLE_SIZE = 1024
+QUANTILES = (0.5, 0.9, 0.99)
+
+# hook(configuration, operation, seconds, error)。error 为操作抛出的异常，成功时为 None。
+Hook = Callable[[Any, str, float, Optional[BaseException]], None]
+
+_hooks: List[Hook] = []
+_lock = threading.Lock()
+_local = threading.local()
+
+
+class OperationStats:
+    __slots__ = ('count', 'errors', 'total', 'max', 'samples')
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=SAMPLE_SIZE)
+
+    def add(self, seconds: float, error: bool) -> None:
+        self.count += 1
+        if error:
+            self.errors += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.samples.append(seconds)
+
+    def quantiles(self) -> Dict[float, float]:
+        samples = sorted(self.samples)
+        if not samples:
+            return {q: 0.0 for q in QUANTILES}
+        return {q: samples[min(len(samples) - 1, int(q * len(samples)))] for q in QUANTILES}
+
+    def summary(self) -> Dict[str, Any]:
+        result = {
+            'count': self.count,
+            'errors': self.errors,
+            'total': self.total,
+            'mean': self.total / self.count if self.count else 0.0,
+            'max': self.max,
+        }
+        for q, value in self.quantiles().items():
+            result[f'p{int(q * 100)}'] = value
+        return result
+
+
+class ConfigurationStats:
+    __slots__ = ('operations', 'bytes_read', 'bytes_written', 'cache_hits', 'cache_misses')
+
+    def __init__(self):
+        self.operations: Dict[str, OperationStats] = {}
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def summary(self) -> Dict[str, Any]:
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            'operations': {name: operation.summary() for name, operation in self.operations.items()},
+            'bytes_read': self.bytes_read,
+            'bytes_written': self.bytes_written,
+            'cache': {
+                'hits': self.cache_hits,
+                'misses': self.cache_misses,
+                'hit_rate': self.cache_hits / lookups if lookups else 0.0,
+            },
+        }
+
+
+# {配置名: ConfigurationStats}
+_stats: Dict[str, ConfigurationStats] = {}
+
+
+def enable() -> None:
+    global enabled
+    enabled = True
+
+
+def disable() -> None:
+    global enabled
+    enabled = False
+
+
+def reset() -> None:
+    with _lock:
+        _stats.clear()
+
+
+def subscribe(hook: Hook) -> None:
+    with _lock:
+        _hooks.append(hook)
+
+
+def unsubscribe(hook: Hook) -> None:
+    with _lock:
+        if hook in _hooks:
+            _hooks.remove(hook)
+
+
+def _get(name: str) -> ConfigurationStats:
+    stats = _stats.get(name)
+    if stats is None:
+        stats = _stats[name] = ConfigurationStats()
+    return stats
+
+
+def record(configuration, operation: str, seconds: float, error: Optional[BaseException] = None) -> None:
+    with _lock:
+        stats = _get(configuration.name)
+        operation_stats = stats.operations.get(operation)
+        if operation_stats is None:
+            operation_stats = stats.operations[operation] = OperationStats()
+        operation_stats.add(seconds, error is not None)
+    for hook in tuple(_hooks):
+        try:
+            hook(configuration, operation, seconds, error)
+        except Exception:
+            logger.exception(f'hook {hook!r} failed')
+
+
+def record_cache(configuration, hit: bool) -> None:
+    if not enabled:
+        return
+    with _lock:
+        stats = _get(configuration.name)
+        if hit:
+            stats.cache_hits += 1
+        else:
+            stats.cache_misses += 1
+
+
+def count_bytes(direction: str, content: Union[str, bytes, int]) -> None:
+    """
+    将读写的字节数计入当前线程中正在进行的 load/save 等操作所属的配置。direction 为 'read' 或 'written'。
+    """
+    if not enabled:
+        return
+    name = getattr(_local, 'configuration', None)
+    if name is None:
+        return
+    if isinstance(content, str):
+        size = len(content.encode('utf-8'))
+    elif isinstance(content, int):
+        size = content
+    else:
+        size = len(content)
+    with _lock:
+        stats = _get(name)
+        if direction == 'read':
+            stats.bytes_read += size
+        else:
+            stats.bytes_written += size
+
+
+@contextmanager
+def attributed(configuration):
+    """
+    在上下文中将当前线程读写的字节数计入 configuration。用于不经过被记录的方法进行的读写，如批量保存与后台写入。
+    """
+    previous = getattr(_local, 'configuration', None)
+    _local.configuration = configuration.name
+    try:
+        yield
+    finally:
+        _local.configuration = previous
+
+
+def instrumented(operation: str):
+    """
+    记录 agent 方法 method(self, configuration, ...) 的调用次数与耗时。
+    同一线程中嵌套的同名操作（如子类通过 super() 调用）只记录最外层的一次。
+    """
+
+    def decorator(func):
+        if getattr(func, '__conf_root_operation__', None) == operation:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(self, configuration, *args, **kwargs):
+            if not enabled:
+                return func(self, configuration, *args, **kwargs)
+            active = getattr(_local, 'operations', None)
+            if active is None:
+                active = _local.operations = set()
+            if operation in active:
+                return func(self, configuration, *args, **kwargs)
+            active.add(operation)
+            previous = getattr(_local, 'configuration', None)
+            _local.configuration = configuration.name
+            error = None
+            started = time.perf_counter()
+            try:
+                return func(self, configuration, *args, **kwargs)
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                seconds = time.perf_counter() - started
+                active.discard(operation)
+                _local.configuration = previous
+                record(configuration, operation, seconds, error)
+
+        wrapper.__conf_root_operation__ = operation
+        return wrapper
+
+    return decorator
+
+
+def stats() -> Dict[str, Dict[str, Any]]:
+    """
+    返回各配置的统计：{配置名: {'operations': {操作: {count, errors, total, mean, max, p50, p90, p99}},
+    'bytes_read', 'bytes_written', 'cache': {hits, misses, hit_rate}}}。耗时的单位为秒。
+    """
+    with _lock:
+        return {name: stats.summary() for name, stats in _stats.items()}
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus() -> str:
+    """
+    以 Prometheus 文本格式输出全部统计。
+    """
+    summaries = stats()
+    lines = [
+        '# HELP conf_root_operation_seconds Time spent in configuration operations.',
+        '# TYPE conf_root_operation_seconds summary',
+    ]
+    errors = []
+    for name, summary in summaries.items():
+        for operation, values in summary['operations'].items():
+            labels = f'config="{_escape(name)}",operation="{operation}"'
+            for q in QUANTILES:
+                lines.append(f'conf_root_operation_seconds{{{labels},quantile="{q}"}} {values[f"p{int(q * 100)}"]!r}')
+            lines.append(f'conf_root_operation_seconds_sum{{{labels}}} {values["total"]!r}')
+            lines.append(f'conf_root_operation_seconds_count{{{labels}}} {values["count"]}')
+            errors.append(f'conf_root_operation_errors_total{{{labels}}} {values["errors"]}')
+    lines += [
+        '# HELP conf_root_operation_errors_total Configuration operations that raised an exception.',
+        '# TYPE conf_root_operation_errors_total counter',
+        *errors,
+    ]
+    counters = (
+        ('conf_root_bytes_read_total', 'Bytes read from configuration storage.', lambda s: s['bytes_read']),
+        ('conf_root_bytes_written_total', 'Bytes written to configuration storage.', lambda s: s['bytes_written']),
+        ('conf_root_cache_hits_total', 'Loads served from the parsed data cache.', lambda s: s['cache']['hits']),
+        ('conf_root_cache_misses_total', 'Loads not served from the parsed data cache.',
+         lambda s: s['cache']['misses']),
+    )
+    for metric, description, getter in counters:
+        lines += [f'# HELP {metric} {description}', f'# TYPE {metric} counter']
+        for name, summary in summaries.items():
+            lines.append(f'{metric}{{config="{_escape(name)}"}} {getter(summary)}')
+    return '\n'.join(lines) + '\n'
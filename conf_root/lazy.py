@@ -0,0 +1,103 @@
+import threading
+from dataclasses import MISSING
+
+from conf_root.Configuration import schema_of
+
+# 待加载实例在 __dict__ 中暂存初始化值所用的键
+PENDING_KEY = '__conf_root_pending__'
+# 待加载实例的锁所用的键，加载完成后移除
+LOCK_KEY = '__conf_root_lock__'
+
+
+class _InstanceLock:
+    """
+    每个待加载实例各自的锁，不同实例的加载互不阻塞。
+    """
+    __slots__ = ('lock',)
+
+    def __init__(self):
+        self.lock = threading.RLock()
+
+    def __deepcopy__(self, memo):
+        # 复制得到的实例使用自己的锁
+        return _InstanceLock()
+
+
+class LazyField:
+    """
+    非数据描述符。实例的 __dict__ 中没有该字段时（即加载仍待进行）才会被调用，
+    加载完成后字段回到 __dict__，之后的读取不再经过这里。
+    """
+
+    def __init__(self, name, default=MISSING):
+        self.name = name
+        self.default = default
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            if self.default is MISSING:
+                raise AttributeError(f"type object '{owner.__name__}' has no attribute '{self.name}'")
+            return self.default
+        resolve(instance)
+        try:
+            return instance.__dict__[self.name]
+        except KeyError:
+            raise AttributeError(f"'{owner.__name__}' object has no attribute '{self.name}'") from None
+
+
+def install(cls):
+    """
+    为配置类的每个字段安装 LazyField。字段定义变化后可重复调用。
+    """
+    for field in schema_of(cls).fields:
+        setattr(cls, field.name, LazyField(field.name, field.default))
+
+
+def defer(instance):
+    """
+    将 __init__ 得到的字段值移出 __dict__，记录为待加载状态。
+    """
+    d = instance.__dict__
+    d[LOCK_KEY] = _InstanceLock()
+    d[PENDING_KEY] = {name: d.pop(name) for name in schema_of(type(instance)).names if name in d}
+
+
+def is_pending(instance) -> bool:
+    return PENDING_KEY in instance.__dict__
+
+
+def resolve(instance, persist=True):
+    """
+    完成待进行的加载。
+
+    实例化之后被显式赋值的字段会在加载之后重新赋值，使结果与立即加载时一致。
+    persist 为 False 时只还原初始化值，不访问存储。
+    其他线程同时读取该实例的字段时等待加载完成；其他实例的加载不受影响。
+    """
+    d = instance.__dict__
+    holder = d.get(LOCK_KEY)
+    if holder is None:
+        return
+    with holder.lock:
+        pending = d.pop(PENDING_KEY, None)
+        if pending is None:
+            return
+        try:
+            values = pending
+            if persist:
+                # 在另一个对象上完成加载；加载期间实例中没有这些字段，其他线程读取时经由 LazyField 等待
+                shadow = object.__new__(type(instance))
+                shadow.__dict__.update(pending)
+                configuration = getattr(instance, '__CONF_ROOT__')
+                configuration.conf_root.post_init(shadow, configuration)
+                values = shadow.__dict__
+            assigned = {name: d[name] for name in pending if name in d}
+            d.update(values)
+            d.update(assigned)
+        except BaseException:
+            # 加载失败时保留初始化值
+            for name, value in pending.items():
+                d.setdefault(name, value)
+            raise
+        finally:
+            d.pop(LOCK_KEY, None)
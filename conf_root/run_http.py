@@ -1,17 +1,27 @@
 import os
 import ast
+import copy
+import dataclasses
+import hashlib
 import importlib.util
-from dataclasses import fields
-from typing import Dict, Type
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import MISSING, is_dataclass
+from enum import Enum
+from typing import Dict, Type, List, Tuple, NamedTuple, Callable, Any, Optional, Union, get_origin, get_args
 
-from wtforms.validators import DataRequired, Disabled
-from wtforms import Form, StringField, IntegerField, BooleanField, FloatField, TextAreaField, FormField, SelectField, RadioField
+from wtforms.validators import DataRequired, Disabled, Optional as OptionalValidator
+from wtforms import Form, Field, StringField, IntegerField, BooleanField, FloatField, TextAreaField, FormField, \
+    SelectField, RadioField
 from jinja2 import Environment, FileSystemLoader
 import urllib.parse
-from http.server import BaseHTTPRequestHandler, HTTPServer
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
-from conf_root.Configuration import is_config_class
-from conf_root.utils import data2obj
+from conf_root import aio, lazy, instrument
+from conf_root.cache import FileStamp
+from conf_root.Configuration import is_config_class, schema_of, field_default, FieldSchema
+from conf_root.utils import data2obj, obj2data, ValidateException
 
 
 def extract_classes_from_file(file_path):
@@ -33,133 +43,507 @@ def extract_classes_from_file(file_path):
     return classes
 
 
-def dataclass_to_wtform(dataclass_type):
-    class DynamicForm(Form):
-        pass
-
-    for field in fields(dataclass_type):
-        field_name = field.name
-        field_type = field.type
-        field_default = field.default
-
-        # 根据字段类型添加相应的WTForms字段
-        if 'choices' in field.metadata:
-            choices = field.metadata['choices']
-            form_field = RadioField(field_name, choices=choices, validators=[DataRequired()], default=field_default)
-        elif field_type == str:
-            form_field = StringField(field_name, validators=[DataRequired()], default=field_default)
-        elif field_type == int:
-            form_field = IntegerField(field_name, validators=[DataRequired()], default=field_default)
-        elif field_type == bool:
-            form_field = BooleanField(field_name, validators=[DataRequired()], default=field_default)
-        elif field_type == float:
-            form_field = FloatField(field_name, validators=[DataRequired()], default=field_default)
-        elif is_config_class(field_type):
-            form_field = FormField(dataclass_to_wtform(field_type), field_name, separator='.')
+# 字段类型与表单字段的对应：factory(field_schema, field_type, validators) -> wtforms.Field
+FieldFactory = Callable[[FieldSchema, Any, list], Field]
+FIELD_TYPES: Dict[Any, FieldFactory] = {}
+
+
+def register_field_type(field_type, factory: FieldFactory) -> None:
+    """
+    注册字段类型对应的表单字段。field_type 可以是类型，也可以是 typing 中的泛型（如 List）。
+    注册后需调用 clear_form_cache() 使已生成的表单失效。
+    """
+    FIELD_TYPES[field_type] = factory
+
+
+def _form_default(field_schema: FieldSchema):
+    default = field_default(field_schema)
+    return None if default is MISSING else default
+
+
+class ListField(TextAreaField):
+    """
+    以JSON编辑列表，item_type 不为 None 时逐项转换类型。
+    """
+
+    def __init__(self, label=None, validators=None, item_type=None, **kwargs):
+        super().__init__(label, validators, **kwargs)
+        self.item_type = item_type
+
+    def _value(self):
+        if self.raw_data:
+            return self.raw_data[0]
+        return json.dumps(self.data if self.data is not None else [], ensure_ascii=False, default=_json_default)
+
+    def process_formdata(self, valuelist):
+        if not valuelist:
+            return
+        try:
+            value = json.loads(valuelist[0] or '[]')
+        except ValueError as e:
+            raise ValueError(f'invalid JSON: {e}') from e
+        if not isinstance(value, list):
+            raise ValueError('expected a JSON list')
+        if self.item_type is not None:
+            value = [self.item_type(item) for item in value]
+        self.data = value
+
+
+class DataclassFormField(FormField):
+    """
+    嵌套的dataclass。未注册为配置类的dataclass在提交时还原为实例。
+    """
+
+    def __init__(self, form_class, label=None, dataclass_type=None, **kwargs):
+        super().__init__(form_class, label, separator='.', **kwargs)
+        self.dataclass_type = dataclass_type
+
+    @property
+    def data(self):
+        data = self.form.data
+        if self.dataclass_type is None:
+            return data
+        names = schema_of(self.dataclass_type).names
+        return self.dataclass_type(**{k: v for k, v in data.items() if k in names})
+
+
+def _simple_factory(form_field_class):
+    def factory(field_schema, field_type, validators):
+        return form_field_class(field_schema.name, validators=validators, default=_form_default(field_schema))
+
+    return factory
+
+
+def _bool_factory(field_schema, field_type, validators):
+    # 未勾选的复选框没有值，不能要求必填
+    return BooleanField(field_schema.name, default=_form_default(field_schema))
+
+
+def _list_factory(field_schema, field_type, validators):
+    args = get_args(field_type)
+    item_type = args[0] if args and args[0] in (str, int, float, bool) else None
+    return ListField(field_schema.name, item_type=item_type, default=_form_default(field_schema))
+
+
+def _enum_factory(field_schema, field_type, validators):
+    def coerce(value):
+        return value if isinstance(value, field_type) else field_type[value]
+
+    choices = [(member.name, member.name) for member in field_type]
+    return SelectField(field_schema.name, choices=choices, coerce=coerce, validators=validators,
+                       default=_form_default(field_schema))
+
+
+def _dataclass_factory(field_schema, field_type, validators):
+    dataclass_type = None if field_schema.is_config else field_type
+    return DataclassFormField(dataclass_to_wtform(field_type), field_schema.name, dataclass_type=dataclass_type)
+
+
+register_field_type(str, _simple_factory(StringField))
+register_field_type(int, _simple_factory(IntegerField))
+register_field_type(float, _simple_factory(FloatField))
+register_field_type(bool, _bool_factory)
+register_field_type(list, _list_factory)
+register_field_type(List, _list_factory)
+register_field_type(Enum, _enum_factory)
+
+
+def _find_factory(field_type) -> Optional[FieldFactory]:
+    factory = FIELD_TYPES.get(field_type)
+    if factory is not None:
+        return factory
+    origin = get_origin(field_type)
+    if origin is not None:
+        return FIELD_TYPES.get(origin)
+    if isinstance(field_type, type):
+        # 子类使用最近的已注册父类，如 Enum 的子类
+        for base in field_type.__mro__[1:]:
+            factory = FIELD_TYPES.get(base)
+            if factory is not None:
+                return factory
+    return None
+
+
+def make_form_field(field_schema: FieldSchema) -> Optional[Field]:
+    """
+    按字段类型生成表单字段；不支持的类型返回 None。
+    """
+    if field_schema.choices is not None:
+        return RadioField(field_schema.name, choices=field_schema.choices, validators=[DataRequired()],
+                          default=field_schema.default)
+    field_type = field_schema.type
+    validators = [DataRequired()]
+    args = get_args(field_type)
+    if get_origin(field_type) is Union and type(None) in args:
+        # Optional[X]：允许为空
+        non_none = [arg for arg in args if arg is not type(None)]
+        if len(non_none) != 1:
+            return None
+        field_type = non_none[0]
+        validators = [OptionalValidator()]
+    if field_schema.is_config or is_dataclass(field_type):
+        return _dataclass_factory(field_schema, field_type, validators)
+    factory = _find_factory(field_type)
+    if factory is None:
+        return None
+    return factory(field_schema, field_type, validators)
+
+
+_form_cache: Dict[Tuple[Any, str], Type[Form]] = {}
+_form_cache_lock = threading.RLock()
+
+
+def clear_form_cache() -> None:
+    with _form_cache_lock:
+        _form_cache.clear()
+
+
+def dataclass_to_wtform(dataclass_type) -> Type[Form]:
+    """
+    生成 dataclass 对应的表单类。表单类按 (类, schema摘要) 缓存，嵌套的类只生成一次。
+    """
+    schema = schema_of(dataclass_type)
+    key = (dataclass_type, schema.digest)
+    form_class = _form_cache.get(key)
+    if form_class is not None:
+        return form_class
+    with _form_cache_lock:
+        form_class = _form_cache.get(key)
+        if form_class is not None:
+            return form_class
+
+        class DynamicForm(Form):
             pass
-        else:
-            form_field = TextAreaField(field_name, validators=[Disabled()], default=f"不支持在线编辑类型 {field_type}")
-            setattr(DynamicForm, "_" + field_name, form_field)
-            continue
-        setattr(DynamicForm, field_name, form_field)
+
+        for field in schema.fields:
+            form_field = make_form_field(field)
+            if form_field is None:
+                form_field = TextAreaField(field.name, validators=[Disabled()],
+                                           default=f"不支持在线编辑类型 {field.type}")
+                setattr(DynamicForm, "_" + field.name, form_field)
+                continue
+            setattr(DynamicForm, field.name, form_field)
+        _form_cache[key] = DynamicForm
     return DynamicForm
 
 
-def make_handler(forms: Dict[Type, Type]):
-    class RequestHandler(BaseHTTPRequestHandler):
-        def __init__(self, request, client_address, server):
-            self.forms = forms
-            template_path = os.path.join(os.path.dirname(__file__), 'templates')
-            self.jinja_env = Environment(loader=FileSystemLoader(template_path))
-            super().__init__(request, client_address, server)
-
-        def render_index(self, names):
-            urls = [name if name.startswith('/') else '/' + name for name in names]
-            template = self.jinja_env.get_template('index.html')
-            return template.render(names=names, urls=urls, zip=zip)
-
-        def render_form(self, name, form, action_url, msg=None):
-            template = self.jinja_env.get_template('form.html')
-            return template.render(name=name, form=form, action_url=action_url, msg=msg)
-
-        def do_GET(self):
-            if self.path == '/':
-                names = [cls.__name__ for cls in self.forms.keys()]
-                response = self.render_index(names)
-                self.send_response(200)
-                self.send_header('Content-type', 'text/html')
-                self.end_headers()
-                self.wfile.write(response.encode('utf-8'))
-                return
-            for cls, form_class in self.forms.items():
-                name = cls.__name__
-                action_url = name if name.startswith('/') else '/' + name
-                if self.path == action_url:
-                    # 构造Dataclass
-                    obj = cls()
-                    form = form_class(obj=obj)
-                    response = self.render_form(name, form, action_url)
-                    self.send_response(200)
-                    self.send_header('Content-type', 'text/html')
-                    self.end_headers()
-                    self.wfile.write(response.encode('utf-8'))
-                    return
+TEMPLATE_PATH = os.path.join(os.path.dirname(__file__), 'templates')
+
+
+class Response(NamedTuple):
+    status: int
+    headers: List[Tuple[str, str]]
+    body: bytes
+
+
+def html_response(content: str, status: int = 200) -> Response:
+    return Response(status, [('Content-Type', 'text/html; charset=utf-8')], content.encode('utf-8'))
+
 
+NOT_FOUND = Response(404, [], b'')
+API_PREFIX = '/api/'
+# conf_root.instrument 的统计，Prometheus 文本格式
+METRICS_PATH = '/metrics'
+
+
+def _json_default(value):
+    # 未注册为配置类的dataclass
+    if dataclasses.is_dataclass(value):
+        return dataclasses.asdict(value)
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def json_response(data, status: int = 200, headers=()) -> Response:
+    body = json.dumps(data, ensure_ascii=False, default=_json_default).encode('utf-8')
+    return Response(status, [('Content-Type', 'application/json; charset=utf-8'), *headers], body)
+
+
+def make_etag(body: bytes) -> str:
+    # 强ETag：内容相同当且仅当字节相同
+    return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+
+def etag_matches(header, etag: str) -> bool:
+    if header is None:
+        return False
+    header = header.strip()
+    if header == '*':
+        return True
+    return etag in (tag.strip() for tag in header.split(','))
+
+
+class FormData(dict):
+    """
+    WTForms 需要的 formdata 接口。嵌套表单的字段名形如 sub.field，由 FormField 按前缀分配。
+    """
+
+    def getlist(self, key):
+        return self[key] if key in self else []
+
+
+def parse_form_data(body: bytes) -> FormData:
+    data = FormData()
+    for key, value in urllib.parse.parse_qsl(body.decode('utf-8')):
+        data.setdefault(key, []).append(value)
+    return data
+
+
+class EditorApp:
+    """
+    与传输方式无关的请求处理：handle(method, path, headers, body) -> Response。
+    模板环境在创建时编译一次，路由为 {url: (cls, form_class)} 的字典。
+    """
+
+    def __init__(self, forms: Dict[Type, Type]):
+        self.forms = forms
+        self.jinja_env = Environment(loader=FileSystemLoader(TEMPLATE_PATH), auto_reload=False)
+        self.index_template = self.jinja_env.get_template('index.html')
+        self.form_template = self.jinja_env.get_template('form.html')
+        self.routes: Dict[str, Tuple[Type, Type]] = {}
+        for cls, form_class in forms.items():
+            self.routes[self.url_of(cls)] = (cls, form_class)
+        self.index_names = [cls.__name__ for cls in forms.keys()]
+        self.api_routes: Dict[str, Type] = {cls.__name__: cls for cls in forms.keys()}
+        # If-Match 的比较与保存需要原子地进行
+        self.api_locks: Dict[Type, threading.Lock] = {cls: threading.Lock() for cls in forms.keys()}
+        # {cls: (文件指纹, 实例)}，文件变化时重新读取
+        self._snapshots: Dict[Type, Tuple[object, object]] = {}
+        self._snapshots_lock = threading.Lock()
+
+    @staticmethod
+    def settle(instance):
+        """
+        不访问存储地完成实例及其嵌套配置（lazy 模式下仍待加载）的加载，之后读取字段与保存都不会读写嵌套配置的文件。
+        """
+        lazy.resolve(instance, persist=False)
+        for field in schema_of(type(instance)).fields:
+            value = instance.__dict__.get(field.name)
+            if field.is_config and is_config_class(value):
+                EditorApp.settle(value)
+
+    @staticmethod
+    def detached(cls):
+        """
+        构造不进行任何读写的实例，字段为默认值。
+        """
+        with aio.defer_io():
+            instance = cls()
+        EditorApp.settle(instance)
+        return instance
+
+    @staticmethod
+    def apply(instance, data, custom=False):
+        """
+        将提交的数据写入实例。解码时构造的嵌套配置实例不进行读写，其值来自提交的数据。
+        """
+        with aio.defer_io():
+            data2obj(instance, data, custom=custom)
+        EditorApp.settle(instance)
+
+    def load_instance(self, cls):
+        """
+        构造实例并从存储中读取；配置不存在时保持默认值，不会创建或写入文件。
+        """
+        instance = self.detached(cls)
+        configuration = cls.__CONF_ROOT__
+        conf_root = configuration.conf_root
+        if conf_root.persist and conf_root.agent.exist(configuration):
+            # 解码时构造的嵌套配置实例同样不进行读写，其值来自本配置的数据
+            with aio.defer_io():
+                conf_root.agent.load(configuration, instance)
+            self.settle(instance)
+        return instance
+
+    def _snapshot_key(self, cls):
+        configuration = cls.__CONF_ROOT__
+        conf_root = configuration.conf_root
+        if not conf_root.persist:
+            return 'defaults'
+        agent = conf_root.agent
+        # 不以文件保存的配置（cache 为 None，如 SqliteAgent）无法通过文件指纹判断是否变化；
+        # 没有 cache 属性的 agent（如 inner 为 None 的 SharedMemoryAgent）按其文件指纹判断
+        if getattr(agent, 'cache', False) is None:
+            return None
+        location = agent.get_configuration_location(configuration)
+        if location is None:
+            return None
+        stamp = FileStamp.of(location)
+        if stamp is not None and stamp.is_racy():
+            return None
+        # 保存时文件被替换（inode 变化），指纹一定改变
+        return 'missing' if stamp is None else stamp
+
+    def snapshot(self, cls):
+        """
+        返回用于展示的实例。文件未变化时使用缓存，不重复解析；调用者不应修改返回的实例。
+        """
+        key = self._snapshot_key(cls)
+        if key is not None:
+            cached = self._snapshots.get(cls)
+            if cached is not None and cached[0] == key:
+                return cached[1]
+        instance = self.load_instance(cls)
+        if key is not None:
+            with self._snapshots_lock:
+                self._snapshots[cls] = (key, instance)
+        return instance
+
+    @staticmethod
+    def url_of(cls) -> str:
+        name = cls.__name__
+        return name if name.startswith('/') else '/' + name
+
+    def render_index(self, names):
+        urls = [name if name.startswith('/') else '/' + name for name in names]
+        return self.index_template.render(names=names, urls=urls, zip=zip)
+
+    def render_form(self, name, form, action_url, msg=None):
+        return self.form_template.render(name=name, form=form, action_url=action_url, msg=msg)
+
+    def handle(self, method: str, path: str, headers, body: bytes) -> Response:
+        path = urllib.parse.urlsplit(path).path
+        if path.startswith(API_PREFIX):
+            return self.handle_api(method, path[len(API_PREFIX):], headers, body)
+        if path == METRICS_PATH and method == 'GET':
+            return Response(200, [('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')],
+                            instrument.render_prometheus().encode('utf-8'))
+        if method == 'GET':
+            return self.do_GET(path, headers)
+        if method == 'POST':
+            return self.do_POST(path, headers, body)
+        return Response(405, [('Allow', 'GET, POST')], b'')
+
+    def api_representation(self, cls) -> Tuple[Response, str]:
+        response = json_response(obj2data(self.snapshot(cls)))
+        etag = make_etag(response.body)
+        response.headers.append(('ETag', etag))
+        return response, etag
+
+    def handle_api(self, method: str, name: str, headers, body: bytes) -> Response:
+        """
+        GET/PUT /api/<name>：以JSON读写配置。GET 支持 If-None-Match，PUT 支持 If-Match。
+        """
+        cls = self.api_routes.get(urllib.parse.unquote(name))
+        if cls is None:
+            return json_response({'error': f'configuration {name} not found'}, 404)
+        if method == 'GET':
+            response, etag = self.api_representation(cls)
+            if etag_matches(headers.get('If-None-Match'), etag):
+                return Response(304, [('ETag', etag)], b'')
+            return response
+        if method != 'PUT':
+            return Response(405, [('Allow', 'GET, PUT')], b'')
+
+        try:
+            data = json.loads(body)
+        except ValueError as e:
+            return json_response({'error': f'invalid JSON: {e}'}, 400)
+        if not isinstance(data, dict):
+            return json_response({'error': 'expected a JSON object'}, 400)
+        with self.api_locks[cls]:
+            if_match = headers.get('If-Match')
+            if if_match is not None:
+                _, etag = self.api_representation(cls)
+                if not etag_matches(if_match, etag):
+                    return json_response({'error': 'configuration was modified'}, 412, [('ETag', etag)])
+            instance = copy.deepcopy(self.snapshot(cls))
+            try:
+                self.apply(instance, data, custom=True)
+            except (ValidateException, TypeError, ValueError) as e:
+                return json_response({'error': str(e)}, 422)
+            configuration = cls.__CONF_ROOT__
+            configuration.conf_root.agent.save(configuration, instance)
+            response = json_response(obj2data(instance))
+        response.headers.append(('ETag', make_etag(response.body)))
+        return response
+
+    def do_GET(self, path, headers) -> Response:
+        if path == '/':
+            return html_response(self.render_index(self.index_names))
+        route = self.routes.get(path)
+        if route is None:
             # 如果没有匹配的form。
-            self.send_response(404)
-            self.end_headers()
-
-        def do_POST(self):
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            post_data = urllib.parse.parse_qsl(post_data.decode('utf-8'))
-            post_data = dict(post_data)
-
-            def set_form_data(form_obj, data):
-                for field_name, values in data.items():
-                    if '.' in field_name:
-                        sub_form_name, sub_field_name = field_name.split('.', 1)
-                        sub_form = getattr(form_obj, sub_form_name)
-                        set_form_data(sub_form, {sub_field_name: values})
-                    else:
-                        form_obj.process(None, data={field_name: values})
-
-            for cls, form_class in self.forms.items():
-                name = cls.__name__
-                action_url = name if name.startswith('/') else '/' + name
-                if self.path == action_url:
-                    form = form_class()
-                    set_form_data(form, post_data)
-                    if form.validate():
-                        # 写入instance
-                        instance = cls()
-                        data2obj(instance, form.data)
-                        configuration = cls.__CONF_ROOT__
-                        agent = configuration.conf_root.agent
-                        agent.save(configuration, instance)
-                        # 返回结果
-                        msg = {
-                            'location': agent.get_configuration_location(configuration),
-                            'data': form.data,
-                            'instance': instance
-                        }
-                        response = self.render_form(name, form, action_url, msg)
-                    else:
-                        response = self.render_form(name, form, action_url)
-                    self.send_response(200)
-                    self.send_header('Content-type', 'text/html')
-                    self.end_headers()
-                    self.wfile.write(response.encode('utf-8'))
-                    return
-            self.send_response(404)
-            self.end_headers()
-
-    return RequestHandler
-
-
-def run_http(forms, host='127.0.0.1', port=8080):
+            return NOT_FOUND
+        cls, form_class = route
+        # 使用缓存的实例，页面访问不会读写文件
+        form = form_class(obj=self.snapshot(cls))
+        return html_response(self.render_form(cls.__name__, form, path))
+
+    def do_POST(self, path, headers, body) -> Response:
+        route = self.routes.get(path)
+        if route is None:
+            return NOT_FOUND
+        cls, form_class = route
+        form = form_class(formdata=parse_form_data(body))
+        if not form.validate():
+            return html_response(self.render_form(cls.__name__, form, path))
+        # 写入instance
+        instance = copy.deepcopy(self.snapshot(cls))
+        try:
+            self.apply(instance, form.data)
+        except (ValidateException, TypeError, ValueError) as e:
+            return json_response({'error': str(e)}, 422)
+        configuration = cls.__CONF_ROOT__
+        agent = configuration.conf_root.agent
+        agent.save(configuration, instance)
+        # 返回结果
+        msg = {
+            'location': agent.get_configuration_location(configuration),
+            'data': form.data,
+            'instance': instance
+        }
+        return html_response(self.render_form(cls.__name__, form, path, msg))
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """
+    将 HTTP/1.1 请求转交给 server.app。所有响应都带有 Content-Length，连接默认保持。
+    """
+    protocol_version = 'HTTP/1.1'
+    # 空闲连接保持的秒数，超时后释放工作线程
+    timeout = 15
+
+    def handle_app(self, method):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        response = self.server.app.handle(method, self.path, self.headers, body)
+        self.send_response(response.status)
+        for key, value in response.headers:
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(response.body)))
+        self.end_headers()
+        self.wfile.write(response.body)
+
+    def do_GET(self):
+        self.handle_app('GET')
+
+    def do_POST(self):
+        self.handle_app('POST')
+
+    def do_PUT(self):
+        self.handle_app('PUT')
+
+
+class PooledHTTPServer(ThreadingHTTPServer):
+    """
+    在固定大小的线程池中处理连接，同时处理的连接数不超过 max_workers。
+    """
+
+    def __init__(self, server_address, app: EditorApp, max_workers: int = 32):
+        self.app = app
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='conf-root-http')
+        super().__init__(server_address, RequestHandler)
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self.process_request_thread, request, client_address)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=False)
+
+
+def run_http(forms, host='127.0.0.1', port=8080, max_workers: int = 32):
     server_address = (host, port)
-    handler_class = make_handler(forms)
-    httpd = HTTPServer(server_address, handler_class)
+    httpd = PooledHTTPServer(server_address, EditorApp(forms), max_workers=max_workers)
     print(f'Starting httpd server on http://{host}:{port}/ ...')
     httpd.serve_forever()
@@ -1,7 +1,8 @@
-from dataclasses import fields
+import time
 from typing import Dict, Any
 
-from conf_root.Configuration import is_config_class
+from conf_root import instrument
+from conf_root.Configuration import is_config_class, schema_of
 
 
 class ValidateException(BaseException):
@@ -15,29 +16,171 @@ def validate(field, value):
                 raise ValidateException(f'{field} with value {value} validate failed.')
 
 
+# 这些类型的值在序列化时原样返回，无需进入 obj2data
+_ATOMIC_TYPES = frozenset([str, int, float, bool, bytes, type(None)])
+_CODEC_ATTR = '__conf_root_codec__'
+
+
+class Codec:
+    """
+    为一个dataclass生成的编解码函数。
+
+    - decode(instance, data, custom=False): 与逐字段反射的 data2obj 行为一致。
+    - encode(obj): 与逐字段反射的 obj2data 行为一致。
+    - timed_decode: 与 decode 相同，但返回其中校验函数的耗时（秒），供 conf_root.instrument 使用，首次使用时生成。
+    - has_validators: 字段（包括嵌套的配置类）中是否有校验函数。
+    """
+    __slots__ = ('cls', 'decode', 'encode', 'source', 'has_validators', '_timed_decode')
+
+    def __init__(self, cls, decode, encode, source):
+        self.cls = cls
+        self.decode = decode
+        self.encode = encode
+        self.source = source
+        self.has_validators = any(field.validators or (field.is_config and get_codec(field.type).has_validators)
+                                  for field in schema_of(cls).fields)
+        self._timed_decode = None
+
+    @property
+    def timed_decode(self):
+        if self._timed_decode is None:
+            namespace = _codec_namespace()
+            lines = _decode_lines(self.cls, namespace, timed=True)
+            exec(compile('\n'.join(lines) + '\n', f'<conf_root timed codec {self.cls.__qualname__}>', 'exec'),
+                 namespace)
+            self._timed_decode = namespace['decode']
+        return self._timed_decode
+
+
+def _codec_namespace():
+    return {
+        'ValidateException': ValidateException,
+        'ATOMIC_TYPES': _ATOMIC_TYPES,
+        'obj2data': obj2data,
+        'perf_counter': time.perf_counter,
+    }
+
+
+def _decode_lines(cls, namespace, timed=False):
+    lines = ['def decode(instance, data, custom=False):', '    get = data.get']
+    if timed:
+        lines.append('    validated = 0.0')
+    for i, field in enumerate(schema_of(cls).fields):
+        # dataclass 保证字段名是合法的标识符
+        key = repr(field.name)
+        namespace[f'field_{i}'] = field.field
+        lines += [f'    value = get({key}, None)', '    if value is not None:']
+        deserialize = field.deserialize
+        if deserialize is not None:
+            namespace[f'deserialize_{i}'] = deserialize
+            # 在进行用户自定义 deserialize 之后，不再进入递归流程。
+            lines += ['        if custom:', f'            value = deserialize_{i}(value)']
+        if field.is_config:
+            sub_cls = field.type
+            sub_codec = get_codec(sub_cls)
+            namespace[f'cls_{i}'] = sub_cls
+            namespace[f'decode_{i}'] = sub_codec.timed_decode if timed else sub_codec.decode
+            sub_data = ', '.join(f'{name!r}: value.get({name!r}, None)' for name in schema_of(sub_cls).names)
+            branch = 'elif' if deserialize is not None else 'if'
+            lines += [
+                f'        {branch} isinstance(value, dict):',
+                f'            sub_data = {{{sub_data}}}',
+                # 要求 sub_data 中的内容必须能满足初始化要求
+                f'            sub_instance = cls_{i}(**sub_data)',
+                f'            validated += decode_{i}(sub_instance, sub_data, custom)' if timed else
+                f'            decode_{i}(sub_instance, sub_data, custom)',
+                '            value = sub_instance',
+            ]
+        if field.validators:
+            namespace[f'validators_{i}'] = field.validators
+            if timed:
+                lines.append('        started = perf_counter()')
+            lines += [
+                f'        for validator in validators_{i}:',
+                '            if not validator(value):',
+                f"                raise ValidateException(f'{{field_{i}}} with value {{value}} validate failed.')",
+            ]
+            if timed:
+                lines.append('        validated += perf_counter() - started')
+        lines.append(f'        instance.{field.name} = value')
+    if timed:
+        lines.append('    return validated')
+    return lines
+
+
+def build_codec(cls) -> Codec:
+    """
+    生成 cls 的编解码函数：字段列表、自定义序列化函数、嵌套配置类与校验函数在生成时确定，调用时不再反射。
+    """
+    namespace = _codec_namespace()
+    decode_lines = _decode_lines(cls, namespace)
+    encode_lines = ['def encode(obj):', '    res = {}']
+    for i, field in enumerate(schema_of(cls).fields):
+        key = repr(field.name)
+        encode_lines.append(f'    value = obj.{field.name}')
+        serialize = field.serialize
+        if serialize is not None:
+            namespace[f'serialize_{i}'] = serialize
+            # 在进行用户自定义 serialize之后，不再进入递归。
+            encode_lines.append(f'    res[{key}] = serialize_{i}(value)')
+        else:
+            encode_lines.append(f'    res[{key}] = value if value.__class__ in ATOMIC_TYPES else obj2data(value)')
+    encode_lines.append('    return res')
+
+    source = '\n'.join(decode_lines) + '\n\n\n' + '\n'.join(encode_lines) + '\n'
+    exec(compile(source, f'<conf_root codec {cls.__qualname__}>', 'exec'), namespace)
+    codec = Codec(cls, namespace['decode'], namespace['encode'], source)
+    setattr(cls, _CODEC_ATTR, codec)
+    return codec
+
+
+def get_codec(cls) -> Codec:
+    # 只使用类自身的codec，子类需要单独生成。
+    codec = cls.__dict__.get(_CODEC_ATTR)
+    if codec is None:
+        codec = build_codec(cls)
+    return codec
+
+
+def to_plain(data):
+    """
+    将dict/list的子类（如ruamel的CommentedMap）递归转换为内置类型。
+    """
+    if isinstance(data, dict):
+        return {k: to_plain(v) for k, v in data.items()}
+    if isinstance(data, list):
+        return [to_plain(v) for v in data]
+    return data
+
+
 def data2obj(instance, data: Dict[str, Any], custom=False) -> None:
     # 这个不需要加载default，因为origin_init中调用过了。
-    for field in fields(instance):
-        # 从字典中获取值，如果不存在则跳过
-        if (value := data.get(field.name, None)) is not None:
-            # 在进行用户自定义 deserialize 之后，不再进入递归流程。
-            if (custom and 'deserialize' in field.metadata and
-                    (deserialize_func := field.metadata['deserialize']) is not None):
-                value = deserialize_func(value)
-            else:
-                cls = field.type
-                if is_config_class(cls) and isinstance(value, dict):
-                    sub_data = {field.name: value.get(field.name, None) for field in fields(cls)}
-                    # 要求 sub_data 中的内容必须能满足初始化要求
-                    sub_instance = cls(**sub_data)
-                    # 后面继续做这个步骤的原因是避免从文件加载的cls内容，确保是用sub_data建立的。
-                    data2obj(instance=sub_instance, data=sub_data, custom=custom)
-                    value = sub_instance
-                else:
-                    value = value
-            validate(field, value)
-            # 设置字段值
-            setattr(instance, field.name, value)
+    codec = get_codec(type(instance))
+    configuration = getattr(type(instance), '__CONF_ROOT__', None) if instrument.enabled else None
+    if configuration is None:
+        codec.decode(instance, data, custom)
+        return
+    started = time.perf_counter()
+    if not codec.has_validators:
+        # 没有校验函数的配置类不记录 validate
+        try:
+            codec.decode(instance, data, custom)
+        except Exception as e:
+            instrument.record(configuration, 'data2obj', time.perf_counter() - started, e)
+            raise
+        instrument.record(configuration, 'data2obj', time.perf_counter() - started)
+        return
+    try:
+        validated = codec.timed_decode(instance, data, custom)
+    except ValidateException as e:
+        instrument.record(configuration, 'validate', 0.0, e)
+        instrument.record(configuration, 'data2obj', time.perf_counter() - started, e)
+        raise
+    except Exception as e:
+        instrument.record(configuration, 'data2obj', time.perf_counter() - started, e)
+        raise
+    instrument.record(configuration, 'validate', validated)
+    instrument.record(configuration, 'data2obj', time.perf_counter() - started)
 
 
 def obj2data(obj: Any) -> Dict[str, Any]:
@@ -45,16 +188,5 @@ def obj2data(obj: Any) -> Dict[str, Any]:
     递归地将dataclass实例及其嵌套的dataclass字段转换为字典。
     """
     if is_config_class(obj):
-        # 对于dataclass实例，递归地处理其字段
-        res = {}
-        for field in fields(obj):
-            value = getattr(obj, field.name)
-            # 尝试获取serialize函数并调用之。
-            if 'serialize' in field.metadata and (serialize_func := field.metadata['serialize']) is not None:
-                value = serialize_func(value)
-                res[field.name] = value
-                # 在进行用户自定义 serialize之后，不再进入递归。
-                continue
-            res[field.name] = obj2data(value)
-        return res
+        return get_codec(type(obj)).encode(obj)
     return obj
@@ -0,0 +1,263 @@
+import copy
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import threading
+import weakref
+from typing import Optional, Callable, Dict, List, Set, Any, Tuple
+
+from conf_root import lazy
+from conf_root.cache import FileStamp
+from conf_root.Configuration import schema_of
+from conf_root.utils import ValidateException
+
+logger = logging.getLogger(__name__)
+
+# callback(instance, {字段名: (旧值, 新值)})
+ChangeCallback = Callable[[Any, Dict[str, Tuple[Any, Any]]], None]
+
+
+class Inotify:
+    """
+    通过 ctypes 调用 Linux inotify。监视文件所在的目录而不是文件本身，
+    因为保存时以 os.replace 替换文件，文件本身的监视会随旧文件一起失效。
+    """
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    EVENT = struct.Struct('iIII')
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library('c')
+        if libc_name is None:
+            raise OSError('libc not found')
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError('inotify is not available')
+        self._libc = libc
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self._directories: Dict[int, str] = {}
+
+    def add_directory(self, directory: str) -> None:
+        if directory in self._directories.values():
+            return
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), self.MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f'inotify_add_watch failed for {directory}')
+        self._directories[wd] = directory
+
+    def read(self, timeout: float) -> Set[str]:
+        """
+        等待至多 timeout 秒，返回发生变化的路径。
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            buffer = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        changed = set()
+        offset = 0
+        while offset + self.EVENT.size <= len(buffer):
+            wd, _, _, length = self.EVENT.unpack_from(buffer, offset)
+            offset += self.EVENT.size
+            name = buffer[offset:offset + length].rstrip(b'\0')
+            offset += length
+            directory = self._directories.get(wd)
+            if directory is not None and name:
+                changed.add(os.path.join(directory, os.fsdecode(name)))
+        return changed
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class _Watch:
+    __slots__ = ('ref', 'configuration', 'callback')
+
+    def __init__(self, ref, configuration, callback):
+        self.ref = ref
+        self.configuration = configuration
+        self.callback = callback
+
+
+class Watcher:
+    """
+    监视配置文件，文件变化时重新加载并原地更新已注册的实例。
+
+    - 优先使用 inotify；不可用时每隔 interval 秒对全部文件批量 stat。
+    - 每个变化的文件只解析一次，字段确有变化的实例才会被更新并调用 callback。
+    - 只保存实例的弱引用，实例被回收后自动取消监视。
+    更新在监视线程中进行。
+    """
+
+    def __init__(self, interval: float = 1.0, use_inotify: bool = True):
+        self.interval = interval
+        self.use_inotify = use_inotify
+        self._watches: Dict[str, List[_Watch]] = {}
+        self._stamps: Dict[str, Optional[FileStamp]] = {}
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._inotify: Optional[Inotify] = None
+
+    @property
+    def backend(self) -> str:
+        return 'inotify' if self._inotify is not None else 'polling'
+
+    def watch(self, instance, callback: Optional[ChangeCallback] = None) -> None:
+        configuration = getattr(type(instance), '__CONF_ROOT__')
+        location = configuration.conf_root.agent.get_configuration_location(configuration)
+        if location is None:
+            raise ValueError(f'{configuration.name} is not stored in a file.')
+        location = os.path.abspath(location)
+        with self._lock:
+            watches = self._watches.setdefault(location, [])
+            ref = weakref.ref(instance, lambda ref, location=location: self._forget(location, ref))
+            watches.append(_Watch(ref, configuration, callback))
+            if location not in self._stamps:
+                self._stamps[location] = FileStamp.of(location)
+            self._start()
+            if self._inotify is not None:
+                self._inotify.add_directory(os.path.dirname(location))
+
+    def unwatch(self, instance) -> None:
+        with self._lock:
+            for location, watches in list(self._watches.items()):
+                watches[:] = [w for w in watches if w.ref() is not instance and w.ref() is not None]
+                if not watches:
+                    del self._watches[location]
+                    self._stamps.pop(location, None)
+
+    def _forget(self, location, ref) -> None:
+        with self._lock:
+            watches = self._watches.get(location)
+            if watches is None:
+                return
+            watches[:] = [w for w in watches if w.ref is not ref]
+            if not watches:
+                del self._watches[location]
+                self._stamps.pop(location, None)
+
+    def _start(self) -> None:
+        if self._thread is not None:
+            return
+        if self.use_inotify:
+            try:
+                self._inotify = Inotify()
+            except (OSError, AttributeError) as e:
+                logger.debug(f'inotify unavailable, fall back to polling: {e}')
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='conf-root-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join()
+        with self._lock:
+            self._thread = None
+            if self._inotify is not None:
+                self._inotify.close()
+                self._inotify = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            if self._inotify is not None:
+                candidates = self._inotify.read(self.interval)
+                with self._lock:
+                    # inotify 报告的变化不依赖 stat 指纹，直接重新加载
+                    changed = [location for location in candidates if location in self._watches]
+                    for location in changed:
+                        self._stamps[location] = FileStamp.of(location)
+            else:
+                self._stop.wait(self.interval)
+                changed = self._poll()
+            for location in changed:
+                try:
+                    self.reload(location)
+                except Exception:
+                    logger.exception(f'failed to reload {location}')
+
+    def _poll(self) -> List[str]:
+        changed = []
+        with self._lock:
+            for location, old in self._stamps.items():
+                stamp = FileStamp.of(location)
+                # 刚修改过的文件指纹不可信，在 racy 窗口内每次都重新加载
+                if stamp != old or (stamp is not None and stamp.is_racy()):
+                    self._stamps[location] = stamp
+                    changed.append(location)
+        return changed
+
+    def check(self) -> List[str]:
+        """
+        立即批量检查全部文件并重新加载变化的文件，返回变化的文件。
+        """
+        changed = self._poll()
+        for location in changed:
+            self.reload(location)
+        return changed
+
+    def reload(self, location: str) -> None:
+        with self._lock:
+            watches = list(self._watches.get(location, ()))
+        if not os.path.exists(location):
+            return
+        parsed = {}
+        for watch in watches:
+            instance = watch.ref()
+            # 尚未加载的延迟实例在加载时自然读到新内容
+            if instance is None or lazy.is_pending(instance):
+                continue
+            configuration = watch.configuration
+            agent = configuration.conf_root.agent
+            if configuration not in parsed:
+                parsed[configuration] = agent.read(configuration)
+            data = parsed[configuration]
+            if data is None:
+                continue
+            # 先加载到副本中，校验失败时实例保持不变
+            scratch = copy.copy(instance)
+            try:
+                agent.apply(configuration, scratch, copy.deepcopy(data))
+            except ValidateException as e:
+                logger.warning(f'ignore invalid change of {configuration.name}: {e}')
+                continue
+            changes = {}
+            for name in schema_of(type(instance)).names:
+                old, new = getattr(instance, name), getattr(scratch, name)
+                if old != new:
+                    changes[name] = (old, new)
+            if not changes:
+                continue
+            for name, (_, new) in changes.items():
+                setattr(instance, name, new)
+            if watch.callback is not None:
+                watch.callback(instance, changes)
+
+
+_watcher: Optional[Watcher] = None
+_watcher_lock = threading.Lock()
+
+
+def get_watcher() -> Watcher:
+    """
+    返回进程内共享的 Watcher。
+    """
+    global _watcher
+    if _watcher is None:
+        with _watcher_lock:
+            if _watcher is None:
+                _watcher = Watcher()
+    return _watcher
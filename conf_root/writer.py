@@ -0,0 +1,130 @@
+import atexit
+import logging
+import os
+import stat
+import threading
+import time
+from typing import Union, Optional, Dict, Tuple, Any
+
+logger = logging.getLogger(__name__)
+
+# none: 不调用fsync；file: 替换前fsync临时文件；full: 另外fsync所在目录，使替换本身持久化。
+FSYNC_POLICIES = ('none', 'file', 'full')
+
+
+def atomic_write(location, content: Union[str, bytes], fsync: str = 'none') -> None:
+    """
+    先写入同目录下的临时文件再用 os.replace 替换，写入中途崩溃不会留下不完整的文件。
+    location 为符号链接时写入其指向的文件，链接本身保持不变。
+    """
+    if fsync not in FSYNC_POLICIES:
+        raise ValueError(f'fsync should be one of {FSYNC_POLICIES}, got {fsync!r}')
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    location = os.path.realpath(os.fspath(location))
+    directory = os.path.dirname(location)
+    tmp = os.path.join(directory, f'.{os.path.basename(location)}.{os.urandom(8).hex()}.tmp')
+    try:
+        # 'x' 模式创建的文件权限遵循 umask，与直接写入时一致。
+        with open(tmp, 'xb') as f:
+            f.write(content)
+            if fsync != 'none':
+                f.flush()
+                os.fsync(f.fileno())
+        try:
+            os.chmod(tmp, stat.S_IMODE(os.stat(location).st_mode))
+        except FileNotFoundError:
+            pass
+        os.replace(tmp, location)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+    if fsync == 'full' and hasattr(os, 'O_DIRECTORY'):
+        fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+class WriteBehindWriter:
+    """
+    在独立线程中执行agent的保存。同一配置的多次保存只写入最后一次。
+
+    - delay: 收到第一次保存后等待的秒数，用于合并短时间内的连续保存。
+    - wait(): 等待已提交的保存全部写入。
+    - flush(): 不再等待 delay，立即写入并等待完成。
+    写入线程中的异常会在下一次 wait/flush 时抛出。
+    """
+
+    def __init__(self, agent, delay: float = 0.0):
+        self.agent = agent
+        self.delay = delay
+        self._pending: Dict[Tuple[Any, str], Tuple[Any, Any]] = {}
+        self._first_submit: Optional[float] = None
+        self._writing = False
+        self._force = False
+        self._error: Optional[BaseException] = None
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, pending: Dict[Tuple[Any, str], Tuple[Any, Any]]) -> None:
+        """
+        提交 {(location, name): (configuration, instance)}，instance 应当是保存时的快照。
+        """
+        with self._cond:
+            if not self._pending:
+                self._first_submit = time.monotonic()
+            self._pending.update(pending)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='conf-root-writer', daemon=True)
+                self._thread.start()
+                # 进程退出前写完剩余的保存
+                atexit.register(self.flush)
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._pending:
+                        remaining = self._first_submit + self.delay - time.monotonic()
+                        if self._force or remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    else:
+                        self._cond.wait()
+                pending, self._pending = self._pending, {}
+                self._writing = True
+            try:
+                self.agent.flush_batch(pending)
+            except BaseException as e:
+                logger.exception('write-behind save failed')
+                self._error = e
+            finally:
+                with self._cond:
+                    self._writing = False
+                    if not self._pending:
+                        self._force = False
+                    self._cond.notify_all()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待已提交的保存写入完成；超时返回 False。
+        """
+        with self._cond:
+            done = self._cond.wait_for(lambda: not self._pending and not self._writing, timeout)
+            error, self._error = self._error, None
+        if error is not None:
+            raise error
+        return done
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        with self._cond:
+            if self._pending:
+                self._force = True
+                self._cond.notify_all()
+        return self.wait(timeout)
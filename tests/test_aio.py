@@ -0,0 +1,109 @@
+import os
+import shutil
+import threading
+import unittest
+from dataclasses import field
+from typing import List
+
+from conf_root import ConfRoot, YamlAgent
+
+
+class TestAsyncio(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.directory = 'async_configs'
+        self.threads = []
+        origin_read, origin_write = YamlAgent.read, YamlAgent.write
+
+        def read(agent, configuration):
+            self.threads.append(threading.current_thread())
+            return origin_read(agent, configuration)
+
+        def write(agent, configuration, instance):
+            self.threads.append(threading.current_thread())
+            return origin_write(agent, configuration, instance)
+
+        YamlAgent.read, YamlAgent.write = read, write
+        self.addCleanup(setattr, YamlAgent, 'read', origin_read)
+        self.addCleanup(setattr, YamlAgent, 'write', origin_write)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def make_class(self, name='app', lazy=False):
+        @ConfRoot(self.directory, lazy=lazy).config(name, dynamic=True)
+        class AppConfig:
+            port: int = 5432
+            hosts: List = field(default_factory=lambda: ['a'])
+
+        return AppConfig
+
+    def assert_off_loop(self):
+        self.assertTrue(self.threads)
+        self.assertNotIn(threading.current_thread(), self.threads)
+
+    async def test_acreate(self):
+        AppConfig = self.make_class()
+        conf = await ConfRoot.acreate(AppConfig)
+        self.assertTrue(os.path.exists(os.path.join(self.directory, 'app.yml')))
+        with open(os.path.join(self.directory, 'app.yml'), 'w') as f:
+            f.write('port: 7000\nhosts: [b]\n')
+        conf = await ConfRoot.acreate(AppConfig, port=1)
+        self.assertEqual((conf.port, conf.hosts), (7000, ['b']))
+        self.assert_off_loop()
+
+    async def test_acreate_lazy(self):
+        AppConfig = self.make_class(lazy=True)
+        conf = await ConfRoot.acreate(AppConfig)
+        self.assertTrue(os.path.exists(os.path.join(self.directory, 'app.yml')))
+        self.assertEqual(conf.port, 5432)
+        self.assert_off_loop()
+
+    async def test_acreate_nested(self):
+        conf_root = ConfRoot(self.directory)
+
+        @conf_root.config('sub')
+        class SubConfig:
+            v: int = 1
+
+        @conf_root.config('outer')
+        class OuterConfig:
+            sub: SubConfig = field(default_factory=SubConfig)
+
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, 'sub.yml'), 'w') as f:
+            f.write('v: 7\n')
+        self.assertEqual(OuterConfig().sub.v, 7)
+        os.remove(os.path.join(self.directory, 'outer.yml'))
+        self.threads.clear()
+
+        conf = await ConfRoot.acreate(OuterConfig)
+        self.assertEqual(conf.sub.v, 7)
+        with open(os.path.join(self.directory, 'outer.yml')) as f:
+            self.assertIn('v: 7', f.read())
+        self.assert_off_loop()
+
+    async def test_asave_aload(self):
+        AppConfig = self.make_class()
+        conf = await ConfRoot.acreate(AppConfig)
+        conf.port = 8000
+        await conf.asave()
+        other = await ConfRoot.acreate(AppConfig)
+        other.port = 0
+        await other.aload()
+        self.assertEqual(other.port, 8000)
+        self.assert_off_loop()
+
+    async def test_aload_all(self):
+        conf_root = ConfRoot(self.directory)
+        classes = [conf_root.config(f'app{i}')(type(f'App{i}', (), {'__annotations__': {'x': int}, 'x': i}))
+                   for i in range(10)]
+        instances = await conf_root.aload_all()
+        self.assertEqual([type(i) for i in instances], classes)
+        self.assertEqual(len(os.listdir(self.directory)), 10)
+        self.assert_off_loop()
+
+    async def test_init_outside_acreate(self):
+        # 普通实例化的行为不变
+        AppConfig = self.make_class()
+        AppConfig()
+        self.assertTrue(os.path.exists(os.path.join(self.directory, 'app.yml')))
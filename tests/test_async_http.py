@@ -0,0 +1,122 @@
+import asyncio
+import json
+import os
+import shutil
+import unittest
+from unittest import mock
+
+from conf_root import ConfRoot
+from conf_root.async_http import AsyncEditorServer
+from conf_root.run_http import EditorApp, dataclass_to_wtform
+
+
+class TestAsyncHttp(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.directory = 'async_http_configs'
+
+        @ConfRoot(self.directory).config('app', dynamic=True)
+        class AppConfig:
+            name: str = 'demo'
+            port: int = 5432
+
+        self.AppConfig = AppConfig
+        self.server = AsyncEditorServer(EditorApp({AppConfig: dataclass_to_wtform(AppConfig)}), max_workers=4)
+        server = await self.server.start('127.0.0.1', 0)
+        self.port = server.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        await self.server.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    async def request(self, reader, writer, method, path, body=b'', headers=''):
+        writer.write(f'{method} {path} HTTP/1.1\r\nHost: test\r\nContent-Length: {len(body)}\r\n{headers}\r\n'
+                     .encode('latin-1') + body)
+        await writer.drain()
+        head = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1')
+        length = int(head.lower().split('content-length:')[1].split('\r\n')[0])
+        return int(head.split(' ')[1]), head, await reader.readexactly(length)
+
+    async def open_events(self):
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+        writer.write(b'GET /events HTTP/1.1\r\nHost: test\r\n\r\n')
+        await writer.drain()
+        head = await reader.readuntil(b'\r\n\r\n')
+        self.assertIn(b'text/event-stream', head)
+        self.assertEqual(await reader.readuntil(b'\n\n'), b': connected\n\n')
+        self.addAsyncCleanup(self.close_writer, writer)
+        return reader
+
+    @staticmethod
+    async def close_writer(writer):
+        writer.close()
+
+    async def next_event(self, reader):
+        while True:
+            message = await asyncio.wait_for(reader.readuntil(b'\n\n'), 5)
+            if message.startswith(b'event: change'):
+                return json.loads(message.split(b'data: ', 1)[1])
+
+    async def test_keep_alive_requests(self):
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+        status, _, body = await self.request(reader, writer, 'GET', '/')
+        self.assertEqual(status, 200)
+        status, head, body = await self.request(reader, writer, 'GET', '/api/AppConfig')
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body), {'name': 'demo', 'port': 5432})
+        status, _, _ = await self.request(reader, writer, 'GET', '/missing')
+        self.assertEqual(status, 404)
+        writer.close()
+
+    async def test_handler_error(self):
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+        with mock.patch.object(self.server.app, 'handle', side_effect=RuntimeError('boom')):
+            with self.assertLogs('conf_root.async_http', 'ERROR'):
+                status, _, _ = await self.request(reader, writer, 'GET', '/api/AppConfig')
+        self.assertEqual(status, 500)
+        # 连接仍可继续使用
+        status, _, _ = await self.request(reader, writer, 'GET', '/api/AppConfig')
+        self.assertEqual(status, 200)
+        writer.close()
+
+    async def test_invalid_content_length(self):
+        for length in ('abc', '-1'):
+            reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+            writer.write(f'PUT /api/AppConfig HTTP/1.1\r\nHost: test\r\nContent-Length: {length}\r\n\r\n'
+                         .encode('latin-1'))
+            await writer.drain()
+            head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), 5)
+            self.assertTrue(head.startswith(b'HTTP/1.1 400 '))
+            self.assertIn(b'Connection: close', head)
+            self.assertEqual(await asyncio.wait_for(reader.read(), 5), b'')
+            writer.close()
+
+    async def test_event_on_save(self):
+        events = await self.open_events()
+        conf = self.AppConfig()
+        conf.port = 7000
+        await asyncio.to_thread(conf.save)
+        event = await self.next_event(events)
+        self.assertEqual(event['name'], 'AppConfig')
+
+        # 通过API修改同样会推送，ETag 与 API 返回的一致
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+        status, head, _ = await self.request(reader, writer, 'PUT', '/api/AppConfig', b'{"port": 8000}')
+        writer.close()
+        self.assertEqual(status, 200)
+        event = await self.next_event(events)
+        self.assertIn(f'ETag: {event["etag"]}', head)
+
+    async def test_event_on_file_change(self):
+        events = await self.open_events()
+        with open(os.path.join(self.directory, 'app.yml'), 'w') as f:
+            f.write('name: changed\nport: 9000\n')
+        event = await self.next_event(events)
+        self.assertEqual(event['name'], 'AppConfig')
+
+    async def test_many_idle_clients(self):
+        readers = [await self.open_events() for _ in range(50)]
+        conf = self.AppConfig()
+        conf.port = 1
+        await asyncio.to_thread(conf.save)
+        results = await asyncio.gather(*(self.next_event(reader) for reader in readers))
+        self.assertEqual({event['name'] for event in results}, {'AppConfig'})
@@ -0,0 +1,121 @@
+import os
+import unittest
+from dataclasses import make_dataclass
+from unittest import mock
+
+from conf_root import ConfRoot, YamlAgent, JsonAgent, SingleFileYamlAgent
+from conf_root.agents.YamlAgent import SharedDocument
+
+
+class TestBatch(unittest.TestCase):
+    def __init__(self, methodName="runTest"):
+        super().__init__(methodName)
+        self.locations = []
+
+    def tearDown(self):
+        for location in self.locations:
+            try:
+                os.remove(location)
+            except FileNotFoundError:
+                pass
+
+    def make_classes(self, conf_root, count, dynamic=True):
+        classes = []
+        for i in range(count):
+            cls = make_dataclass(f'BatchConfig{i}', [('value', int, i)])
+            classes.append(conf_root.config(dynamic=dynamic)(cls))
+            location = conf_root.agent.get_configuration_location(cls.__CONF_ROOT__)
+            if location not in self.locations:
+                self.locations.append(location)
+        return classes
+
+    def test_multi_file_coalesce(self):
+        for agent_class in [YamlAgent, JsonAgent]:
+            conf_root = ConfRoot(agent_class=agent_class)
+            cls, = self.make_classes(conf_root, 1)
+            instance = cls()
+            with mock.patch.object(agent_class, 'write', autospec=True, side_effect=agent_class.write) as write:
+                with conf_root.batch():
+                    for i in range(5):
+                        instance.value = i
+                        instance.save()
+                    self.assertEqual(write.call_count, 0)
+            self.assertEqual(write.call_count, 1)
+            self.assertEqual(cls().value, 4)
+
+    def test_snapshot_at_save(self):
+        conf_root = ConfRoot(agent_class=YamlAgent)
+        cls, = self.make_classes(conf_root, 1)
+        instance = cls()
+        with conf_root.batch():
+            instance.value = 42
+            instance.save()
+            instance.value = 43
+        self.assertEqual(cls().value, 42)
+
+    def test_single_file_written_once(self):
+        location = 'batch_settings.yml'
+        self.locations.append(location)
+        conf_root = ConfRoot(location, agent_class=SingleFileYamlAgent)
+        classes = self.make_classes(conf_root, 10)
+        with mock.patch.object(SharedDocument, 'update', autospec=True, side_effect=SharedDocument.update) as update:
+            with conf_root.batch():
+                # 首次启动，为全部配置创建默认值
+                for cls in classes:
+                    cls()
+        self.assertEqual(update.call_count, 1)
+        with open(location) as f:
+            content = f.read()
+        for cls in classes:
+            self.assertIn(cls.__CONF_ROOT__.name, content)
+
+    def test_rollback_on_exception(self):
+        conf_root = ConfRoot(agent_class=YamlAgent)
+        cls, = self.make_classes(conf_root, 1)
+        with self.assertRaises(RuntimeError):
+            with conf_root.batch():
+                cls()
+                raise RuntimeError()
+        self.assertFalse(os.path.exists(self.locations[0]))
+
+    def test_nested_rollback(self):
+        conf_root = ConfRoot(agent_class=YamlAgent)
+        cls1, cls2 = self.make_classes(conf_root, 2)
+        with conf_root.batch():
+            cls1()
+            try:
+                with conf_root.batch():
+                    cls2()
+                    raise RuntimeError()
+            except RuntimeError:
+                pass
+        self.assertTrue(os.path.exists(self.locations[0]))
+        self.assertFalse(os.path.exists(self.locations[1]))
+
+    def test_restore_when_flush_fails(self):
+        conf_root = ConfRoot(agent_class=YamlAgent)
+        cls1, cls2 = self.make_classes(conf_root, 2)
+        instance1 = cls1()
+        with open(self.locations[0]) as f:
+            original = f.read()
+        written = []
+
+        def write(agent, configuration, instance):
+            if written:
+                raise OSError('disk full')
+            written.append(configuration)
+            YamlAgent.write(agent, configuration, instance)
+
+        with mock.patch.object(YamlAgent, 'write', autospec=True, side_effect=write):
+            with self.assertRaises(OSError):
+                with conf_root.batch():
+                    instance1.value = 100
+                    instance1.save()
+                    cls2()
+        with open(self.locations[0]) as f:
+            self.assertEqual(f.read(), original)
+        self.assertFalse(os.path.exists(self.locations[1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import os
+import time
+import unittest
+from dataclasses import field
+from typing import List
+from unittest import mock
+
+from conf_root import ConfRoot, YamlAgent
+from conf_root.cache import data_cache
+from tests.utils import replace_text
+
+
+def age_file(filename, seconds=10):
+    # 将文件的mtime调早，使其越过 racy 窗口而可被缓存。
+    past = time.time() - seconds
+    os.utime(filename, (past, past))
+
+
+class TestDataCache(unittest.TestCase):
+    def __init__(self, methodName="runTest"):
+        super().__init__(methodName)
+        self.location = 'cached_config.yml'
+
+    def setUp(self):
+        data_cache.invalidate()
+        data_cache.ttl = 0.0
+
+    def tearDown(self):
+        data_cache.ttl = 0.0
+        try:
+            os.remove(self.location)
+        except FileNotFoundError:
+            pass
+
+    def make_class(self):
+        @ConfRoot().config(self.location)
+        class AppConfig:
+            port: int = 5432
+            hosts: List = field(default_factory=lambda: ['a', 'b'])
+
+        return AppConfig
+
+    def test_hit_skips_parse(self):
+        AppConfig = self.make_class()
+        AppConfig()
+        age_file(self.location)
+        AppConfig()  # 解析并放入缓存
+        with mock.patch.object(YamlAgent, 'read', side_effect=AssertionError('should not parse')):
+            conf = AppConfig()
+        self.assertEqual(conf.port, 5432)
+        self.assertEqual(conf.hosts, ['a', 'b'])
+
+    def test_instances_do_not_share_values(self):
+        AppConfig = self.make_class()
+        AppConfig()
+        age_file(self.location)
+        AppConfig()
+        conf1 = AppConfig()
+        conf1.hosts.append('c')
+        conf2 = AppConfig()
+        self.assertEqual(conf2.hosts, ['a', 'b'])
+
+    def test_file_change_invalidates(self):
+        AppConfig = self.make_class()
+        AppConfig()
+        age_file(self.location)
+        AppConfig()
+        replace_text(self.location, '5432', '1234')
+        self.assertEqual(AppConfig().port, 1234)
+
+    def test_racy_file_not_cached(self):
+        AppConfig = self.make_class()
+        AppConfig()
+        AppConfig()
+        # 刚写入的文件即使指纹未变也不应命中缓存
+        replace_text(self.location, '5432', '5433')
+        self.assertEqual(AppConfig().port, 5433)
+
+    def test_ttl_skips_stat(self):
+        data_cache.ttl = 60
+        AppConfig = self.make_class()
+        AppConfig()
+        age_file(self.location)
+        AppConfig()
+        with mock.patch('conf_root.cache.os.stat', side_effect=AssertionError('should not stat')):
+            self.assertEqual(AppConfig().port, 5432)
+
+
+if __name__ == '__main__':
+    unittest.main()
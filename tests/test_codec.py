@@ -0,0 +1,59 @@
+import unittest
+from dataclasses import field
+
+from conf_root import ConfRoot, ValidateException
+from conf_root.utils import data2obj, obj2data, get_codec
+
+
+@ConfRoot(agent_class=None).config
+class Inner:
+    value: int = 1
+    name: str = field(default='inner', metadata={'serialize': str.upper, 'deserialize': str.lower})
+
+
+@ConfRoot(agent_class=None).config
+class Outer:
+    count: int = field(default=0, metadata={'validators': [lambda x: x >= 0]})
+    inner: Inner = field(default_factory=Inner)
+    tags: list = field(default_factory=list)
+
+
+class TestCodec(unittest.TestCase):
+    def test_encode(self):
+        outer = Outer(3, Inner(2, 'abc'), ['x'])
+        self.assertEqual(obj2data(outer), {'count': 3, 'inner': {'value': 2, 'name': 'ABC'}, 'tags': ['x']})
+        self.assertEqual(obj2data('plain'), 'plain')
+
+    def test_decode(self):
+        outer = Outer()
+        data2obj(outer, {'count': 5, 'inner': {'value': 7, 'name': 'XYZ'}}, custom=True)
+        self.assertEqual(outer.count, 5)
+        self.assertIsInstance(outer.inner, Inner)
+        self.assertEqual(outer.inner.value, 7)
+        self.assertEqual(outer.inner.name, 'xyz')
+        # 未出现的字段保持原值
+        self.assertEqual(outer.tags, [])
+
+    def test_decode_without_custom(self):
+        outer = Outer()
+        data2obj(outer, {'inner': {'name': 'XYZ'}})
+        self.assertEqual(outer.inner.name, 'XYZ')
+        self.assertIsNone(outer.inner.value)
+
+    def test_validators(self):
+        with self.assertRaises(ValidateException):
+            data2obj(Outer(), {'count': -1})
+
+    def test_round_trip(self):
+        outer = Outer(3, Inner(2, 'abc'), ['x', 'y'])
+        restored = Outer()
+        data2obj(restored, obj2data(outer), custom=True)
+        self.assertEqual(restored, outer)
+
+    def test_codec_cached_per_class(self):
+        self.assertIs(get_codec(Outer), get_codec(Outer))
+        self.assertIsNot(get_codec(Outer), get_codec(Inner))
+
+
+if __name__ == '__main__':
+    unittest.main()
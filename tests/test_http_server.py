@@ -0,0 +1,247 @@
+import http.client
+import json
+import os
+import shutil
+import socket
+import threading
+import unittest
+import urllib.parse
+from dataclasses import field
+
+from conf_root import ConfRoot, YamlAgent
+from conf_root.run_http import EditorApp, PooledHTTPServer, dataclass_to_wtform
+from tests.test_cache import age_file
+
+
+class TestHttpServer(unittest.TestCase):
+    def setUp(self):
+        self.directory = 'http_configs'
+
+        @ConfRoot(self.directory).config('app')
+        class AppConfig:
+            name: str = 'demo'
+            port: int = 5432
+
+        self.AppConfig = AppConfig
+        app = EditorApp({AppConfig: dataclass_to_wtform(AppConfig)})
+        self.server = PooledHTTPServer(('127.0.0.1', 0), app, max_workers=4)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.port = self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def connect(self):
+        return http.client.HTTPConnection('127.0.0.1', self.port, timeout=5)
+
+    def test_routes_keep_alive(self):
+        connection = self.connect()
+        connection.request('GET', '/')
+        response = connection.getresponse()
+        self.assertEqual(response.status, 200)
+        self.assertIn(b'/AppConfig', response.read())
+        sock = connection.sock
+        # 同一连接上的后续请求
+        connection.request('GET', '/AppConfig?x=1')
+        response = connection.getresponse()
+        self.assertEqual(response.status, 200)
+        self.assertIn(b'demo', response.read())
+        connection.request('GET', '/missing')
+        response = connection.getresponse()
+        self.assertEqual(response.status, 404)
+        response.read()
+        self.assertIs(connection.sock, sock)
+        connection.close()
+
+    def test_post(self):
+        connection = self.connect()
+        body = urllib.parse.urlencode({'name': 'changed', 'port': '7000'})
+        connection.request('POST', '/AppConfig', body, {'Content-Type': 'application/x-www-form-urlencoded'})
+        response = connection.getresponse()
+        self.assertEqual(response.status, 200)
+        response.read()
+        connection.close()
+        conf = self.AppConfig()
+        self.assertEqual((conf.name, conf.port), ('changed', 7000))
+
+    def test_slow_client_does_not_block(self):
+        # 只建立连接而不发送请求的客户端不影响其他请求
+        idle = socket.create_connection(('127.0.0.1', self.port))
+        try:
+            connection = self.connect()
+            connection.request('GET', '/')
+            self.assertEqual(connection.getresponse().status, 200)
+            connection.close()
+        finally:
+            idle.close()
+
+    def request(self, method, path, body=None, headers=None):
+        connection = self.connect()
+        if body is not None and not isinstance(body, (str, bytes)):
+            body = json.dumps(body)
+        connection.request(method, path, body, headers or {})
+        response = connection.getresponse()
+        content = response.read()
+        connection.close()
+        return response, content
+
+    def test_api_get(self):
+        response, content = self.request('GET', '/api/AppConfig')
+        self.assertEqual(response.status, 200)
+        self.assertEqual(json.loads(content), {'name': 'demo', 'port': 5432})
+        etag = response.getheader('ETag')
+        self.assertTrue(etag.startswith('"'))
+
+        response, content = self.request('GET', '/api/AppConfig', headers={'If-None-Match': etag})
+        self.assertEqual(response.status, 304)
+        self.assertEqual(content, b'')
+
+        response, _ = self.request('GET', '/api/Missing')
+        self.assertEqual(response.status, 404)
+
+    def test_api_put(self):
+        response, _ = self.request('GET', '/api/AppConfig')
+        etag = response.getheader('ETag')
+        response, content = self.request('PUT', '/api/AppConfig', {'port': 7000}, {'If-Match': etag})
+        self.assertEqual(response.status, 200)
+        self.assertEqual(json.loads(content), {'name': 'demo', 'port': 7000})
+        self.assertEqual(self.AppConfig().port, 7000)
+        new_etag = response.getheader('ETag')
+        self.assertNotEqual(new_etag, etag)
+
+        # 使用过期的ETag写入被拒绝
+        response, _ = self.request('PUT', '/api/AppConfig', {'port': 1}, {'If-Match': etag})
+        self.assertEqual(response.status, 412)
+        self.assertEqual(response.getheader('ETag'), new_etag)
+        self.assertEqual(self.AppConfig().port, 7000)
+
+        response, _ = self.request('GET', '/api/AppConfig', headers={'If-None-Match': new_etag})
+        self.assertEqual(response.status, 304)
+
+    def test_api_put_invalid(self):
+        response, _ = self.request('PUT', '/api/AppConfig', '[1, 2')
+        self.assertEqual(response.status, 400)
+        response, _ = self.request('PUT', '/api/AppConfig', [1, 2])
+        self.assertEqual(response.status, 400)
+
+
+class TestEditorSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.directory = 'snapshot_http_configs'
+        self.location = os.path.join(self.directory, 'app.yml')
+
+        @ConfRoot(self.directory).config('app')
+        class AppConfig:
+            name: str = 'demo'
+            port: int = 5432
+
+        self.AppConfig = AppConfig
+        self.app = EditorApp({AppConfig: dataclass_to_wtform(AppConfig)})
+        self.reads = 0
+        origin_read = YamlAgent.read
+
+        def read(agent, configuration):
+            self.reads += 1
+            return origin_read(agent, configuration)
+
+        YamlAgent.read = read
+        self.addCleanup(setattr, YamlAgent, 'read', origin_read)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def get(self, path):
+        return self.app.handle('GET', path, {}, b'')
+
+    def test_get_has_no_side_effects(self):
+        self.assertEqual(self.get('/AppConfig').status, 200)
+        self.assertEqual(json.loads(self.get('/api/AppConfig').body), {'name': 'demo', 'port': 5432})
+        self.assertFalse(os.path.exists(self.location))
+
+    def test_get_nested_has_no_side_effects(self):
+        conf_root = ConfRoot(self.directory)
+
+        @conf_root.config('sub')
+        class SubConfig:
+            v: int = 1
+
+        @conf_root.config('outer')
+        class OuterConfig:
+            sub: SubConfig = field(default_factory=SubConfig)
+
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, 'outer.yml'), 'w') as f:
+            f.write('sub:\n  v: 7\n')
+        app = EditorApp({OuterConfig: dataclass_to_wtform(OuterConfig)})
+        response = app.handle('GET', '/api/OuterConfig', {}, b'')
+        self.assertEqual(json.loads(response.body), {'sub': {'v': 7}})
+        self.assertEqual(os.listdir(self.directory), ['outer.yml'])
+
+    def test_nested_not_written(self):
+        # GET、POST、PUT 都不会创建嵌套配置的文件，lazy 模式下也是如此
+        for lazy in (False, True):
+            with self.subTest(lazy=lazy):
+                conf_root = ConfRoot(self.directory, lazy=lazy)
+
+                @conf_root.config('inner')
+                class InnerConfig:
+                    v: int = 1
+
+                @conf_root.config('outer')
+                class OuterConfig:
+                    name: str = 'x'
+                    inner: InnerConfig = field(default_factory=InnerConfig)
+
+                app = EditorApp({OuterConfig: dataclass_to_wtform(OuterConfig)})
+                self.assertEqual(app.handle('GET', '/OuterConfig', {}, b'').status, 200)
+                response = app.handle('GET', '/api/OuterConfig', {}, b'')
+                self.assertEqual(json.loads(response.body), {'name': 'x', 'inner': {'v': 1}})
+                self.assertFalse(os.path.exists(os.path.join(self.directory, 'inner.yml')))
+
+                response = app.handle('PUT', '/api/OuterConfig', {}, b'{"inner": {"v": 3}}')
+                self.assertEqual(json.loads(response.body), {'name': 'x', 'inner': {'v': 3}})
+                self.assertEqual(os.listdir(self.directory), ['outer.yml'])
+
+                body = urllib.parse.urlencode({'name': 'z', 'inner.v': '5'}).encode()
+                self.assertEqual(app.handle('POST', '/OuterConfig', {}, body).status, 200)
+                self.assertEqual(os.listdir(self.directory), ['outer.yml'])
+                response = app.handle('GET', '/api/OuterConfig', {}, b'')
+                self.assertEqual(json.loads(response.body), {'name': 'z', 'inner': {'v': 5}})
+                shutil.rmtree(self.directory)
+
+    def test_post_invalid(self):
+        # 数据类中的 validators 不属于表单的校验，失败时与 PUT 一样返回 422
+        @ConfRoot(self.directory).config('checked')
+        class CheckedConfig:
+            port: int = field(default=5432, metadata={'validators': [lambda x: 0 < x < 65536]})
+
+        app = EditorApp({CheckedConfig: dataclass_to_wtform(CheckedConfig)})
+        response = app.handle('POST', '/CheckedConfig', {}, b'port=70000')
+        self.assertEqual(response.status, 422)
+        self.assertIn('error', json.loads(response.body))
+        response = app.handle('PUT', '/api/CheckedConfig', {}, b'{"port": 70000}')
+        self.assertEqual(response.status, 422)
+        self.assertFalse(os.path.exists(os.path.join(self.directory, 'checked.yml')))
+
+    def test_get_uses_snapshot(self):
+        with open(self.location, 'w') as f:
+            f.write('name: saved\nport: 7000\n')
+        age_file(self.location)
+        for _ in range(5):
+            self.assertIn(b'saved', self.get('/AppConfig').body)
+            self.get('/api/AppConfig')
+        self.assertEqual(self.reads, 1)
+
+        # 文件变化后重新读取
+        with open(self.location, 'w') as f:
+            f.write('name: changed\nport: 7000\n')
+        self.assertIn(b'changed', self.get('/AppConfig').body)
+
+    def test_put_after_get(self):
+        etag = dict(self.get('/api/AppConfig').headers)['ETag']
+        response = self.app.handle('PUT', '/api/AppConfig', {'If-Match': etag}, b'{"port": 1}')
+        self.assertEqual(response.status, 200)
+        self.assertEqual(json.loads(self.get('/api/AppConfig').body), {'name': 'demo', 'port': 1})
@@ -0,0 +1,181 @@
+import os
+import shutil
+import unittest
+from dataclasses import field
+from unittest import mock
+
+import conf_root
+from conf_root import ConfRoot, YamlAgent, ValidateException
+from conf_root import instrument
+from conf_root.agents.SnapshotAgent import with_snapshot
+from conf_root.cache import data_cache
+from conf_root.run_http import EditorApp, dataclass_to_wtform
+from conf_root.utils import get_codec, obj2data
+from tests.test_cache import age_file
+
+
+class TestInstrument(unittest.TestCase):
+    def setUp(self):
+        data_cache.invalidate()
+        instrument.reset()
+        instrument.enable()
+        self.directory = 'instrument_configs'
+
+    def tearDown(self):
+        instrument.disable()
+        instrument.reset()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def make_class(self, agent_class=YamlAgent):
+        @ConfRoot(self.directory, agent_class=agent_class).config('app')
+        class AppConfig:
+            name: str = 'demo'
+            port: int = field(default=5432, metadata={'validators': [lambda x: 0 < x < 65536]})
+
+        return AppConfig
+
+    def test_load_and_save(self):
+        AppConfig = self.make_class()
+        AppConfig()  # 文件不存在，保存默认值
+        AppConfig()  # 读取
+        stats = conf_root.stats()['app']
+        operations = stats['operations']
+        self.assertEqual(operations['save']['count'], 1)
+        self.assertEqual(operations['load']['count'], 1)
+        self.assertEqual(operations['exist']['count'], 2)
+        self.assertEqual(operations['data2obj']['count'], 1)
+        self.assertEqual(operations['validate']['count'], 1)
+        location = os.path.join(self.directory, 'app.yml')
+        self.assertEqual(stats['bytes_written'], os.path.getsize(location))
+        self.assertEqual(stats['bytes_read'], os.path.getsize(location))
+        for key in ('total', 'mean', 'max', 'p50', 'p90', 'p99'):
+            self.assertGreaterEqual(operations['load'][key], 0.0)
+        self.assertLessEqual(operations['load']['p50'], operations['load']['max'])
+
+    def test_batch_bytes(self):
+        root = ConfRoot(self.directory)
+
+        @root.config('app', dynamic=True)
+        class AppConfig:
+            port: int = 5432
+
+        app_config = AppConfig()
+        instrument.reset()
+        with root.batch():
+            app_config.port = 7000
+            app_config.save()
+        location = os.path.join(self.directory, 'app.yml')
+        self.assertEqual(conf_root.stats()['app']['bytes_written'], os.path.getsize(location))
+
+    def test_write_behind_bytes(self):
+        root = ConfRoot(self.directory, write_behind=True)
+
+        @root.config('app')
+        class AppConfig:
+            port: int = 5432
+
+        AppConfig()
+        root.flush()
+        location = os.path.join(self.directory, 'app.yml')
+        self.assertEqual(conf_root.stats()['app']['bytes_written'], os.path.getsize(location))
+
+    def test_cache_hits(self):
+        AppConfig = self.make_class()
+        AppConfig()
+        age_file(os.path.join(self.directory, 'app.yml'))
+        AppConfig()
+        AppConfig()
+        AppConfig()
+        cache = conf_root.stats()['app']['cache']
+        self.assertEqual(cache['hits'], 2)
+        self.assertEqual(cache['misses'], 2)
+        self.assertEqual(cache['hit_rate'], 0.5)
+
+    def test_validate_error(self):
+        AppConfig = self.make_class()
+        AppConfig()
+        with open(os.path.join(self.directory, 'app.yml'), 'w') as f:
+            f.write('name: demo\nport: 0\n')
+        with self.assertRaises(ValidateException):
+            AppConfig()
+        operations = conf_root.stats()['app']['operations']
+        self.assertEqual(operations['validate']['errors'], 1)
+        self.assertEqual(operations['load']['errors'], 1)
+
+    def test_no_validators(self):
+        @ConfRoot(self.directory).config('plain')
+        class PlainConfig:
+            name: str = 'demo'
+
+        PlainConfig()
+        PlainConfig()
+        operations = conf_root.stats()['plain']['operations']
+        self.assertEqual(operations['data2obj']['count'], 1)
+        self.assertNotIn('validate', operations)
+
+    def test_serve_metrics(self):
+        AppConfig = self.make_class()
+        instrument.disable()
+        with mock.patch('conf_root.run_http.run_http') as run_http:
+            ConfRoot.serve([AppConfig])
+            self.assertFalse(instrument.enabled)
+            run_http.side_effect = lambda *args, **kwargs: self.assertTrue(instrument.enabled)
+            ConfRoot.serve([AppConfig], metrics=True)
+        self.assertEqual(run_http.call_count, 2)
+        # 服务结束后恢复原来的状态
+        self.assertFalse(instrument.enabled)
+
+    def test_override_recorded_once(self):
+        # SnapshotMixin.exist 通过 super() 调用 YamlAgent.exist，只记录一次
+        AppConfig = self.make_class(with_snapshot(YamlAgent))
+        AppConfig()
+        AppConfig()
+        self.assertEqual(conf_root.stats()['app']['operations']['exist']['count'], 2)
+
+    def test_hook(self):
+        calls = []
+
+        def hook(configuration, operation, seconds, error):
+            calls.append((configuration.name, operation, error))
+
+        instrument.subscribe(hook)
+        try:
+            self.make_class()()
+        finally:
+            instrument.unsubscribe(hook)
+        self.assertIn(('app', 'save', None), calls)
+        self.assertIn(('app', 'exist', None), calls)
+
+    def test_disabled(self):
+        instrument.disable()
+        AppConfig = self.make_class()
+        AppConfig()
+        AppConfig()
+        self.assertEqual(conf_root.stats(), {})
+
+    def test_timed_decode(self):
+        AppConfig = self.make_class()
+        instance = AppConfig()
+        data = {'name': 'other', 'port': 80}
+        codec = get_codec(AppConfig)
+        self.assertGreaterEqual(codec.timed_decode(instance, data), 0.0)
+        self.assertEqual(obj2data(instance), data)
+        with self.assertRaises(ValidateException):
+            codec.timed_decode(instance, {'port': -1})
+
+    def test_metrics_endpoint(self):
+        AppConfig = self.make_class()
+        AppConfig()
+        app = EditorApp({AppConfig: dataclass_to_wtform(AppConfig)})
+        response = app.handle('GET', '/metrics', {}, b'')
+        self.assertEqual(response.status, 200)
+        self.assertTrue(dict(response.headers)['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.body.decode('utf-8')
+        self.assertIn('# TYPE conf_root_operation_seconds summary', text)
+        self.assertIn('conf_root_operation_seconds_count{config="app",operation="save"} 1', text)
+        self.assertIn('conf_root_operation_seconds{config="app",operation="save",quantile="0.99"}', text)
+        self.assertIn('conf_root_bytes_written_total{config="app"}', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import json
+import os
+import unittest
+from dataclasses import field, dataclass
+from typing import Dict
+
+from conf_root import ConfRoot, JsonAgent
+from conf_root.agents.JsonAgent import JSON_BACKENDS, get_json_backend
+
+
+@dataclass
+class Plain:
+    value: int = 1
+
+
+def available_backends():
+    backends = []
+    for name in JSON_BACKENDS:
+        try:
+            backends.append(get_json_backend(name))
+        except ImportError:
+            pass
+    return backends
+
+
+class TestJsonBackend(unittest.TestCase):
+    location = 'backend_config.json'
+
+    def tearDown(self):
+        try:
+            os.remove(self.location)
+        except FileNotFoundError:
+            pass
+
+    def make_class(self, backend):
+        conf_root = ConfRoot(agent_class=JsonAgent)
+        conf_root.agent.backend = backend
+
+        @conf_root.config(self.location, dynamic=True)
+        class AppConfig:
+            name: str = '配置'
+            table: Dict = field(default_factory=lambda: {'a': [1, 2.5, None, True]})
+            big: int = 2 ** 70
+
+        return AppConfig
+
+    def test_round_trip(self):
+        for backend in available_backends():
+            with self.subTest(backend=backend.name):
+                AppConfig = self.make_class(backend)
+                app_config = AppConfig()
+                app_config.table = {'b': list(range(10))}
+                app_config.save()
+                with open(self.location, encoding='utf-8') as f:
+                    data = json.load(f)
+                self.assertEqual(data['table'], {'b': list(range(10))})
+                self.assertEqual(data['big'], 2 ** 70)
+                loaded = AppConfig()
+                self.assertEqual(loaded.name, '配置')
+                self.assertEqual(loaded.table, {'b': list(range(10))})
+                self.assertEqual(loaded.big, 2 ** 70)
+                os.remove(self.location)
+
+    def test_same_output(self):
+        data = {'name': '配置', 'path': 'a/b', 'ratio': 1e-07, 'big': 2 ** 70, 'nan': float('nan'),
+                'nested': {'list': [1, 2.5, None, True]}}
+        expected = get_json_backend('json').dumps(data)
+        for backend in available_backends():
+            with self.subTest(backend=backend.name):
+                self.assertEqual(backend.dumps(data), expected)
+                with self.assertRaises(TypeError):
+                    backend.dumps({'plain': Plain()})
+
+    def test_default_backend(self):
+        backend = get_json_backend()
+        self.assertIs(backend, get_json_backend())
+        self.assertIn(backend.name, JSON_BACKENDS)
+        self.assertIs(JsonAgent('.').get_backend(), backend)
+
+    def test_unknown_backend(self):
+        with self.assertRaises(KeyError):
+            get_json_backend('no-such-backend')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+import copy
+import os
+import shutil
+import threading
+import unittest
+from dataclasses import field
+
+from conf_root import ConfRoot, JsonAgent, YamlAgent
+from conf_root.lazy import is_pending
+from conf_root.utils import obj2data, data2obj
+
+
+class TestLazy(unittest.TestCase):
+    def __init__(self, methodName="runTest"):
+        super().__init__(methodName)
+        self.location = 'lazy_config.yml'
+        self.content = """!AppConfig
+database_host: 127.0.0.1
+database_port: 1234
+"""
+
+    def tearDown(self):
+        try:
+            os.remove(self.location)
+        except FileNotFoundError:
+            pass
+
+    def write_content(self):
+        with open(self.location, 'w') as file:
+            file.write(self.content)
+
+    def make_class(self):
+        @ConfRoot(lazy=True).config(self.location, dynamic=True)
+        class AppConfig:
+            database_host: str = 'localhost'
+            database_port: int = 5432
+
+        return AppConfig
+
+    def test_no_io_until_read(self):
+        AppConfig = self.make_class()
+        app_config = AppConfig()
+        self.assertTrue(is_pending(app_config))
+        self.assertFalse(os.path.exists(self.location))
+        # 首次读取字段时才创建文件
+        self.assertEqual(app_config.database_port, 5432)
+        self.assertFalse(is_pending(app_config))
+        self.assertTrue(os.path.exists(self.location))
+
+    def test_load_on_first_read(self):
+        self.write_content()
+        AppConfig = self.make_class()
+        app_config = AppConfig()
+        self.assertEqual(app_config.database_host, '127.0.0.1')
+        self.assertEqual(app_config.database_port, 1234)
+        # 类属性仍然是默认值
+        self.assertEqual(AppConfig.database_port, 5432)
+
+    def test_assignment_before_read(self):
+        self.write_content()
+        AppConfig = self.make_class()
+        app_config = AppConfig()
+        data2obj(app_config, {'database_port': 9527})
+        # 加载之后仍然保留显式赋值的字段
+        self.assertEqual(app_config.database_port, 9527)
+        self.assertEqual(app_config.database_host, '127.0.0.1')
+
+    def test_concurrent_resolve(self):
+        started, release = threading.Event(), threading.Event()
+        origin_read = YamlAgent.read
+
+        def read(agent, configuration):
+            if configuration.name == 'slow':
+                started.set()
+                release.wait(30)
+            return origin_read(agent, configuration)
+
+        YamlAgent.read = read
+        self.addCleanup(setattr, YamlAgent, 'read', origin_read)
+        directory = 'lazy_configs'
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        conf_root = ConfRoot(directory, lazy=True)
+        Slow = conf_root.config('slow')(type('Slow', (), {'__annotations__': {'x': int}, 'x': 1}))
+        Fast = conf_root.config('fast')(type('Fast', (), {'__annotations__': {'x': int}, 'x': 2}))
+        os.makedirs(directory, exist_ok=True)
+        for name in ('slow', 'fast'):
+            with open(os.path.join(directory, f'{name}.yml'), 'w') as f:
+                f.write('x: 7\n')
+
+        slow, fast = Slow(), Fast()
+        values = []
+        thread = threading.Thread(target=lambda: values.append(slow.x))
+        thread.start()
+        self.assertTrue(started.wait(5))
+        try:
+            # 另一个实例的加载不必等待
+            other = threading.Thread(target=lambda: values.append(fast.x))
+            other.start()
+            other.join(5)
+            self.assertEqual(values, [7])
+        finally:
+            release.set()
+        # 同一实例在另一线程中等待加载完成
+        self.assertEqual(slow.x, 7)
+        thread.join(5)
+        self.assertEqual(values, [7, 7])
+        self.assertFalse(is_pending(slow))
+        # 复制待加载的实例
+        copied = copy.deepcopy(Slow())
+        self.assertEqual(copied.x, 7)
+
+    def test_obj2data(self):
+        self.write_content()
+        AppConfig = self.make_class()
+        data = obj2data(AppConfig())
+        self.assertEqual(data, {'database_host': '127.0.0.1', 'database_port': 1234})
+
+    def test_dynamic_save(self):
+        AppConfig = self.make_class()
+        app_config = AppConfig()
+        app_config.database_port = 3309
+        app_config.save()
+        with open(self.location, 'r') as file:
+            content = file.read()
+        self.assertTrue('3309' in content)
+
+    def test_dynamic_load(self):
+        self.write_content()
+        AppConfig = self.make_class()
+        app_config = AppConfig()
+        app_config.load()
+        self.assertFalse(is_pending(app_config))
+        self.assertEqual(app_config.database_port, 1234)
+
+    def test_nested(self):
+        @ConfRoot(agent_class=None, lazy=True).config
+        class Nested:
+            name: str = 'nested'
+
+        self.location = 'lazy_config.json'
+
+        @ConfRoot(agent_class=JsonAgent, lazy=True).config(self.location)
+        class AppConfig:
+            nested: Nested = field(default_factory=Nested)
+
+        with open(self.location, 'w') as file:
+            file.write('{"nested": {"name": "from_file"}}')
+        self.assertEqual(AppConfig().nested.name, 'from_file')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_python(code):
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return result.stdout.strip()
+
+
+class TestLazyImport(unittest.TestCase):
+    def test_no_heavy_modules(self):
+        modules = ['ruamel.yaml', 'wtforms', 'jinja2', 'http.server', 'asyncio', 'sqlite3',
+                   'multiprocessing.shared_memory']
+        output = run_python(f'import sys, conf_root; print([m for m in {modules!r} if m in sys.modules])')
+        self.assertEqual(output, '[]')
+
+    def test_lazy_attributes(self):
+        output = run_python('import sys, conf_root\n'
+                            'print("sqlite3" in sys.modules, "SqliteAgent" in dir(conf_root))\n'
+                            'from conf_root import SqliteAgent, JsonAgent\n'
+                            'print("sqlite3" in sys.modules, SqliteAgent.__name__, JsonAgent.__name__)')
+        self.assertEqual(output.splitlines(), ['False True', 'True SqliteAgent JsonAgent'])
+
+    def test_yaml_imported_on_use(self):
+        output = run_python('import sys, tempfile\n'
+                            'from conf_root import ConfRoot\n'
+                            'with tempfile.TemporaryDirectory() as d:\n'
+                            '    @ConfRoot(d).config\n'
+                            '    class A:\n'
+                            '        x: int = 1\n'
+                            '    print("ruamel.yaml" in sys.modules)\n'
+                            '    A()\n'
+                            '    print("ruamel.yaml" in sys.modules)')
+        self.assertEqual(output.splitlines(), ['False', 'True'])
+
+    def test_unknown_attribute(self):
+        import conf_root
+        with self.assertRaises(AttributeError):
+            getattr(conf_root, 'NoSuchAgent')
@@ -0,0 +1,78 @@
+import os
+import shutil
+import threading
+import unittest
+
+from conf_root import ConfRoot
+from conf_root.lazy import is_pending
+
+
+class TestRegistry(unittest.TestCase):
+    def setUp(self):
+        self.directory = 'registry_configs'
+        self.conf_root = ConfRoot(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def make_class(self, name, default=0):
+        cls = type(name, (), {'__annotations__': {'value': int}, 'value': default})
+        return self.conf_root.config(name)(cls)
+
+    def test_lookup(self):
+        First = self.make_class('first')
+        Second = self.make_class('second')
+        self.assertEqual(list(self.conf_root.configurations), ['first', 'second'])
+        self.assertIs(self.conf_root.get_configuration('second'), Second.__CONF_ROOT__)
+        self.assertIs(self.conf_root.get_configuration(First), First.__CONF_ROOT__)
+        self.assertEqual(self.conf_root.classes, [First, Second])
+
+    def test_redefine(self):
+        self.make_class('first')
+        First = self.make_class('first', 1)
+        self.assertEqual(self.conf_root.classes, [First])
+
+    def test_load_all(self):
+        classes = [self.make_class(f'config{i}', i) for i in range(20)]
+        threads = set()
+        origin = self.conf_root.post_init
+
+        def post_init(instance, configuration):
+            threads.add(threading.current_thread())
+            origin(instance, configuration)
+
+        self.conf_root.post_init = post_init
+        results = self.conf_root.load_all(max_workers=4)
+        self.assertEqual([r.name for r in results], [f'config{i}' for i in range(20)])
+        self.assertTrue(all(r.error is None and r.seconds >= 0 for r in results))
+        self.assertEqual([type(r.instance) for r in results], classes)
+        self.assertNotIn(threading.current_thread(), threads)
+        self.assertEqual(len(os.listdir(self.directory)), 20)
+
+    def test_load_all_lazy(self):
+        self.conf_root = ConfRoot(self.directory, lazy=True)
+        self.make_class('first')
+        self.make_class('second')
+        results = self.conf_root.load_all()
+        self.assertTrue(all(r.error is None and not is_pending(r.instance) for r in results))
+        self.assertEqual(sorted(os.listdir(self.directory)), ['first.yml', 'second.yml'])
+
+    def test_errors(self):
+        self.make_class('good')
+        self.make_class('bad')
+        with open(os.path.join(self.directory, 'bad.yml'), 'w') as f:
+            f.write('value: [unclosed\n')
+        results = {r.name: r for r in self.conf_root.load_all()}
+        self.assertIsNone(results['good'].error)
+        self.assertIsNotNone(results['bad'].error)
+        self.assertIsNone(results['bad'].instance)
+
+    def test_save_all(self):
+        self.make_class('first')
+        Second = self.make_class('second')
+        self.conf_root.load_all()
+        for instance in self.conf_root.instances.values():
+            instance.value = 42
+        results = self.conf_root.save_all()
+        self.assertTrue(all(r.error is None for r in results))
+        self.assertEqual(Second().value, 42)
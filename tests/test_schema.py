@@ -0,0 +1,149 @@
+import os
+import shutil
+import subprocess
+import sys
+import unittest
+from dataclasses import dataclass, field, MISSING
+from types import MappingProxyType
+
+from conf_root import ConfRoot, ValidateException
+from conf_root.Configuration import schema_of, field_default
+
+
+@dataclass
+class Plain:
+    value: int = 1
+
+
+@ConfRoot(agent_class=None).config
+class Nested:
+    plain: Plain = field(default_factory=Plain)
+
+
+@ConfRoot(agent_class=None).config
+class AppConfig:
+    required: str
+    port: int = field(default=5432, metadata={'comment': 'port', 'validators': [lambda x: x > 0]})
+    nested: Nested = field(default_factory=Nested)
+    other: Nested = field(default_factory=Nested)
+    tags: list = field(default_factory=list, metadata={'serialize': ','.join, 'deserialize': lambda s: s.split(',')})
+
+
+class TestSchema(unittest.TestCase):
+    def test_fields(self):
+        schema = AppConfig.__CONF_ROOT__.schema
+        self.assertIs(schema, schema_of(AppConfig))
+        self.assertEqual(schema.names, ('required', 'port', 'nested', 'other', 'tags'))
+        required, port, nested, _, tags = schema.fields
+        self.assertIs(required.default, MISSING)
+        self.assertEqual(port.comment, 'port')
+        self.assertEqual(len(port.validators), 1)
+        self.assertTrue(nested.is_config)
+        self.assertTrue(nested.is_dataclass)
+        self.assertFalse(port.is_config)
+        self.assertIsNotNone(tags.serialize)
+        self.assertIsNotNone(tags.deserialize)
+        self.assertIsNone(port.serialize)
+
+    def test_all_dataclass(self):
+        # 重复出现的嵌套类只记录一次
+        self.assertEqual(AppConfig.__CONF_ROOT__.all_dataclass, (AppConfig, Nested, Plain))
+
+    def test_immutable(self):
+        schema = AppConfig.__CONF_ROOT__.schema
+        with self.assertRaises(AttributeError):
+            schema.fields[0].name = 'other'
+
+    def test_field_default(self):
+        required, port, nested, _, tags = AppConfig.__CONF_ROOT__.schema.fields
+        self.assertIs(field_default(required), MISSING)
+        self.assertEqual(field_default(port), 5432)
+        self.assertIsInstance(field_default(nested), Nested)
+        self.assertEqual(field_default(tags), [])
+
+    def test_location_resolved(self):
+        conf_root = ConfRoot()
+
+        @conf_root.config('resolved')
+        class Resolved:
+            value: int = 1
+
+        configuration = Resolved.__CONF_ROOT__
+        location = conf_root.agent.get_configuration_location(configuration)
+        self.assertEqual(str(location), 'resolved.yml')
+        self.assertIs(conf_root.agent.get_configuration_location(configuration), location)
+        # 更换agent之后重新解析
+        conf_root.agent = conf_root.agent_class('.')
+        self.assertIsNot(conf_root.agent.get_configuration_location(configuration), location)
+        self.assertEqual(conf_root.agent.get_configuration_location(configuration), location)
+
+    def test_digest_tracks_hooks(self):
+        def digest(deserialize):
+            @ConfRoot(agent_class=None).config('hooked')
+            class Hooked:
+                value: int = field(default=1, metadata={'deserialize': deserialize})
+
+            return Hooked.__CONF_ROOT__.schema.digest
+
+        def scale(factor):
+            return lambda v: v * factor
+
+        self.assertEqual(digest(lambda v: v * 2), digest(lambda v: v * 2))
+        self.assertNotEqual(digest(lambda v: v * 2), digest(lambda v: v * 3))
+        self.assertNotEqual(digest(lambda v: abs(v)), digest(lambda v: round(v)))
+        self.assertNotEqual(digest(lambda v: [x for x in v if x > 1]), digest(lambda v: [x for x in v if x > 2]))
+        self.assertEqual(digest(scale(2)), digest(scale(2)))
+        self.assertNotEqual(digest(scale(2)), digest(scale(3)))
+
+    def test_digest_independent_of_hash_seed(self):
+        script = '''
+from conf_root import ConfRoot
+from dataclasses import field
+
+@ConfRoot(agent_class=None).config('seeded')
+class Seeded:
+    value: str = field(default='alpha', metadata={
+        'deserialize': lambda v: v if v in {'alpha', 'beta', 'gamma', 'delta'} else 'alpha',
+        'serialize': lambda v, allowed=frozenset(['x', 'y', 'z', 'w']): v if v in allowed else 'x'})
+
+print(Seeded.__CONF_ROOT__.schema.digest)
+'''
+        digests = set()
+        for seed in ('1', '2', '3'):
+            env = dict(os.environ, PYTHONHASHSEED=seed)
+            result = subprocess.run([sys.executable, '-c', script], env=env, capture_output=True, text=True,
+                                    check=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+            digests.add(result.stdout.strip())
+        self.assertEqual(len(digests), 1)
+
+    def test_refresh_schema(self):
+        directory = 'refresh_schema_configs'
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+
+        @ConfRoot(directory, lazy=True).config('refreshed', dynamic=True)
+        class Refreshed:
+            a: int = 1
+
+        configuration = Refreshed.__CONF_ROOT__
+        conf = Refreshed()
+        self.assertEqual(conf.a, 1)
+        fields = Refreshed.__dataclass_fields__
+        fields['a'].metadata = MappingProxyType({'validators': [lambda x: x < 5], 'comment': 'small'})
+        fields['a'].default = 2
+        configuration.refresh_schema()
+
+        # 延迟加载的字段使用新的默认值
+        self.assertEqual(Refreshed.a, 2)
+        # YAML 引擎使用新的注释
+        conf.save()
+        with open(os.path.join(directory, 'refreshed.yml')) as f:
+            self.assertIn('# small', f.read())
+        # 编解码函数使用新的校验函数
+        conf.a = 10
+        conf.save()
+        with self.assertRaises(ValidateException):
+            Refreshed().a
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import os
+import unittest
+from dataclasses import field
+from typing import List
+from unittest import mock
+
+from conf_root import ConfRoot, SingleFileYamlAgent
+from conf_root.agents import YamlAgent as yaml_agent_module
+from conf_root.cache import data_cache
+from tests.test_cache import age_file
+
+ORIGINAL = '''# 全局说明
+a: !a
+  # 端口说明
+  port: 80  # the port
+  ratio: 0.50
+  name: 'quoted'
+  hosts:
+    - x
+    - y
+
+# 关于 b
+b: !b
+  # b 的说明
+  name: bee
+# 结尾
+'''
+
+
+class TestSectionPatch(unittest.TestCase):
+    location = 'section_patch.yml'
+
+    def setUp(self):
+        data_cache.invalidate()
+        yaml_agent_module._documents.clear()
+        with open(self.location, 'w', encoding='utf-8') as f:
+            f.write(ORIGINAL)
+        age_file(self.location)
+        conf_root = ConfRoot(self.location, agent_class=SingleFileYamlAgent)
+
+        @conf_root.config('a', dynamic=True)
+        class A:
+            port: int = field(default=80, metadata={'comment': 'the port'})
+            ratio: float = 0.5
+            name: str = 'quoted'
+            hosts: List = field(default_factory=lambda: ['x', 'y'])
+
+        @conf_root.config('b', dynamic=True)
+        class B:
+            name: str = 'bee'
+
+        @conf_root.config('c', dynamic=True)
+        class C:
+            value: int = 1
+
+        self.A, self.B, self.C = A, B, C
+
+    def tearDown(self):
+        yaml_agent_module._documents.clear()
+        if os.path.exists(self.location):
+            os.remove(self.location)
+
+    def read(self):
+        with open(self.location, encoding='utf-8') as f:
+            return f.read()
+
+    def test_scalars_patched_in_place(self):
+        a = self.A()
+        a.port = 8080
+        a.ratio = 1.25
+        a.name = 'other'
+        a.hosts[1] = 'z'
+        a.save()
+        expected = (ORIGINAL.replace('port: 80 ', 'port: 8080 ').replace('0.50', '1.25')
+                    .replace("'quoted'", 'other').replace('- y', '- z'))
+        self.assertEqual(self.read(), expected)
+        a = self.A()
+        self.assertEqual((a.port, a.ratio, a.name, a.hosts), (8080, 1.25, 'other', ['x', 'z']))
+
+    def test_scalar_patch_does_not_dump_document(self):
+        a = self.A()
+        a.port = 8080
+        document = yaml_agent_module.get_document(self.location)
+        with mock.patch.object(document.engine, 'dump', wraps=document.engine.dump) as dump:
+            a.save()
+        # 只为格式化新旧两个标量调用 dump
+        for call in dump.call_args_list:
+            self.assertEqual(list(call.args[0]), ['x'])
+
+    def test_structural_change_replaces_one_section(self):
+        a = self.A()
+        a.hosts.append('z')
+        a.save()
+        text = self.read()
+        self.assertIn('    - z\n', text)
+        self.assertNotIn('# 端口说明', text)
+        # 其余 section 与其前后的注释保持原样
+        self.assertTrue(text.startswith('# 全局说明\na: !a\n'))
+        self.assertTrue(text.endswith(ORIGINAL[ORIGINAL.index('\n# 关于 b'):]))
+        self.assertEqual(self.A().hosts, ['x', 'y', 'z'])
+
+        # 替换后仍可原地修改该 section 及其后的 section
+        a.port = 1
+        a.save()
+        b = self.B()
+        b.name = 'wasp'
+        b.save()
+        self.assertEqual(self.read(), text.replace('port: 80 ', 'port: 1 ').replace('name: bee', 'name: wasp'))
+
+    def test_new_section_appended(self):
+        self.C()
+        self.assertEqual(self.read(), ORIGINAL + 'c: !c\n  value: 1\n')
+        c = self.C()
+        c.value = 2
+        c.save()
+        self.assertEqual(self.read(), ORIGINAL + 'c: !c\n  value: 2\n')
+
+    def test_anchor_falls_back_to_full_dump(self):
+        with open(self.location, 'a', encoding='utf-8') as f:
+            f.write('shared: &base\n  x: 1\nother: *base\n')
+        age_file(self.location)
+        b = self.B()
+        b.name = 'wasp'
+        b.save()
+        self.assertIsNone(yaml_agent_module.get_document(self.location).sections)
+        self.assertEqual(self.B().name, 'wasp')
+        self.assertIn('other: *base', self.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
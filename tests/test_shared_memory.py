@@ -0,0 +1,116 @@
+import json
+import multiprocessing
+import os
+import shutil
+import unittest
+from dataclasses import field
+from typing import List
+
+from conf_root import ConfRoot
+from conf_root.agents.SharedMemoryAgent import SharedConfig, SharedMemoryAgent
+from conf_root.run_http import EditorApp, dataclass_to_wtform
+
+
+def make_class(conf_root):
+    @conf_root.config('app')
+    class AppConfig:
+        port: int = 5432
+        hosts: List = field(default_factory=lambda: ['a', 'b'])
+
+    return AppConfig
+
+
+def worker(name, queue):
+    AppConfig = make_class(ConfRoot(agent_class=None))
+    AppConfig.__CONF_ROOT__.conf_root.attach(name)
+    conf = AppConfig()
+    queue.put((conf.port, conf.hosts))
+
+
+class TestSharedMemory(unittest.TestCase):
+    def setUp(self):
+        self.directory = 'shared_configs'
+        self.shared = None
+
+    def tearDown(self):
+        if self.shared is not None:
+            self.shared.close()
+            self.shared.unlink()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def publish(self):
+        conf_root = ConfRoot(self.directory)
+        AppConfig = make_class(conf_root)
+        with open(os.path.join(self.directory, 'app.yml'), 'w') as f:
+            f.write('port: 7000\nhosts: [c]\n')
+        self.shared = conf_root.publish([AppConfig])
+        return conf_root, AppConfig
+
+    def test_attach(self):
+        self.publish()
+        AppConfig = make_class(ConfRoot(agent_class=None))
+        AppConfig.__CONF_ROOT__.conf_root.attach(self.shared.name)
+        shutil.rmtree(self.directory)
+        conf = AppConfig()
+        self.assertEqual(conf.port, 7000)
+        self.assertEqual(conf.hosts, ['c'])
+
+    def test_editor(self):
+        # inner 为 None 的 SharedMemoryAgent 没有 cache 属性，编辑器每次都重新读取共享内存
+        conf_root, AppConfig = self.publish()
+        worker_class = make_class(ConfRoot(agent_class=None))
+        worker_class.__CONF_ROOT__.conf_root.attach(self.shared.name)
+        app = EditorApp({worker_class: dataclass_to_wtform(worker_class)})
+        response = app.handle('GET', '/api/AppConfig', {}, b'')
+        self.assertEqual(json.loads(response.body), {'port': 7000, 'hosts': ['c']})
+        with open(os.path.join(self.directory, 'app.yml'), 'w') as f:
+            f.write('port: 8000\nhosts: [d]\n')
+        conf_root.publish([AppConfig])
+        response = app.handle('GET', '/api/AppConfig', {}, b'')
+        self.assertEqual(json.loads(response.body), {'port': 8000, 'hosts': ['d']})
+
+    def test_instances_do_not_share_values(self):
+        self.publish()
+        AppConfig = make_class(ConfRoot(agent_class=None))
+        AppConfig.__CONF_ROOT__.conf_root.attach(self.shared.name)
+        conf = AppConfig()
+        conf.hosts.append('d')
+        self.assertEqual(AppConfig().hosts, ['c'])
+
+    def test_generation(self):
+        conf_root, AppConfig = self.publish()
+        generation = self.shared.generation
+        with open(os.path.join(self.directory, 'app.yml'), 'w') as f:
+            f.write('port: 8000\nhosts: [d]\n')
+        worker_class = make_class(ConfRoot(agent_class=None))
+        worker_class.__CONF_ROOT__.conf_root.attach(self.shared.name)
+        self.assertEqual(worker_class().port, 7000)
+        conf_root.publish([AppConfig])
+        self.assertGreater(self.shared.generation, generation)
+        self.assertEqual(worker_class().port, 8000)
+
+    def test_fallback_to_inner(self):
+        self.publish()
+        conf_root = ConfRoot(self.directory)
+        OtherConfig = conf_root.config('other')(type('OtherConfig', (), {'__annotations__': {'x': int}, 'x': 1}))
+        conf_root.attach(self.shared.name)
+        self.assertIsInstance(conf_root.agent, SharedMemoryAgent)
+        self.assertEqual(OtherConfig().x, 1)
+        self.assertTrue(os.path.exists(os.path.join(self.directory, 'other.yml')))
+
+    def test_capacity(self):
+        self.shared = SharedConfig.create({'a': 1}, size=64)
+        with self.assertRaises(ValueError):
+            self.shared.publish({'a': 'x' * 100})
+        self.assertEqual(self.shared.read()[1], {'a': 1})
+
+    @unittest.skipUnless('fork' in multiprocessing.get_all_start_methods(), 'requires fork')
+    def test_other_process(self):
+        self.publish()
+        context = multiprocessing.get_context('fork')
+        queue = context.Queue()
+        process = context.Process(target=worker, args=(self.shared.name, queue))
+        process.start()
+        self.assertEqual(queue.get(timeout=10), (7000, ['c']))
+        process.join(10)
+        self.assertEqual(process.exitcode, 0)
@@ -1,8 +1,10 @@
 import os
 import unittest
-from dataclasses import dataclass
+from dataclasses import dataclass, make_dataclass
+from unittest import mock
 
 from conf_root import ConfRoot, SingleFileYamlAgent
+from conf_root.agents.YamlAgent import YamlEngine
 from tests.utils import replace_text
 
 
@@ -73,3 +75,24 @@ class TestSingleFileYamlAgent(unittest.TestCase):
         conf2 = self.conf2()
         self.assertEqual(conf2.one_thing, 43)
         self.assertEqual(conf2.another_thing, 1024)
+
+    def test_parse_once(self):
+        conf_root = ConfRoot(self.location, agent_class=SingleFileYamlAgent)
+        classes = [conf_root.config(make_dataclass(f'Config{i}', [('value', int, i)])) for i in range(20)]
+        # 首次启动：逐个写入默认值
+        for cls in classes:
+            cls()
+        # 再次启动：全部从同一个文档中读取
+        with mock.patch.object(YamlEngine, 'load', autospec=True, side_effect=YamlEngine.load) as load:
+            instances = [cls() for cls in classes]
+        self.assertEqual([instance.value for instance in instances], list(range(20)))
+        self.assertLessEqual(load.call_count, 1)
+
+    def test_external_change(self):
+        self.conf2()
+        with open(self.location, 'r') as file:
+            content = file.read()
+        # 修改后的文件长度不同，同时也可能与上次写入处于同一个时间片内。
+        with open(self.location, 'w') as file:
+            file.write(content.replace('1024', '2048000'))
+        self.assertEqual(self.conf2().another_thing, 2048000)
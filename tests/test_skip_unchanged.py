@@ -0,0 +1,139 @@
+import os
+import shutil
+import unittest
+from dataclasses import field
+from typing import List
+from unittest import mock
+
+from conf_root import ConfRoot, YamlAgent, SingleFileYamlAgent
+from conf_root.agents import YamlAgent as yaml_agent_module
+from conf_root.agents.BasicAgent import SAVED_KEY
+from conf_root.agents.JsonAgent import JsonAgent
+from conf_root.cache import data_cache, FileStamp
+from tests.test_cache import age_file
+
+
+class TestSkipUnchanged(unittest.TestCase):
+    def setUp(self):
+        data_cache.invalidate()
+        self.directory = 'skip_unchanged_configs'
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        yaml_agent_module._documents.clear()
+
+    def make_class(self, agent_class=YamlAgent, path=None):
+        @ConfRoot(path or self.directory, agent_class=agent_class).config('app', dynamic=True)
+        class AppConfig:
+            port: int = 5432
+            hosts: List = field(default_factory=lambda: ['a', 'b'])
+
+        location = AppConfig.__CONF_ROOT__.conf_root.agent.get_configuration_location(AppConfig.__CONF_ROOT__)
+        return AppConfig, location
+
+    def assert_skips_unchanged(self, agent_class, path=None):
+        AppConfig, location = self.make_class(agent_class, path)
+        conf = AppConfig()
+        inode = os.stat(location).st_ino
+        conf.save()
+        AppConfig().save()
+        # 每次写入都会以新文件替换，inode 不变说明没有写入
+        self.assertEqual(os.stat(location).st_ino, inode)
+
+        conf.port = 7000
+        conf.save()
+        self.assertNotEqual(os.stat(location).st_ino, inode)
+        self.assertEqual(AppConfig().port, 7000)
+
+    def test_yaml(self):
+        self.assert_skips_unchanged(YamlAgent)
+
+    def test_json(self):
+        self.assert_skips_unchanged(JsonAgent)
+
+    def test_single_file(self):
+        self.assert_skips_unchanged(SingleFileYamlAgent, os.path.join(self.directory, 'settings.yml'))
+
+    def test_in_place_mutation(self):
+        AppConfig, location = self.make_class()
+        conf = AppConfig()
+        conf.save()
+        conf.hosts.append('c')
+        conf.save()
+        self.assertEqual(AppConfig().hosts, ['a', 'b', 'c'])
+
+    def test_clean_without_serializing(self):
+        AppConfig, location = self.make_class()
+        conf = AppConfig()
+        agent = AppConfig.__CONF_ROOT__.conf_root.agent
+        # 刚写入的文件指纹不可信，比较内容的摘要
+        self.assertFalse(vars(conf)[SAVED_KEY].trusted)
+        self.assertTrue(agent.is_clean(AppConfig.__CONF_ROOT__, conf))
+        with mock.patch.object(agent, 'commit') as commit:
+            conf.save()
+        commit.assert_not_called()
+
+        conf.port = 1
+        self.assertFalse(agent.is_clean(AppConfig.__CONF_ROOT__, conf))
+
+    def test_racy_file_changed_in_place(self):
+        AppConfig, location = self.make_class()
+        conf = AppConfig()
+        stat = os.stat(location)
+        # 指纹相同但内容不同的修改
+        with open(location, 'r+') as f:
+            content = f.read()
+            f.seek(0)
+            f.write(content.replace('5432', '5433'))
+        os.utime(location, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        conf.save()
+        self.assertEqual(AppConfig().port, 5432)
+
+    def test_trusted_after_racy_window(self):
+        AppConfig, location = self.make_class()
+        conf = AppConfig()
+        agent = AppConfig.__CONF_ROOT__.conf_root.agent
+        self.assertFalse(vars(conf)[SAVED_KEY].trusted)
+        age_file(location)
+        stamp = FileStamp.of(location)
+        vars(conf)[SAVED_KEY] = vars(conf)[SAVED_KEY]._replace(stamp=stamp)
+        self.assertTrue(agent.is_clean(AppConfig.__CONF_ROOT__, conf))
+        # 内容比较通过后重新记录，指纹已可信
+        self.assertTrue(vars(conf)[SAVED_KEY].trusted)
+        with mock.patch.object(agent, '_read_bytes') as read:
+            self.assertTrue(agent.is_clean(AppConfig.__CONF_ROOT__, conf))
+        read.assert_not_called()
+
+    def test_external_change_is_overwritten(self):
+        AppConfig, location = self.make_class()
+        conf = AppConfig()
+        age_file(location)
+        conf.save()
+        with open(location, 'w') as f:
+            f.write('port: 1\n')
+        age_file(location, 5)
+        conf.save()
+        self.assertEqual(AppConfig().port, 5432)
+
+    def test_loaded_file_missing_field(self):
+        AppConfig, location = self.make_class()
+        os.makedirs(self.directory, exist_ok=True)
+        with open(location, 'w') as f:
+            f.write('port: 80\n')
+        conf = AppConfig()
+        self.assertNotIn(SAVED_KEY, vars(conf))
+        conf.save()
+        with open(location) as f:
+            self.assertIn('hosts', f.read())
+
+    def test_disabled(self):
+        AppConfig, location = self.make_class()
+        AppConfig.__CONF_ROOT__.conf_root.agent.skip_unchanged = False
+        conf = AppConfig()
+        inode = os.stat(location).st_ino
+        conf.save()
+        self.assertNotEqual(os.stat(location).st_ino, inode)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import os
+import pickle
+import shutil
+import threading
+import unittest
+from dataclasses import field
+from typing import List
+from unittest import mock
+
+from conf_root import ConfRoot, YamlAgent, SingleFileYamlAgent
+from conf_root.agents import YamlAgent as yaml_agent_module
+from conf_root.agents.SnapshotAgent import with_snapshot
+from conf_root.cache import data_cache
+from tests.test_cache import age_file
+
+
+class TestSnapshotAgent(unittest.TestCase):
+    def setUp(self):
+        data_cache.invalidate()
+        self.directory = 'snapshot_configs'
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        yaml_agent_module._documents.clear()
+
+    def snapshots(self):
+        return os.listdir(os.path.join(self.directory, '__confcache__'))
+
+    def make_class(self, agent_class, path=None):
+        @ConfRoot(path or self.directory, agent_class=with_snapshot(agent_class)).config('app')
+        class AppConfig:
+            port: int = 5432
+            hosts: List = field(default_factory=lambda: ['a', 'b'])
+
+        return AppConfig
+
+    def assert_loads_without_parsing(self, AppConfig, location, content):
+        AppConfig()
+        with open(location, 'w') as f:
+            f.write(content)
+        age_file(location)
+        AppConfig()  # 解析并生成快照
+        self.assertEqual(len(self.snapshots()), 1)
+
+        # 模拟新进程：清空进程内缓存后不再解析源文件。
+        data_cache.invalidate()
+        yaml_agent_module._documents.clear()
+        with mock.patch.object(yaml_agent_module.YamlEngine, 'load', side_effect=AssertionError('should not parse')):
+            conf = AppConfig()
+        self.assertEqual(conf.port, 7000)
+        self.assertEqual(conf.hosts, ['a', 'b'])
+
+    def test_yaml_agent(self):
+        AppConfig = self.make_class(YamlAgent)
+        self.assert_loads_without_parsing(AppConfig, os.path.join(self.directory, 'app.yml'),
+                                          'port: 7000\nhosts: [a, b]\n')
+
+    def test_single_file_agent(self):
+        location = os.path.join(self.directory, 'config.yml')
+        AppConfig = self.make_class(SingleFileYamlAgent, location)
+        self.assert_loads_without_parsing(AppConfig, location, 'app:\n  port: 7000\n  hosts: [a, b]\n')
+
+    def test_source_change(self):
+        AppConfig = self.make_class(YamlAgent)
+        location = os.path.join(self.directory, 'app.yml')
+        AppConfig()
+        age_file(location)
+        AppConfig()
+        with open(location, 'w') as f:
+            f.write('port: 9000\nhosts: [c]\n')
+        age_file(location, 5)
+        data_cache.invalidate()
+        conf = AppConfig()
+        self.assertEqual(conf.port, 9000)
+        self.assertEqual(conf.hosts, ['c'])
+        # 旧快照被替换
+        self.assertEqual(len(self.snapshots()), 1)
+
+    def test_schema_change(self):
+        AppConfig = self.make_class(YamlAgent)
+        location = os.path.join(self.directory, 'app.yml')
+        AppConfig()
+        age_file(location)
+        AppConfig()
+        first = self.snapshots()
+
+        @ConfRoot(self.directory, agent_class=with_snapshot(YamlAgent)).config('app')
+        class AppConfig:
+            port: str = '5432'
+            hosts: List = field(default_factory=list)
+
+        AppConfig()
+        self.assertNotEqual(self.snapshots(), first)
+
+    def test_broken_snapshot(self):
+        AppConfig = self.make_class(YamlAgent)
+        location = os.path.join(self.directory, 'app.yml')
+        AppConfig()
+        age_file(location)
+        AppConfig()
+        snapshot = os.path.join(self.directory, '__confcache__', self.snapshots()[0])
+        with open(snapshot, 'wb') as f:
+            f.write(b'broken')
+        data_cache.invalidate()
+        self.assertEqual(AppConfig().port, 5432)
+
+    def test_recent_snapshot_per_thread(self):
+        # 其他线程的加载不会覆盖本线程 exist 时读取的快照
+        conf_root = ConfRoot(self.directory, agent_class=with_snapshot(YamlAgent))
+        classes = [conf_root.config(name)(type(name, (), {'__annotations__': {'port': int}, 'port': 1}))
+                   for name in ('first', 'second')]
+        for cls in classes:
+            cls()
+            age_file(os.path.join(self.directory, f'{cls.__CONF_ROOT__.name}.yml'))
+            cls()
+        agent = conf_root.agent
+        first, second = (cls.__CONF_ROOT__ for cls in classes)
+        origin_load = pickle.load
+        with mock.patch.object(pickle, 'load', side_effect=origin_load) as load:
+            self.assertTrue(agent.exist(first))
+            thread = threading.Thread(target=agent.exist, args=(second,))
+            thread.start()
+            thread.join()
+            self.assertEqual(agent.read(first), {'port': 1})
+        self.assertEqual(load.call_count, 2)
+
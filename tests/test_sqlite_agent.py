@@ -0,0 +1,113 @@
+import os
+import shutil
+import threading
+import unittest
+from dataclasses import field
+from typing import List
+
+from conf_root import ConfRoot, SqliteAgent
+
+
+class TestSqliteAgent(unittest.TestCase):
+    def setUp(self):
+        self.directory = 'sqlite_configs'
+        self.location = os.path.join(self.directory, 'configs.db')
+        self.conf_root = ConfRoot(self.location, agent_class=SqliteAgent)
+
+    def tearDown(self):
+        self.conf_root.agent.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def make_class(self, name, conf_root=None):
+        @(conf_root or self.conf_root).config(name, dynamic=True)
+        class TenantConfig:
+            port: int = 5432
+            hosts: List = field(default_factory=lambda: ['a', 'b'])
+
+        return TenantConfig
+
+    def test_create_and_load(self):
+        TenantConfig = self.make_class('tenant')
+        conf = TenantConfig()
+        self.assertTrue(os.path.exists(self.location))
+        conf.port = 7000
+        conf.hosts.append('c')
+        conf.save()
+
+        reopened = ConfRoot(self.location, agent_class=SqliteAgent)
+        try:
+            conf = self.make_class('tenant', reopened)()
+        finally:
+            reopened.agent.close()
+        self.assertEqual(conf.port, 7000)
+        self.assertEqual(conf.hosts, ['a', 'b', 'c'])
+
+    def test_wal(self):
+        self.make_class('tenant')()
+        mode = self.conf_root.agent.connection.execute('PRAGMA journal_mode').fetchone()[0]
+        self.assertEqual(mode.lower(), 'wal')
+
+    def test_bulk(self):
+        agent = self.conf_root.agent
+        classes = [self.make_class(f'tenant{i}') for i in range(1200)]
+        items = []
+        for i, cls in enumerate(classes):
+            # 不经过 __init__ 构造实例，在一个事务中批量保存
+            instance = cls.__new__(cls)
+            instance.port, instance.hosts = i, [str(i)]
+            items.append((cls.__CONF_ROOT__, instance))
+        agent.save_many(items)
+
+        loaded = [(cls.__CONF_ROOT__, cls.__new__(cls)) for cls in classes]
+        extra = self.make_class('missing')
+        loaded.append((extra.__CONF_ROOT__, extra.__new__(extra)))
+        missing = agent.load_many(loaded)
+        self.assertEqual([configuration.name for configuration, _ in missing], ['missing'])
+        self.assertEqual(loaded[1100][1].port, 1100)
+        self.assertEqual(loaded[1100][1].hosts, ['1100'])
+
+    def test_batch_rollback(self):
+        TenantConfig = self.make_class('tenant')
+        conf = TenantConfig()
+        conf.port = 1
+        with self.assertRaises(RuntimeError):
+            with self.conf_root.batch():
+                conf.save()
+                raise RuntimeError()
+        self.assertEqual(TenantConfig().port, 5432)
+
+    def test_threads(self):
+        classes = [self.make_class(f'tenant{i}') for i in range(8)]
+        errors = []
+
+        used = set()
+
+        def run(cls):
+            try:
+                used.add(id(self.conf_root.agent.connection))
+                for _ in range(20):
+                    conf = cls()
+                    conf.port += 1
+                    conf.save()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=(cls,)) for cls in classes]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertGreaterEqual(len(used), 2)
+        # 线程结束后其连接被关闭
+        self.assertEqual(len(self.conf_root.agent._connections), 0)
+        self.assertEqual([cls().port for cls in classes], [5452] * 8)
+
+    def test_load_all_reuses_connections(self):
+        for i in range(20):
+            self.make_class(f'tenant{i}')
+        self.conf_root.load_all(max_workers=4)
+        count = len(self.conf_root.agent._connections)
+        for _ in range(5):
+            self.conf_root.load_all(max_workers=4)
+        self.assertLessEqual(len(self.conf_root.agent._connections), count)
@@ -0,0 +1,130 @@
+import gc
+import os
+import shutil
+import threading
+import unittest
+from dataclasses import field
+from typing import List
+
+from conf_root import ConfRoot, SingleFileYamlAgent
+from conf_root.agents.YamlAgent import YamlEngine
+from conf_root.watcher import Watcher, Inotify
+
+
+class TestWatcher(unittest.TestCase):
+    def setUp(self):
+        self.directory = 'watched_configs'
+        self.watchers = []
+
+    def tearDown(self):
+        for watcher in self.watchers:
+            watcher.stop()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def make_watcher(self, **kwargs):
+        watcher = Watcher(interval=0.05, **kwargs)
+        self.watchers.append(watcher)
+        return watcher
+
+    def make_class(self, agent_class=None, path=None):
+        kwargs = {} if agent_class is None else {'agent_class': agent_class}
+
+        @ConfRoot(path or self.directory, **kwargs).config('app')
+        class AppConfig:
+            rate_limit: int = 10
+            hosts: List = field(default_factory=lambda: ['a'])
+
+        return AppConfig
+
+    def write(self, name, content):
+        with open(os.path.join(self.directory, name), 'w') as f:
+            f.write(content)
+
+    def assert_hot_reload(self, watcher):
+        AppConfig = self.make_class()
+        conf = AppConfig()
+        changed = threading.Event()
+        received = []
+
+        def callback(instance, changes):
+            received.append((instance, changes))
+            changed.set()
+
+        watcher.watch(conf, callback)
+        self.write('app.yml', 'rate_limit: 20\nhosts: [a]\n')
+        self.assertTrue(changed.wait(5))
+        self.assertEqual(conf.rate_limit, 20)
+        self.assertEqual(received, [(conf, {'rate_limit': (10, 20)})])
+
+    def test_polling(self):
+        watcher = self.make_watcher(use_inotify=False)
+        self.assert_hot_reload(watcher)
+        self.assertEqual(watcher.backend, 'polling')
+
+    def test_inotify(self):
+        try:
+            Inotify().close()
+        except OSError:
+            self.skipTest('inotify is not available')
+        watcher = self.make_watcher()
+        self.assert_hot_reload(watcher)
+        self.assertEqual(watcher.backend, 'inotify')
+
+    def test_no_callback_without_change(self):
+        watcher = self.make_watcher(use_inotify=False)
+        AppConfig = self.make_class()
+        conf = AppConfig()
+        received = []
+        watcher.watch(conf, lambda instance, changes: received.append(changes))
+        watcher.stop()
+        # 重写相同的内容
+        self.write('app.yml', 'rate_limit: 10\nhosts: [a]\n')
+        watcher.check()
+        self.assertEqual(received, [])
+
+    def test_parse_once(self):
+        watcher = self.make_watcher(use_inotify=False)
+        location = os.path.join(self.directory, 'config.yml')
+        AppConfig = self.make_class(SingleFileYamlAgent, location)
+        instances = [AppConfig() for _ in range(3)]
+        for instance in instances:
+            watcher.watch(instance)
+        watcher.stop()
+        self.write('config.yml', 'app:\n  rate_limit: 30\n  hosts: [b]\n')
+        calls = []
+        origin_load = YamlEngine.load
+
+        def load(engine, text):
+            calls.append(text)
+            return origin_load(engine, text)
+
+        YamlEngine.load = load
+        try:
+            watcher.check()
+        finally:
+            YamlEngine.load = origin_load
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([(i.rate_limit, i.hosts) for i in instances], [(30, ['b'])] * 3)
+
+    def test_invalid_change_ignored(self):
+        watcher = self.make_watcher(use_inotify=False)
+
+        @ConfRoot(self.directory).config('validated')
+        class ValidatedConfig:
+            rate_limit: int = field(default=10, metadata={'validators': [lambda x: x > 0]})
+
+        conf = ValidatedConfig()
+        watcher.watch(conf)
+        watcher.stop()
+        self.write('validated.yml', 'rate_limit: -1\n')
+        watcher.check()
+        self.assertEqual(conf.rate_limit, 10)
+
+    def test_weakref(self):
+        watcher = self.make_watcher(use_inotify=False)
+        AppConfig = self.make_class()
+        conf = AppConfig()
+        watcher.watch(conf)
+        del conf
+        gc.collect()
+        self.assertEqual(watcher._watches, {})
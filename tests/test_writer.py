@@ -0,0 +1,129 @@
+import os
+import shutil
+import stat
+import unittest
+from unittest import mock
+
+from conf_root import ConfRoot, YamlAgent
+from conf_root.writer import atomic_write
+
+
+class TestAtomicWrite(unittest.TestCase):
+    location = 'atomic.txt'
+
+    def tearDown(self):
+        try:
+            os.remove(self.location)
+        except FileNotFoundError:
+            pass
+
+    def test_replace_keeps_mode(self):
+        atomic_write(self.location, 'old')
+        os.chmod(self.location, 0o640)
+        atomic_write(self.location, 'new')
+        with open(self.location) as f:
+            self.assertEqual(f.read(), 'new')
+        self.assertEqual(stat.S_IMODE(os.stat(self.location).st_mode), 0o640)
+
+    def test_failure_keeps_original(self):
+        atomic_write(self.location, 'old')
+        with mock.patch('conf_root.writer.os.replace', side_effect=OSError('crash')):
+            with self.assertRaises(OSError):
+                atomic_write(self.location, 'new')
+        with open(self.location) as f:
+            self.assertEqual(f.read(), 'old')
+        # 不残留临时文件
+        self.assertEqual([name for name in os.listdir('.') if name.endswith('.tmp')], [])
+
+    @unittest.skipUnless(hasattr(os, 'symlink'), 'requires symlink')
+    def test_symlink(self):
+        directory, target_directory = 'symlink_configs', 'symlink_target'
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.addCleanup(shutil.rmtree, target_directory, ignore_errors=True)
+        os.makedirs(directory)
+        os.makedirs(target_directory)
+        target = os.path.join(target_directory, 'app.yml')
+        with open(target, 'w') as f:
+            f.write('port: 1\n')
+        link = os.path.join(directory, 'app.yml')
+        os.symlink(os.path.abspath(target), link)
+
+        @ConfRoot(directory).config('app', dynamic=True)
+        class AppConfig:
+            port: int = 5432
+
+        conf = AppConfig()
+        conf.port = 7000
+        conf.save()
+        self.assertTrue(os.path.islink(link))
+        with open(target) as f:
+            self.assertIn('port: 7000', f.read())
+        self.assertEqual(os.listdir(directory), ['app.yml'])
+
+    def test_fsync_policy(self):
+        with mock.patch('conf_root.writer.os.fsync') as fsync:
+            atomic_write(self.location, 'none')
+            self.assertEqual(fsync.call_count, 0)
+            atomic_write(self.location, 'file', fsync='file')
+            self.assertEqual(fsync.call_count, 1)
+            atomic_write(self.location, 'full', fsync='full')
+            self.assertEqual(fsync.call_count, 3)
+        with self.assertRaises(ValueError):
+            atomic_write(self.location, 'x', fsync='sometimes')
+
+
+class TestWriteBehind(unittest.TestCase):
+    location = 'write_behind.yml'
+
+    def tearDown(self):
+        try:
+            os.remove(self.location)
+        except FileNotFoundError:
+            pass
+
+    def make_class(self, delay=0.0):
+        conf_root = ConfRoot(write_behind=True)
+        conf_root.agent.writer.delay = delay
+
+        @conf_root.config(self.location, dynamic=True)
+        class AppConfig:
+            port: int = 5432
+
+        return conf_root, AppConfig
+
+    def test_flush(self):
+        conf_root, AppConfig = self.make_class()
+        app_config = AppConfig()
+        conf_root.flush()
+        self.assertTrue(os.path.exists(self.location))
+        app_config.port = 1234
+        app_config.save()
+        conf_root.flush()
+        with open(self.location) as f:
+            self.assertIn('1234', f.read())
+
+    def test_coalesce(self):
+        conf_root, AppConfig = self.make_class(delay=60)
+        app_config = AppConfig()
+        with mock.patch.object(YamlAgent, 'write', autospec=True, side_effect=YamlAgent.write) as write:
+            for port in range(10):
+                app_config.port = port
+                app_config.save()
+            self.assertFalse(conf_root.wait(timeout=0.05))
+            self.assertTrue(conf_root.flush())
+        self.assertEqual(write.call_count, 1)
+        with open(self.location) as f:
+            self.assertIn('port: 9', f.read())
+
+    def test_error_reported(self):
+        conf_root, AppConfig = self.make_class()
+        with mock.patch.object(YamlAgent, 'write', side_effect=OSError('disk full')):
+            AppConfig()
+            with self.assertRaises(OSError):
+                conf_root.flush()
+        # 错误只报告一次
+        self.assertTrue(conf_root.flush())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import enum
+import unittest
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from wtforms import StringField
+
+from conf_root import ConfRoot
+from conf_root.run_http import dataclass_to_wtform, parse_form_data, register_field_type, FIELD_TYPES, \
+    clear_form_cache
+
+
+class Color(enum.Enum):
+    RED = 1
+    GREEN = 2
+
+
+@dataclass
+class Point:
+    x: int = 0
+    y: int = 0
+
+
+@ConfRoot(agent_class=None).config
+class Sub:
+    value: int = 1
+
+
+@ConfRoot(agent_class=None).config
+class Typed:
+    name: str = 'demo'
+    hosts: List[str] = field(default_factory=lambda: ['a'])
+    ports: List[int] = field(default_factory=lambda: [1, 2])
+    timeout: Optional[int] = None
+    color: Color = Color.RED
+    point: Point = field(default_factory=Point)
+    first: Sub = field(default_factory=Sub)
+    second: Sub = field(default_factory=Sub)
+    flag: bool = False
+
+
+class TestWtform(unittest.TestCase):
+    def test_memoized(self):
+        form_class = dataclass_to_wtform(Typed)
+        self.assertIs(dataclass_to_wtform(Typed), form_class)
+        # 嵌套的类只生成一次
+        sub_form = dataclass_to_wtform(Sub)
+        self.assertIs(form_class.first.args[0], sub_form)
+        self.assertIs(form_class.second.args[0], sub_form)
+
+    def test_render(self):
+        form = dataclass_to_wtform(Typed)(obj=Typed())
+        self.assertEqual(form.hosts._value(), '["a"]')
+        self.assertIn('RED', form.color())
+        self.assertEqual(form.point.x.data, 0)
+
+    def test_submit(self):
+        body = ('name=x&hosts=["b", "c"]&ports=["3"]&timeout=&color=GREEN&point.x=5&point.y=6'
+                '&first.value=7&second.value=8').encode('utf-8')
+        form = dataclass_to_wtform(Typed)(formdata=parse_form_data(body))
+        self.assertTrue(form.validate(), form.errors)
+        data = form.data
+        self.assertEqual(data['hosts'], ['b', 'c'])
+        self.assertEqual(data['ports'], [3])
+        self.assertIsNone(data['timeout'])
+        self.assertIs(data['color'], Color.GREEN)
+        self.assertEqual(data['point'], Point(5, 6))
+        self.assertEqual(data['first'], {'value': 7})
+        self.assertFalse(data['flag'])
+
+    def test_invalid_list(self):
+        form = dataclass_to_wtform(Typed)(formdata=parse_form_data(b'name=x&hosts=oops&first.value=1&second.value=1'))
+        self.assertFalse(form.validate())
+        self.assertIn('hosts', form.errors)
+
+    def test_register(self):
+        class Secret:
+            pass
+
+        @dataclass
+        class WithSecret:
+            token: Secret = None
+
+        self.assertTrue(hasattr(dataclass_to_wtform(WithSecret), '_token'))
+        register_field_type(Secret, lambda f, t, v: StringField(f.name, default=f.default))
+        self.addCleanup(FIELD_TYPES.pop, Secret)
+        self.addCleanup(clear_form_cache)
+        clear_form_cache()
+        self.assertTrue(hasattr(dataclass_to_wtform(WithSecret), 'token'))
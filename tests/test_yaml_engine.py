@@ -0,0 +1,99 @@
+import os
+import threading
+import unittest
+from dataclasses import field
+
+from conf_root import ConfRoot
+from conf_root.agents.YamlAgent import get_engine
+
+
+class TestYamlEngine(unittest.TestCase):
+    def __init__(self, methodName="runTest"):
+        super().__init__(methodName)
+        self.location = 'engine_config.yml'
+
+    def tearDown(self):
+        try:
+            os.remove(self.location)
+        except FileNotFoundError:
+            pass
+
+    def test_engine_reused(self):
+        @ConfRoot().config(self.location, dynamic=True)
+        class AppConfig:
+            port: int = 5432
+
+        configuration = AppConfig.__CONF_ROOT__
+        engine = get_engine(configuration)
+        app_config = AppConfig()
+        app_config.save()
+        app_config.load()
+        self.assertIs(get_engine(configuration), engine)
+
+    def test_engine_rebuilt_when_classes_change(self):
+        @ConfRoot(agent_class=None).config
+        class Nested1:
+            name: str = 'nested1'
+
+        @ConfRoot(agent_class=None).config
+        class Nested2:
+            name: str = 'nested2'
+
+        @ConfRoot().config(self.location)
+        class AppConfig:
+            nested: Nested1 = field(default_factory=Nested1)
+
+        configuration = AppConfig.__CONF_ROOT__
+        engine = get_engine(configuration)
+        AppConfig.__dataclass_fields__['nested'].type = Nested2
+        configuration.refresh_schema()
+        new_engine = get_engine(configuration)
+        self.assertIsNot(new_engine, engine)
+        self.assertIn(Nested2, new_engine.classes)
+
+    def test_same_tag_in_different_configurations(self):
+        # 同名的配置类各自使用自己的构造器，而不是相互覆盖。
+        def make_class(deserialize):
+            @ConfRoot().config(self.location, dynamic=True)
+            class AppConfig:
+                name: str = field(default='abc', metadata={'deserialize': deserialize})
+
+            return AppConfig
+
+        AppConfig1 = make_class(lambda x: 'first')
+        AppConfig2 = make_class(lambda x: 'second')
+        AppConfig1()
+        app_config2 = AppConfig2()
+        app_config1 = AppConfig1()
+        self.assertEqual(app_config1.name, 'first')
+        app_config2.load()
+        self.assertEqual(app_config2.name, 'second')
+
+    def test_concurrent_load(self):
+        @ConfRoot().config(self.location, dynamic=True)
+        class AppConfig:
+            port: int = 5432
+            hosts: list = field(default_factory=lambda: ['a', 'b', 'c'])
+
+        AppConfig()
+        errors = []
+
+        def work():
+            try:
+                for _ in range(20):
+                    app_config = AppConfig()
+                    app_config.load()
+                    self.assertEqual(app_config.port, 5432)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+
+if __name__ == '__main__':
+    unittest.main()